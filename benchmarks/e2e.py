@@ -0,0 +1,320 @@
+"""End-to-end handler throughput benchmark.
+
+Drives a real Application with the register_common_handlers set through a fake
+Bot API transport, replaying a synthetic mix of /subscribe, /status, a rate
+limited /action, support conversations and successful payments at a fixed
+concurrency. Reports updates per second, p50/p95/p99 latency and Mongo
+operations and Bot API calls per update, and stores the results as JSON.
+
+Usage:
+    python benchmarks/e2e.py --updates 5000 --concurrency 32
+    python benchmarks/e2e.py --backend mongo --mongo-uri mongodb://localhost:27017
+
+The memory backend (MemoryMongoClient from tests/memory_mongo.py) implements the
+Mongo operations the handlers use in process; --db-latency-ms adds a simulated
+round trip to each command. Both backends count the commands reported to a
+command listener. The mongo backend writes to the *_test collections of the
+bench_bot, bench_subscriptions and bench_logs databases, with user ids unique
+to the run.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import tomllib
+from contextvars import ContextVar
+from datetime import datetime
+from itertools import count
+from pathlib import Path
+from statistics import quantiles
+from time import perf_counter, time
+from pymongo import monitoring
+
+ROOT = Path(__file__).resolve().parent.parent
+# The in-memory Mongo lives with the tests
+sys.path.insert(0, str(ROOT / "tests"))
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+BOT_NAME = "BenchBot"
+BOT_DB_NAME = "bench_bot"
+
+# Relative weights of the scenarios in the replayed mix
+SCENARIO_WEIGHTS = {"subscribe": 2, "status": 3, "action": 3, "support": 1, "payment": 1}
+
+# Label the Mongo commands and Bot API calls are counted under, set per replayed update
+current_label: ContextVar[str] = ContextVar("current_label", default="background")
+
+
+class CountingListener(monitoring.CommandListener):
+    """Counts the Mongo commands started per current_label."""
+
+    def __init__(self):
+        self.ops = {}
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        label = current_label.get()
+        self.ops[label] = self.ops.get(label, 0) + 1
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        pass
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        pass
+
+
+def parse_args(argv: list | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--backend", choices=("memory", "mongo"), default="memory")
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--db-latency-ms", type=float, default=0.0, help="Simulated round trip of the memory backend")
+    parser.add_argument("--updates", type=int, default=2000, help="Scenarios to replay; support ones send two updates")
+    parser.add_argument("--warmup", type=int, default=100, help="Scenarios replayed before measuring")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--log-level", default="WARNING", help="Handler logging slows the run down at INFO")
+    parser.add_argument("--output", help="Results file, default benchmarks/results/e2e-<version>-<timestamp>.json")
+    return parser.parse_args(argv)
+
+
+def get_version() -> str:
+    with open(ROOT / "pyproject.toml", "rb") as f:
+        return tomllib.load(f)["tool"]["poetry"]["version"]
+
+
+def configure_environment(args: argparse.Namespace) -> str:
+    """Point the library at the benchmark databases; must run before importing it."""
+    uri = args.mongo_uri if args.backend == "mongo" else "memory://bench"
+    os.environ["MONGO_URI"] = uri
+    os.environ["SUBSCRIPTION_DB_NAME"] = "bench_subscriptions"
+    os.environ["LOGS_DB_NAME"] = "bench_logs"
+    # Keeps the shared support database on its *_test collection
+    os.environ["DEBUG"] = "true"
+    return uri
+
+
+def create_client(args: argparse.Namespace):
+    """Backend client counting commands per current_label in client.ops."""
+    listener = CountingListener()
+    if args.backend == "memory":
+        from memory_mongo import MemoryMongoClient
+
+        client = MemoryMongoClient(event_listeners=[listener], latency=args.db_latency_ms / 1000)
+    else:
+        from pymongo import MongoClient
+        from pymongo.server_api import ServerApi
+
+        client = MongoClient(args.mongo_uri, server_api=ServerApi("1"), event_listeners=[listener])
+    client.ops = listener.ops
+    return client
+
+
+def _user(user_id: int) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": f"User {user_id}", "language_code": "en"}
+
+
+def _message(user_id: int, **fields) -> dict:
+    return {
+        "date": int(time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": _user(user_id),
+        **fields,
+    }
+
+
+def _command(user_id: int, command: str) -> dict:
+    return _message(
+        user_id, text=command, entities=[{"type": "bot_command", "offset": 0, "length": len(command)}]
+    )
+
+
+def build_workload(
+    args: argparse.Namespace, scenarios: int, first_user_id: int, rng: random.Random, update_ids: count
+) -> list:
+    """Scenarios as lists of (label, update data), replayed in order by one worker."""
+    workload = []
+    for name in rng.choices(list(SCENARIO_WEIGHTS), list(SCENARIO_WEIGHTS.values()), k=scenarios):
+        user_id = first_user_id + rng.randrange(args.users)
+        if name == "support":
+            messages = [
+                ("support_command", _command(user_id, "/support")),
+                ("support_message", _message(user_id, text="The bot does not answer")),
+            ]
+        elif name == "payment":
+            charge_id = f"bench-{first_user_id}-{rng.getrandbits(64):x}"
+            payment = {
+                "currency": "XTR",
+                "total_amount": 100,
+                "invoice_payload": "1month_sub",
+                "telegram_payment_charge_id": charge_id,
+                "provider_payment_charge_id": charge_id,
+            }
+            messages = [("payment", _message(user_id, successful_payment=payment))]
+        else:
+            messages = [(name, _command(user_id, f"/{name}"))]
+        workload.append([
+            (label, {"update_id": update_id, "message": {"message_id": update_id, **message}})
+            for (label, message), update_id in zip(messages, update_ids)
+        ])
+    return workload
+
+
+def build_application(uri: str, client):
+    """Application with the common handlers and a rate limited /action command."""
+    from telegram_libs import mongo
+
+    # Seeded before the handlers are imported, as the support module creates its manager on import
+    mongo._mongo_clients[uri] = client
+
+    from telegram.ext import Application, CommandHandler, filters
+    from telegram_libs.handlers import register_common_handlers
+    from telegram_libs.testing import FakeTelegramRequest
+    from telegram_libs.utils import RateLimitManager
+
+    class CountingRequest(FakeTelegramRequest):
+        """Fake transport counting Bot API calls per current_label instead of recording them."""
+
+        def __init__(self):
+            super().__init__()
+            self.counts = {}
+
+        async def do_request(self, url: str, method: str, request_data=None, *args, **kwargs):
+            code, payload = await super().do_request(url, method, request_data, *args, **kwargs)
+            self.calls.clear()
+            label = current_label.get()
+            self.counts[label] = self.counts.get(label, 0) + 1
+            return code, payload
+
+    async def action_command(update, context) -> None:
+        await update.message.reply_text("Done")
+
+    async def count_error(update, context) -> None:
+        context.bot_data["errors"] = context.bot_data.get("errors", 0) + 1
+
+    request = CountingRequest()
+    app = Application.builder().token("1:bench").request(request).get_updates_request(FakeTelegramRequest()).build()
+    mongo_manager = mongo.MongoManager(mongo_database_name=BOT_DB_NAME)
+    register_common_handlers(
+        app,
+        BOT_NAME,
+        mongo_manager,
+        rate_limit_manager=RateLimitManager(mongo_manager),
+        rate_limit_filter=filters.Regex(r"^/action"),
+    )
+    app.add_handler(CommandHandler("action", action_command))
+    app.add_error_handler(count_error)
+    return app, request
+
+
+async def replay(app, workload: list, concurrency: int, latencies: dict) -> None:
+    """Process the workload with `concurrency` workers, appending seconds per update to latencies."""
+    from telegram import Update
+
+    queue = asyncio.Queue()
+    for sequence in workload:
+        queue.put_nowait(sequence)
+
+    async def worker() -> None:
+        while not queue.empty():
+            for label, data in queue.get_nowait():
+                update = Update.de_json(data, app.bot)
+                token = current_label.set(label)
+                started = perf_counter()
+                try:
+                    await app.process_update(update)
+                finally:
+                    latencies.setdefault(label, []).append(perf_counter() - started)
+                    current_label.reset(token)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+def summarize(latencies: list, db_ops: int, bot_calls: int) -> dict:
+    updates = len(latencies)
+    durations = sorted(latency * 1000 for latency in latencies)
+    cuts = quantiles(durations, n=100, method="inclusive") if updates > 1 else durations * 99
+    return {
+        "count": updates,
+        "p50_ms": cuts[49],
+        "p95_ms": cuts[94],
+        "p99_ms": cuts[98],
+        "db_ops_per_update": db_ops / updates,
+        "bot_calls_per_update": bot_calls / updates,
+    }
+
+
+async def run(args: argparse.Namespace) -> dict:
+    uri = configure_environment(args)
+    client = create_client(args)
+    app, request = build_application(uri, client)
+    # After the import, as telegram_libs.utils configures the root logger
+    logging.getLogger().setLevel(args.log_level)
+    rng = random.Random(args.seed)
+    # Fresh users per run, so runs against a persistent mongod do not share rate limits
+    first_user_id = int(time()) * 1000
+    update_ids = count(1)
+    warmup = build_workload(args, args.warmup, first_user_id, rng, update_ids)
+    workload = build_workload(args, args.updates, first_user_id, rng, update_ids)
+
+    async with app:
+        await replay(app, warmup, args.concurrency, {})
+        client.ops.clear()
+        request.counts.clear()
+        app.bot_data.clear()
+        latencies = {}
+        started = perf_counter()
+        await replay(app, workload, args.concurrency, latencies)
+        duration = perf_counter() - started
+
+    scenarios = {
+        label: summarize(values, client.ops.get(label, 0), request.counts.get(label, 0))
+        for label, values in sorted(latencies.items())
+    }
+    updates = sum(scenario["count"] for scenario in scenarios.values())
+    return {
+        "benchmark": "e2e",
+        "version": get_version(),
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "backend": args.backend,
+        "db_latency_ms": args.db_latency_ms if args.backend == "memory" else None,
+        "concurrency": args.concurrency,
+        "users": args.users,
+        "updates": updates,
+        "errors": app.bot_data.get("errors", 0),
+        "duration_seconds": duration,
+        "updates_per_second": updates / duration,
+        "total": summarize(
+            [value for values in latencies.values() for value in values],
+            sum(client.ops.get(label, 0) for label in latencies),
+            sum(request.counts.get(label, 0) for label in latencies),
+        ),
+        "scenarios": scenarios,
+    }
+
+
+def main(argv: list | None = None) -> dict:
+    args = parse_args(argv)
+    results = asyncio.run(run(args))
+    output = Path(args.output) if args.output else RESULTS_DIR / (
+        f"e2e-{results['version']}-{datetime.now().strftime('%Y%m%dT%H%M%S')}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+
+    print(f"{results['updates']} updates, {results['updates_per_second']:.0f}/s, {results['errors']} errors")
+    print(f"{'scenario':<18}{'count':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'db ops':>8}{'bot calls':>11}")
+    for label, scenario in {**results["scenarios"], "total": results["total"]}.items():
+        print(
+            f"{label:<18}{scenario['count']:>7}{scenario['p50_ms']:>9.2f}{scenario['p95_ms']:>9.2f}"
+            f"{scenario['p99_ms']:>9.2f}{scenario['db_ops_per_update']:>8.2f}{scenario['bot_calls_per_update']:>11.2f}"
+        )
+    print(f"Results written to {output}")
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""Microbenchmarks of the pure-CPU hot paths.
+
+Each case is timed in `repeat` runs of as many calls as take at least
+`min_time` seconds; the minimum, median and standard deviation of the time per
+call over the runs are reported. Comparisons use the minimum, the run least
+disturbed by other processes, as the timeit documentation recommends. Mongo collections are replaced by stubs
+returning fixed documents, so only the Python work in the library is measured.
+
+Usage:
+    python benchmarks/micro.py                                   # run and print
+    python benchmarks/micro.py --save benchmarks/baselines/micro.json
+    python benchmarks/micro.py --compare benchmarks/baselines/micro.json --threshold 0.2
+
+In compare mode the exit status is 1 when a case is more than `threshold`
+slower than in the baseline. Baselines are machine specific, so
+record one on the machine that runs the comparison.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tomllib
+from datetime import datetime, timedelta
+from pathlib import Path
+from statistics import median, stdev
+from timeit import Timer
+from types import SimpleNamespace
+
+ROOT = Path(__file__).resolve().parent.parent
+# The in-memory Mongo lives with the tests
+sys.path.insert(0, str(ROOT / "tests"))
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baselines" / "micro.json"
+
+os.environ.setdefault("MONGO_URI", "memory://bench")
+
+
+def parse_args(argv: list | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=7, help="Timed runs per case")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Minimum seconds per run")
+    parser.add_argument("--filter", default="", help="Only run cases whose name contains this")
+    parser.add_argument("--save", help="Write the results to this JSON file")
+    parser.add_argument("--compare", nargs="?", const=str(DEFAULT_BASELINE), help="Baseline JSON to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed slowdown, 0.2 = 20%%")
+    return parser.parse_args(argv)
+
+
+def get_version() -> str:
+    with open(ROOT / "pyproject.toml", "rb") as f:
+        return tomllib.load(f)["tool"]["poetry"]["version"]
+
+
+def _run_coroutine(coroutine):
+    """Run a coroutine that never suspends, without an event loop."""
+    try:
+        coroutine.send(None)
+    except StopIteration as e:
+        return e.value
+    raise RuntimeError("Coroutine suspended")
+
+
+def build_cases() -> dict:
+    """Benchmark name -> zero-argument callable."""
+    from telegram_libs import mongo
+    from telegram_libs.mongo import MongoManager
+    from memory_mongo import MemoryMongoClient
+
+    # No connection is made: BotLogger's manager gets the in-memory client
+    mongo._mongo_clients.setdefault(mongo.MONGO_URI, MemoryMongoClient())
+
+    from telegram_libs.logger import BotLogger
+    from telegram_libs.translation import t
+    from telegram_libs.utils import RateLimitManager, get_subscription_keyboard, get_subscription_markup
+
+    async def reply_text(text, **kwargs):
+        return None
+
+    user = SimpleNamespace(id=42, username="user", first_name="First", last_name="Last", language_code="en")
+    update = SimpleNamespace(effective_user=user, message=SimpleNamespace(reply_text=reply_text))
+    user_document = {"_id": 1, "user_id": 42, "language": "en", "actions_today": 2, "last_action_date": None}
+
+    manager = MongoManager(mongo_database_name="bench", client=MemoryMongoClient())
+    manager.users_collection = SimpleNamespace(find_one=lambda query, *args, **kwargs: user_document)
+    subscription = {"_id": 1}
+    manager.subscription_collection = SimpleNamespace(find_one=lambda query, *args, **kwargs: subscription)
+
+    rate_limit_manager = RateLimitManager(manager)
+    today_user = {**user_document, "last_action_date": datetime.now().isoformat()}
+    yesterday_user = {**user_document, "last_action_date": (datetime.now() - timedelta(days=1)).isoformat()}
+    manager.update_user_data = lambda user_id, updates: None
+
+    bot_logger = BotLogger()
+    bot_logger.logs_collection = SimpleNamespace(insert_one=lambda entry: None)
+
+    return {
+        "translation.t.hit": lambda: t("subscription.choose_plan", "en", common=True),
+        "translation.t.miss": lambda: t("subscription.missing", "en", common=True),
+        "translation.t.fallback": lambda: t("subscription.choose_plan", "xx", common=True),
+        "translation.t.kwargs": lambda: t("subscription.expiry_reminder", "en", common=True, days=3),
+        "utils.get_subscription_keyboard": lambda: _run_coroutine(get_subscription_keyboard(update, "en")),
+        "utils.get_subscription_markup.uncached": lambda: get_subscription_markup.__wrapped__("en"),
+        "mongo.get_user_info": lambda: manager.get_user_info(update),
+        "mongo.check_subscription_status": lambda: manager.check_subscription_status(42),
+        "utils.check_limit.same_day": lambda: rate_limit_manager.check_limit(42, dict(today_user)),
+        "utils.check_limit.new_day": lambda: rate_limit_manager.check_limit(42, dict(yesterday_user)),
+        "logger.log_action": lambda: bot_logger.log_action(42, "subscribe_command", "BenchBot", {"plan": "1month"}),
+    }
+
+
+def measure(function, repeat: int, min_time: float) -> dict:
+    """Time a callable; statistics are in nanoseconds per call."""
+    timer = Timer(function)
+    number, _ = timer.autorange()
+    # Scale autorange's 0.2s calibration to min_time
+    number = max(1, int(number * min_time / 0.2))
+    timings = [elapsed / number * 1e9 for elapsed in timer.repeat(repeat=repeat, number=number)]
+    return {
+        "median_ns": median(timings),
+        "min_ns": min(timings),
+        "stdev_ns": stdev(timings) if len(timings) > 1 else 0.0,
+        "repeat": repeat,
+        "number": number,
+    }
+
+
+def run(args: argparse.Namespace) -> dict:
+    cases = {name: function for name, function in build_cases().items() if args.filter in name}
+    return {
+        "benchmark": "micro",
+        "version": get_version(),
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": {name: measure(function, args.repeat, args.min_time) for name, function in cases.items()},
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Cases slower than the baseline by more than threshold, as (name, ratio) pairs."""
+    regressions = []
+    for name, current in results["results"].items():
+        previous = baseline["results"].get(name)
+        if previous is None:
+            continue
+        ratio = current["min_ns"] / previous["min_ns"]
+        if ratio > 1 + threshold:
+            regressions.append((name, ratio))
+    return regressions
+
+
+def main(argv: list | None = None) -> int:
+    args = parse_args(argv)
+    results = run(args)
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    print(f"{'case':<40}{'min':>12}{'median':>12}{'stdev':>10}{'vs baseline':>13}")
+    for name, result in results["results"].items():
+        line = f"{name:<40}{result['min_ns']:>10.0f}ns{result['median_ns']:>10.0f}ns{result['stdev_ns']:>8.0f}ns"
+        previous = baseline["results"].get(name) if baseline else None
+        if previous:
+            line += f"{result['min_ns'] / previous['min_ns'] - 1:>+12.1%}"
+        print(line)
+
+    if args.save:
+        path = Path(args.save)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+        print(f"Results written to {path}")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        for name, ratio in regressions:
+            print(f"REGRESSION {name}: {ratio - 1:+.1%} (threshold {args.threshold:.0%})")
+        if regressions:
+            return 1
+        print(f"No regressions above {args.threshold:.0%} against {args.compare} ({baseline['version']})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+import asyncio
+from dataclasses import dataclass
+from datetime import datetime
+from logging import getLogger
+from time import monotonic
+from typing import Callable
+from telegram import Bot
+from telegram.error import Forbidden, TelegramError
+from telegram_libs.constants import DEBUG
+from telegram_libs.mongo import MongoManager
+from telegram_libs.rate_limiter import PRIORITY_BULK
+
+logger = getLogger(__name__)
+
+
+@dataclass
+class BatchReport:
+    """Outcome of one broadcast batch."""
+
+    batch: int
+    users: int
+    sent: int
+    blocked: int
+    failed: int
+    seconds: float
+
+    @property
+    def per_second(self) -> float:
+        return self.sent / self.seconds if self.seconds else 0.0
+
+
+class Broadcast:
+    """Send one message to every user of a bot.
+
+    Users are streamed from the users collection in _id order, batch_size at a
+    time, and sent through the bot's rate limiter at bulk priority, so replies to
+    users are not delayed. Progress is checkpointed in the broadcasts collection
+    after every batch; running a broadcast with the same broadcast_id again resumes
+    after the last checkpoint. A crash mid-batch resends that batch only.
+
+    Args:
+        premium_only: True for premium users only, False for free users only, None for everyone
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        mongo_manager: MongoManager,
+        broadcast_id: str,
+        text: str = None,
+        premium_only: bool | None = None,
+        batch_size: int = 500,
+        on_batch: Callable[[BatchReport], None] = None,
+    ):
+        if getattr(bot, "rate_limiter", None) is None:
+            raise ValueError("Broadcasts require a bot with a rate limiter, see FloodControlRateLimiter")
+        self.bot = bot
+        self.mongo_manager = mongo_manager
+        self.broadcast_id = broadcast_id
+        self.text = text
+        self.premium_only = premium_only
+        self.batch_size = batch_size
+        self.on_batch = on_batch
+        self.broadcasts_collection = (
+            mongo_manager.db["broadcasts_test"] if DEBUG else mongo_manager.db["broadcasts"]
+        )
+
+    def _load_checkpoint(self) -> dict:
+        """Create the broadcast record, or load it to resume."""
+        now = datetime.now().isoformat()
+        self.broadcasts_collection.update_one(
+            {"_id": self.broadcast_id},
+            {
+                "$setOnInsert": {
+                    "text": self.text,
+                    "premium_only": self.premium_only,
+                    "status": "running",
+                    "last_id": None,
+                    "batches": 0,
+                    "sent": 0,
+                    "blocked": 0,
+                    "failed": 0,
+                    "created_at": now,
+                }
+            },
+            upsert=True,
+        )
+        checkpoint = self.broadcasts_collection.find_one({"_id": self.broadcast_id})
+        if self.text is None:
+            self.text = checkpoint["text"]
+            self.premium_only = checkpoint["premium_only"]
+        return checkpoint
+
+    def _next_batch(self, last_id) -> list:
+        query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        return list(
+            self.mongo_manager.users_collection.find(query, {"user_id": 1})
+            .sort("_id", 1)
+            .limit(self.batch_size)
+        )
+
+    def _filter_recipients(self, users: list) -> list:
+        """User ids of the batch to send to, with one premium lookup for the whole batch."""
+        user_ids = [user["user_id"] for user in users if user.get("user_id") is not None]
+        if self.premium_only is None or not user_ids:
+            return user_ids
+        premium_ids = {
+            subscription["user_id"]
+            for subscription in self.mongo_manager.subscription_collection.find(
+                {
+                    "user_id": {"$in": user_ids},
+                    "is_premium": True,
+                    "premium_expiration": {"$gt": datetime.now().isoformat()},
+                },
+                {"_id": 0, "user_id": 1},
+            )
+        }
+        return [user_id for user_id in user_ids if (user_id in premium_ids) == self.premium_only]
+
+    def _save_checkpoint(self, last_id, report: BatchReport) -> None:
+        self.broadcasts_collection.update_one(
+            {"_id": self.broadcast_id},
+            {
+                "$set": {"last_id": last_id, "updated_at": datetime.now().isoformat()},
+                "$inc": {
+                    "batches": 1,
+                    "sent": report.sent,
+                    "blocked": report.blocked,
+                    "failed": report.failed,
+                },
+            },
+        )
+
+    async def _send(self, user_id: int) -> str:
+        try:
+            await self.bot.send_message(
+                chat_id=user_id, text=self.text, rate_limit_args={"priority": PRIORITY_BULK}
+            )
+        except Forbidden:
+            return "blocked"
+        except TelegramError as e:
+            logger.warning(f"Broadcast {self.broadcast_id} to {user_id} failed: {e}")
+            return "failed"
+        return "sent"
+
+    async def run(self) -> dict:
+        """Send the broadcast, resuming from the last checkpoint.
+
+        Returns:
+            dict: The broadcast record with the totals
+        """
+        checkpoint = await asyncio.to_thread(self._load_checkpoint)
+        if checkpoint["status"] == "done":
+            return checkpoint
+        last_id = checkpoint["last_id"]
+        batch = checkpoint["batches"]
+
+        while users := await asyncio.to_thread(self._next_batch, last_id):
+            started = monotonic()
+            recipients = await asyncio.to_thread(self._filter_recipients, users)
+            results = await asyncio.gather(*(self._send(user_id) for user_id in recipients))
+            batch += 1
+            report = BatchReport(
+                batch=batch,
+                users=len(users),
+                sent=results.count("sent"),
+                blocked=results.count("blocked"),
+                failed=results.count("failed"),
+                seconds=monotonic() - started,
+            )
+            last_id = users[-1]["_id"]
+            await asyncio.to_thread(self._save_checkpoint, last_id, report)
+            logger.info(
+                f"Broadcast {self.broadcast_id} batch {report.batch}: {report.sent} sent, "
+                f"{report.blocked} blocked, {report.failed} failed, {report.per_second:.1f} msg/s"
+            )
+            if self.on_batch:
+                self.on_batch(report)
+
+        await asyncio.to_thread(
+            self.broadcasts_collection.update_one,
+            {"_id": self.broadcast_id},
+            {"$set": {"status": "done", "finished_at": datetime.now().isoformat()}},
+        )
+        return await asyncio.to_thread(self.broadcasts_collection.find_one, {"_id": self.broadcast_id})
@@ -6,6 +6,9 @@ MONGO_URI = os.getenv("MONGO_URI")
 SUBSCRIPTION_DB_NAME = os.getenv("SUBSCRIPTION_DB_NAME", "subscriptions")
 LOGS_DB_NAME = os.getenv("LOGS_DB_NAME", "logs")
 DEBUG = os.getenv("DEBUG", "False").lower() in ("true", "1", "yes")
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "False").lower() in ("true", "1", "yes")
+# Mongo operations slower than this are sampled to the slow_ops collection, 0 disables
+SLOW_OP_THRESHOLD_MS = float(os.getenv("SLOW_OP_THRESHOLD_MS", "0"))
 BOTS = {
     "https://t.me/MagMediaBot": "Remove Background",
     "https://t.me/UpscaleImage_GBot": "Upscale Image",
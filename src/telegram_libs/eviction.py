@@ -0,0 +1,145 @@
+from collections import OrderedDict
+from logging import getLogger
+from time import monotonic
+from telegram import Update
+from telegram.ext import Application, ContextTypes, TypeHandler
+from telegram_libs.middleware import MIDDLEWARE_GROUP
+from telegram_libs.persistence import CHAT_DATA, USER_DATA
+
+logger = getLogger(__name__)
+
+# Before the middleware, so every update counts as a touch
+EVICTION_GROUP = MIDDLEWARE_GROUP - 1
+
+
+class DataEvictor:
+    """Drop user_data and chat_data of idle users and chats from memory.
+
+    Entries untouched for max_idle seconds are evicted, and the least recently
+    used ones beyond max_entries (per kind). Without a persistence the evicted data
+    is discarded. With one, it must load entries lazily and keep the stored data
+    of forgotten ones (MongoPersistence): with spill, pending changes are handed
+    to it first and an evicted entry is loaded again on its next update. Other
+    persistences delete the data of dropped entries, so eviction refuses to run
+    with them.
+    """
+
+    def __init__(self, max_idle: float = 3600, max_entries: int = 100000, interval: float = 300, spill: bool = True):
+        self.max_idle = max_idle
+        self.max_entries = max_entries
+        self.interval = interval
+        self.spill = spill
+        self._last_seen = {USER_DATA: OrderedDict(), CHAT_DATA: OrderedDict()}
+        self.evicted = {USER_DATA: 0, CHAT_DATA: 0}
+        self.evicted_idle = 0
+        self.evicted_over_limit = 0
+        self.app = None
+
+    def install(self, app: Application) -> None:
+        """Track touches and evict every interval seconds. Requires the job queue."""
+        if app.job_queue is None:
+            raise RuntimeError("Data eviction requires python-telegram-bot[job-queue]")
+        self._check_persistence(app.persistence)
+        self.app = app
+        app.add_handler(TypeHandler(Update, self.touch), group=EVICTION_GROUP)
+        app.job_queue.run_repeating(self.evict_job, interval=self.interval, first=self.interval, name="data_eviction")
+
+    def _touch(self, kind: str, key: int, now: float) -> None:
+        last_seen = self._last_seen[kind]
+        last_seen[key] = now
+        last_seen.move_to_end(key)
+
+    async def touch(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        now = monotonic()
+        if update.effective_user is not None:
+            self._touch(USER_DATA, update.effective_user.id, now)
+        if update.effective_chat is not None:
+            self._touch(CHAT_DATA, update.effective_chat.id, now)
+
+    @staticmethod
+    def _check_persistence(persistence) -> None:
+        if persistence is not None and not hasattr(persistence, "forget"):
+            raise RuntimeError(
+                f"Data eviction would delete the stored data of evicted entries from {type(persistence).__name__}; "
+                "use a persistence that reloads them lazily, such as MongoPersistence"
+            )
+
+    def _stores(self) -> dict:
+        return {USER_DATA: self.app.user_data, CHAT_DATA: self.app.chat_data}
+
+    def _drops(self) -> dict:
+        return {USER_DATA: self.app.drop_user_data, CHAT_DATA: self.app.drop_chat_data}
+
+    def _select(self, kind: str, data: dict, now: float) -> list:
+        """Keys to evict: idle ones, then the least recently used above max_entries."""
+        last_seen = self._last_seen[kind]
+        # Entries created without an update, e.g. loaded by a persistence at startup
+        for key in data.keys() - last_seen.keys():
+            self._touch(kind, key, now)
+        for key in last_seen.keys() - data.keys():
+            del last_seen[key]
+
+        selected = []
+        for key, seen in last_seen.items():
+            if now - seen < self.max_idle:
+                break
+            selected.append(key)
+        self.evicted_idle += len(selected)
+        over_limit = len(last_seen) - len(selected) - self.max_entries
+        if over_limit > 0:
+            lru = list(last_seen)[len(selected):len(selected) + over_limit]
+            selected.extend(lru)
+            self.evicted_over_limit += len(lru)
+        return selected
+
+    async def evict(self) -> int:
+        """Evict idle and excess entries.
+
+        Returns:
+            int: Number of entries evicted
+        """
+        persistence = self.app.persistence
+        self._check_persistence(persistence)
+        now = monotonic()
+        stores = self._stores()
+        selected = {kind: self._select(kind, data, now) for kind, data in stores.items()}
+        if not any(selected.values()):
+            return 0
+
+        if self.spill and persistence is not None:
+            # Write pending changes before the data leaves memory
+            await self.app.update_persistence()
+            await persistence.flush()
+
+        drops = self._drops()
+        for kind, keys in selected.items():
+            last_seen = self._last_seen[kind]
+            # Keep entries touched while the persistence was written
+            keys[:] = [key for key in keys if last_seen.get(key, now) <= now]
+            for key in keys:
+                if persistence is not None:
+                    # Evicted rather than deleted: the drop below keeps the stored data
+                    persistence.forget(kind, key)
+                drops[kind](key)
+                last_seen.pop(key, None)
+            self.evicted[kind] += len(keys)
+        if persistence is not None:
+            # Hand the drops over before new updates of the evicted entries arrive
+            await self.app.update_persistence()
+        count = sum(len(keys) for keys in selected.values())
+        logger.info(f"Evicted {len(selected[USER_DATA])} user_data and {len(selected[CHAT_DATA])} chat_data entries")
+        return count
+
+    async def evict_job(self, context: ContextTypes.DEFAULT_TYPE) -> None:
+        await self.evict()
+
+    @property
+    def metrics(self) -> dict:
+        return {
+            "resident_users": len(self._last_seen[USER_DATA]),
+            "resident_chats": len(self._last_seen[CHAT_DATA]),
+            "evicted_users": self.evicted[USER_DATA],
+            "evicted_chats": self.evicted[CHAT_DATA],
+            "evicted_idle": self.evicted_idle,
+            "evicted_over_limit": self.evicted_over_limit,
+        }
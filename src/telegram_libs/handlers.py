@@ -7,52 +7,135 @@ from telegram.ext import (
     filters,
     PreCheckoutQueryHandler,
 )
+from telegram.ext.filters import BaseFilter
 from telegram_libs.mongo import MongoManager
-from telegram_libs.subscription import subscription_callback, subscribe_command, check_subscription_command
-from telegram_libs.payment import precheckout_handler, successful_payment
+from telegram_libs.subscription import (
+    subscription_callback,
+    subscribe_command,
+    check_subscription_command,
+    expire_subscriptions_job,
+    expiry_reminder_job,
+)
+from telegram_libs.payment import precheckout_handler, successful_payment, PrecheckoutValidator
 from telegram_libs.support import (
     handle_support_command,
     _handle_user_response,
     SupportFilter,
+    support_inbox,
 )
-from telegram_libs.utils import more_bots_list_command
+from telegram_libs.utils import more_bots_list_command, RateLimitManager
 from telegram_libs.error import error_handler
 from telegram_libs.logger import BotLogger
+from telegram_libs.plans import PlanRegistry, default_plan_registry
+from telegram_libs.middleware import Middleware
+from telegram_libs.metrics import instrument_handler
+from telegram_libs.tracing import trace_handler
+
+
+def _instrument(callback, name: str):
+    """Record latency metrics and traces of a handler callback, if enabled."""
+    return instrument_handler(trace_handler(callback, name), name)
 
 
 def register_subscription_handlers(
-    app: Application, mongo_manager: MongoManager, bot_logger: BotLogger
+    app: Application,
+    mongo_manager: MongoManager,
+    bot_logger: BotLogger,
+    plan_registry: PlanRegistry | None = None,
+    precheckout_validator: PrecheckoutValidator | None = None,
 ) -> None:
     """Register subscription-related handlers."""
-    app.add_handler(CallbackQueryHandler(partial(subscription_callback, bot_logger=bot_logger), pattern="^sub_"))
-    app.add_handler(CommandHandler("subscribe", partial(subscribe_command, mongo_manager=mongo_manager, bot_logger=bot_logger)))
-    app.add_handler(CommandHandler("status", partial(check_subscription_command, mongo_manager=mongo_manager)))
+    plan_registry = plan_registry or default_plan_registry
+    mongo_manager.ensure_indexes()
+    app.add_handler(CallbackQueryHandler(_instrument(partial(subscription_callback, bot_logger=bot_logger, plan_registry=plan_registry), "subscription_callback"), pattern=plan_registry.is_plan_callback))
+    app.add_handler(CommandHandler("subscribe", _instrument(partial(subscribe_command, mongo_manager=mongo_manager, bot_logger=bot_logger, plan_registry=plan_registry), "subscribe_command")))
+    app.add_handler(CommandHandler("status", _instrument(partial(check_subscription_command, mongo_manager=mongo_manager), "check_subscription_command")))
 
     # Payment handlers
-    app.add_handler(PreCheckoutQueryHandler(precheckout_handler))
-    app.add_handler(MessageHandler(filters.SUCCESSFUL_PAYMENT, partial(successful_payment, mongo_manager=mongo_manager, bot_logger=bot_logger)))
+    app.add_handler(PreCheckoutQueryHandler(_instrument(partial(precheckout_handler, validator=precheckout_validator), "precheckout_handler")))
+    app.add_handler(MessageHandler(filters.SUCCESSFUL_PAYMENT, _instrument(partial(successful_payment, mongo_manager=mongo_manager, bot_logger=bot_logger, plan_registry=plan_registry, validator=precheckout_validator), "successful_payment")))
+
+
+def register_subscription_sweeper(
+    app: Application, mongo_manager: MongoManager, interval: float = 3600
+) -> None:
+    """Downgrade expired subscriptions every `interval` seconds.
+
+    Requires the job queue (python-telegram-bot[job-queue]).
+    """
+    if app.job_queue is None:
+        raise RuntimeError("Subscription sweeper requires python-telegram-bot[job-queue]")
+    app.job_queue.run_repeating(
+        expire_subscriptions_job, interval=interval, first=0, data=mongo_manager, name="subscription_sweeper"
+    )
+
+
+def register_expiry_reminders(
+    app: Application,
+    mongo_manager: MongoManager,
+    days: float = 3,
+    interval: float = 3600,
+    batch_size: int = 500,
+    plan_registry: PlanRegistry | None = None,
+) -> None:
+    """Remind users `days` before their subscription expires, checking every `interval` seconds.
+
+    The reminder offers the plans of plan_registry, the default plans if not given.
+
+    Requires the job queue and a rate limiter on the bot (see FloodControlRateLimiter).
+    """
+    if app.job_queue is None:
+        raise RuntimeError("Expiry reminders require python-telegram-bot[job-queue]")
+    if app.bot.rate_limiter is None:
+        raise RuntimeError("Expiry reminders require a bot with a rate limiter")
+    app.job_queue.run_repeating(
+        expiry_reminder_job,
+        interval=interval,
+        first=0,
+        data={
+            "mongo_manager": mongo_manager,
+            "days": days,
+            "batch_size": batch_size,
+            "plan_registry": plan_registry or default_plan_registry,
+        },
+        name="expiry_reminders",
+    )
 
 
 def register_support_handlers(app: Application, bot_name: str, bot_logger: BotLogger) -> None:
     """Register support handlers for the bot"""
-    app.add_handler(CommandHandler("support", partial(handle_support_command, bot_logger=bot_logger)))
+    support_inbox.ensure_indexes()
+    app.add_handler(CommandHandler("support", _instrument(partial(handle_support_command, bot_logger=bot_logger), "handle_support_command")))
     app.add_handler(
         MessageHandler(
             filters.TEXT & ~filters.COMMAND & SupportFilter(),
-            partial(_handle_user_response, bot_name=bot_name, bot_logger=bot_logger),
+            _instrument(partial(_handle_user_response, bot_name=bot_name, bot_logger=bot_logger), "support_response"),
         )
     )
 
 
 def register_common_handlers(
-    app: Application, bot_name: str, mongo_manager: MongoManager
+    app: Application,
+    bot_name: str,
+    mongo_manager: MongoManager,
+    plan_registry: PlanRegistry | None = None,
+    precheckout_validator: PrecheckoutValidator | None = None,
+    rate_limit_manager: RateLimitManager | None = None,
+    rate_limit_filter: BaseFilter | None = None,
+    bot_logger: BotLogger | None = None,
 ) -> None:
-    """Register common handlers for the bot"""
-    bot_logger = BotLogger()
-    app.add_handler(CommandHandler("more", partial(more_bots_list_command, bot_logger=bot_logger)))
+    """Register common handlers for the bot
+
+    Also installs the middleware, which loads the user once per update for all
+    handlers and rate limits updates matching rate_limit_filter. Pass bot_logger
+    to share one log buffer between several bots.
+    """
+    bot_logger = bot_logger or BotLogger(batch_size=50)
+    Middleware(mongo_manager, bot_logger, rate_limit_manager, rate_limit_filter).install(app)
+    app.add_handler(CommandHandler("more", _instrument(partial(more_bots_list_command, bot_logger=bot_logger), "more_bots_list_command")))
     
     register_support_handlers(app, bot_name, bot_logger)
-    register_subscription_handlers(app, mongo_manager, bot_logger)
+    register_subscription_handlers(app, mongo_manager, bot_logger, plan_registry, precheckout_validator)
     
     # Error handler
     app.add_error_handler(partial(error_handler, bot_logger=bot_logger, bot_name=bot_name))
@@ -1,21 +1,56 @@
+import asyncio
+import atexit
 from datetime import datetime
+from logging import getLogger
+from weakref import WeakSet
 from telegram_libs.mongo import MongoManager
 from telegram_libs.constants import DEBUG, LOGS_DB_NAME
+from telegram_libs.tracing import tracer
+
+logger = getLogger(__name__)
+
+# Batching loggers, whose buffers are written at interpreter exit
+_batching_loggers = WeakSet()
+
+
+@atexit.register
+def _flush_batching_loggers() -> None:
+    for bot_logger in list(_batching_loggers):
+        bot_logger.flush()
 
 
 class BotLogger:
-    def __init__(self):
+    def __init__(self, batch_size: int = 1, flush_interval: float = 5.0):
+        """Log user actions to the logs collection.
+
+        With batch_size > 1 entries are buffered and written with one insert_many when
+        the buffer is full or flush_interval seconds after the first buffered entry.
+        Inside an event loop the insert runs in a worker thread; await aflush to
+        wait for it.
+        """
         self.mongo_manager = MongoManager(mongo_database_name=LOGS_DB_NAME)
         self.logs_collection = (
             self.mongo_manager.client[LOGS_DB_NAME]["logs_test"]
             if DEBUG
             else self.mongo_manager.client[LOGS_DB_NAME]["logs"]
         )
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._flush_handle = None
+        # Inserts running in worker threads
+        self._writes = set()
+        if batch_size > 1:
+            _batching_loggers.add(self)
 
     def log_action(
         self, user_id: int, action_type: str, bot_name: str, details: dict = None
     ) -> None:
         """Log a user action to the database."""
+        with tracer.span("log_action", action_type=action_type):
+            self._log_action(user_id, action_type, bot_name, details)
+
+    def _log_action(self, user_id: int, action_type: str, bot_name: str, details: dict = None) -> None:
         log_entry = {
             "user_id": user_id,
             "action_type": action_type,
@@ -23,4 +58,53 @@ class BotLogger:
             "timestamp": datetime.now().isoformat(),
             "details": details or {},
         }
-        self.logs_collection.insert_one(log_entry) 
\ No newline at end of file
+        if self.batch_size <= 1:
+            self.logs_collection.insert_one(log_entry)
+            return
+
+        self._buffer.append(log_entry)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No event loop to write from later
+            self.flush()
+            return
+        if len(self._buffer) >= self.batch_size:
+            self._flush_in_thread(loop)
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.flush_interval, self._flush_in_thread, loop)
+
+    def _take_buffer(self) -> list:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        entries, self._buffer = self._buffer, []
+        return entries
+
+    def _insert(self, entries: list) -> None:
+        if entries:
+            self.logs_collection.insert_many(entries, ordered=False)
+
+    def _flush_in_thread(self, loop: asyncio.AbstractEventLoop) -> None:
+        entries = self._take_buffer()
+        if entries:
+            write = loop.run_in_executor(None, self._insert, entries)
+            self._writes.add(write)
+            write.add_done_callback(self._write_done)
+
+    def _write_done(self, write: asyncio.Future) -> None:
+        self._writes.discard(write)
+        if not write.cancelled() and write.exception() is not None:
+            logger.error(f"Writing log entries failed: {write.exception()!r}")
+
+    def flush(self) -> None:
+        """Write buffered log entries, blocking until they are written."""
+        self._insert(self._take_buffer())
+
+    async def aflush(self) -> None:
+        """Write buffered log entries and wait for inserts in flight, off the event loop."""
+        entries = self._take_buffer()
+        if entries:
+            await asyncio.to_thread(self._insert, entries)
+        if self._writes:
+            await asyncio.gather(*self._writes, return_exceptions=True)
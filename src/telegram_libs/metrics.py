@@ -0,0 +1,197 @@
+from bisect import bisect_left
+from contextvars import ContextVar
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from time import perf_counter
+from typing import Callable
+from pymongo import monitoring
+from telegram_libs.constants import METRICS_ENABLED
+
+# Seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Handler whose callback is running; copied into threads started with asyncio.to_thread
+current_handler: ContextVar[str] = ContextVar("current_handler", default="none")
+
+
+class Histogram:
+    """Cumulative latency histogram in the Prometheus layout."""
+
+    __slots__ = ("buckets", "counts", "count", "sum")
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        # The last slot counts values above the largest bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class MetricsRegistry:
+    """Latency histograms keyed by metric name and labels.
+
+    Disabled registries record nothing, and handlers and Mongo clients are not
+    instrumented at all, so the instrumentation costs nothing unless enabled.
+    """
+
+    def __init__(self, enabled: bool = METRICS_ENABLED, buckets: tuple = DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.buckets = buckets
+        self._histograms = {}
+        self._lock = Lock()
+
+    def observe(self, name: str, labels: dict, value: float) -> None:
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+
+    def get_stats(self) -> dict:
+        """Summaries per metric: {name: [{"labels", "count", "sum", "p50", "p95", "p99"}]}."""
+        stats = {}
+        with self._lock:
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                stats.setdefault(name, []).append({
+                    "labels": dict(labels),
+                    "count": histogram.count,
+                    "sum": histogram.sum,
+                    "p50": histogram.quantile(0.5),
+                    "p95": histogram.quantile(0.95),
+                    "p99": histogram.quantile(0.99),
+                })
+        return stats
+
+    def render_prometheus(self) -> str:
+        """All histograms in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            names_seen = set()
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                if name not in names_seen:
+                    names_seen.add(name)
+                    lines.append(f"# TYPE {name} histogram")
+                label_text = ",".join(f'{key}="{_escape(value)}"' for key, value in labels)
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(label_text, bound)} {cumulative}")
+                lines.append(f"{name}_bucket{_labels(label_text, '+Inf')} {histogram.count}")
+                lines.append(f"{name}_sum{_labels(label_text)} {histogram.sum}")
+                lines.append(f"{name}_count{_labels(label_text)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(label_text: str, le=None) -> str:
+    if le is not None:
+        label_text = f'{label_text},le="{le}"' if label_text else f'le="{le}"'
+    return f"{{{label_text}}}" if label_text else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+registry = MetricsRegistry()
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Record the latency of every Mongo command per collection and handler."""
+
+    def __init__(self, metrics: MetricsRegistry = None):
+        self.metrics = metrics or registry
+        # request_id -> labels of commands in flight
+        self._started = {}
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        collection = event.command.get(event.command_name)
+        self._started[event.request_id] = {
+            "handler": current_handler.get(),
+            "command": event.command_name,
+            "collection": collection if isinstance(collection, str) else "",
+        }
+
+    def _finished(self, event, status: str) -> None:
+        labels = self._started.pop(event.request_id, None)
+        if labels is not None:
+            self.metrics.observe("mongo_command_seconds", {**labels, "status": status}, event.duration_micros / 1e6)
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self._finished(event, "ok")
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self._finished(event, "error")
+
+
+def get_event_listeners() -> list:
+    """Listeners for new Mongo clients, none unless metrics are enabled."""
+    return [MongoCommandListener()] if registry.enabled else []
+
+
+def instrument_handler(callback: Callable, name: str) -> Callable:
+    """Time a handler callback and attribute the Mongo commands it runs to it.
+
+    Returns the callback itself when metrics are disabled.
+    """
+    if not registry.enabled:
+        return callback
+
+    @wraps(callback)
+    async def wrapper(*args, **kwargs):
+        token = current_handler.set(name)
+        started = perf_counter()
+        try:
+            return await callback(*args, **kwargs)
+        finally:
+            registry.observe("handler_seconds", {"handler": name}, perf_counter() - started)
+            current_handler.reset(token)
+
+    return wrapper
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+def start_metrics_server(port: int = 9100, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Serve /metrics for Prometheus from a daemon thread."""
+    server = ThreadingHTTPServer((host, port), _MetricsRequestHandler)
+    Thread(target=server.serve_forever, daemon=True, name="metrics-server").start()
+    return server
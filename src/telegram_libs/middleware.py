@@ -0,0 +1,126 @@
+from collections import deque
+from logging import getLogger
+from time import monotonic
+from telegram import Update
+from telegram.ext import Application, ApplicationHandlerStop, ContextTypes, TypeHandler
+from telegram.ext.filters import BaseFilter
+from telegram_libs.mongo import MongoManager
+from telegram_libs.logger import BotLogger
+from telegram_libs.tracing import TracedApplication
+
+logger = getLogger(__name__)
+
+# Handler groups run in ascending order, the middleware runs before all default (0) handlers
+MIDDLEWARE_GROUP = -100
+UPDATE_STATE_ATTR = "update_state"
+
+
+class UpdateState:
+    """Results of the middleware stages for one update.
+
+    The user is loaded from the database on first access only, and at most once.
+    """
+
+    __slots__ = ("update", "mongo_manager", "_user_info")
+
+    def __init__(self, update: Update, mongo_manager: MongoManager):
+        self.update = update
+        self.mongo_manager = mongo_manager
+        self._user_info = None
+
+    @property
+    def user_info(self) -> dict:
+        if self._user_info is None:
+            self._user_info = self.mongo_manager.get_user_info(self.update)
+        return self._user_info
+
+    @property
+    def lang(self) -> str:
+        return self.user_info["lang"]
+
+
+def get_update_state(context: ContextTypes.DEFAULT_TYPE) -> UpdateState | None:
+    """State attached to the context by the middleware, None if it is not installed."""
+    state = getattr(context, UPDATE_STATE_ATTR, None)
+    return state if isinstance(state, UpdateState) else None
+
+
+def get_user_info(update: Update, context: ContextTypes.DEFAULT_TYPE, mongo_manager: MongoManager) -> dict:
+    """User info loaded by the middleware, or from the database if it is not installed."""
+    state = get_update_state(context)
+    if state is not None:
+        return state.user_info
+    return mongo_manager.get_user_info(update)
+
+
+class MiddlewareApplication(TracedApplication):
+    """Application recording the handling time of every update for the Middleware.
+
+    The time is recorded in a finally around process_update, so updates whose
+    handlers raised or stopped with ApplicationHandlerStop are timed too. Updates
+    are traced as by TracedApplication when tracing is enabled.
+
+    Usage:
+        app = install_tracing(Application.builder()).application_class(MiddlewareApplication).token(token).build()
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # Set by Middleware.install
+        self.update_timings = None
+
+    async def process_update(self, update: object) -> None:
+        started_at = monotonic()
+        try:
+            await super().process_update(update)
+        finally:
+            if self.update_timings is not None:
+                self.update_timings.append(monotonic() - started_at)
+
+
+class Middleware:
+    """Per-update prologue shared by all handlers.
+
+    Attaches an UpdateState (user loading, language resolution) to the callback
+    context and rate limits updates matching rate_limit_filter. Handling times are
+    recorded when the application is a MiddlewareApplication. Handlers log through
+    a batching BotLogger, so event logging costs no round trip per update.
+    """
+
+    def __init__(
+        self,
+        mongo_manager: MongoManager,
+        bot_logger: BotLogger,
+        rate_limit_manager=None,
+        rate_limit_filter: BaseFilter = None,
+        timings_maxlen: int = 1000,
+    ):
+        self.mongo_manager = mongo_manager
+        self.bot_logger = bot_logger
+        self.rate_limit_manager = rate_limit_manager
+        self.rate_limit_filter = rate_limit_filter
+        # Seconds spent handling recent updates
+        self.timings = deque(maxlen=timings_maxlen)
+
+    def install(self, app: Application) -> None:
+        app.add_handler(TypeHandler(Update, self.open_update), group=MIDDLEWARE_GROUP)
+        if isinstance(app, MiddlewareApplication):
+            app.update_timings = self.timings
+        else:
+            logger.warning("Update timings are not recorded, build the application with MiddlewareApplication")
+
+    async def open_update(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        state = UpdateState(update, self.mongo_manager)
+        setattr(context, UPDATE_STATE_ATTR, state)
+
+        if (
+            self.rate_limit_manager is not None
+            and self.rate_limit_filter is not None
+            and update.effective_user is not None
+            and self.rate_limit_filter.check_update(update)
+        ):
+            allowed = await self.rate_limit_manager.check_limit_with_response(
+                update, context, update.effective_user.id
+            )
+            if not allowed:
+                raise ApplicationHandlerStop
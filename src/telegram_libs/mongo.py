@@ -1,32 +1,119 @@
-from datetime import datetime
+from datetime import datetime, timedelta
+from logging import getLogger
+from typing import Iterator
+from weakref import WeakSet
+from bson import ObjectId
 from telegram import Update
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 from pymongo.mongo_client import MongoClient
 from pymongo.server_api import ServerApi
+from pymongo.write_concern import WriteConcern
 from telegram_libs.constants import MONGO_URI, DEBUG, SUBSCRIPTION_DB_NAME
-from telegram import Update
+from telegram_libs.metrics import get_event_listeners
+from telegram_libs.slow_ops import get_slow_op_listeners
+from telegram_libs.testing import get_round_trip_listeners
+from telegram_libs.tracing import get_trace_listeners
 
+logger = getLogger(__name__)
 
-class MongoManager:
-    _mongo_client = None
+# One client (and connection pool) per URI shared by all managers in the process
+_mongo_clients = {}
+# Managers using a registry client, rebound by reconnect_after_fork
+_shared_managers = WeakSet()
+
+
+def get_mongo_client(uri: str = MONGO_URI) -> MongoClient:
+    """Get the process-wide client for a URI, creating it on first use."""
+    client = _mongo_clients.get(uri)
+    if client is None:
+        client = _mongo_clients[uri] = MongoClient(
+            uri,
+            server_api=ServerApi("1"),
+            event_listeners=(
+                get_event_listeners() + get_slow_op_listeners(uri) + get_trace_listeners() + get_round_trip_listeners()
+            ),
+        )
+    return client
+
+
+def reconnect_after_fork() -> None:
+    """Drop clients inherited from the parent process and rebind managers to new ones.
+
+    PyMongo clients are not fork-safe, so call this first thing in a forked child.
+    """
+    _mongo_clients.clear()
+    for manager in list(_shared_managers):
+        manager._bind(get_mongo_client())
 
+
+class MongoManager:
     @property
     def mongo_client(self):
-        if self._mongo_client is None:
-            self._mongo_client = MongoClient(MONGO_URI, server_api=ServerApi("1"))
-        return self._mongo_client
+        return get_mongo_client()
 
     def __init__(self, mongo_database_name: str, **kwargs):
-        self.client = kwargs.get("client") or self.mongo_client
-        self.db = self.client[mongo_database_name]
+        self.mongo_database_name = mongo_database_name
+        self.user_schema = {"user_id": None, **(kwargs.get("user_schema") or {})}
+        if kwargs.get("client"):
+            self._bind(kwargs["client"])
+        else:
+            self._bind(self.mongo_client)
+            _shared_managers.add(self)
+
+    def _bind(self, client: MongoClient) -> None:
+        self.client = client
+        # Whether the server supports transactions, asked on first use
+        self._transactions = None
+        self.db = self.client[self.mongo_database_name]
         self.users_collection = self.db["users_test"] if DEBUG else self.db["users"]
         self.payments_collection = self.db["order_test"] if DEBUG else self.db["order"]
-        self.user_schema = {"user_id": None, **(kwargs.get("user_schema") or {})}
         self.subscription_collection = (
             self.client[SUBSCRIPTION_DB_NAME]["subscriptions"]
             if not DEBUG
             else self.client[SUBSCRIPTION_DB_NAME]["subscriptions_test"]
         )
 
+    def ensure_indexes(self) -> None:
+        """Create the indexes the manager relies on.
+
+        The unique telegram_payment_charge_id index makes payment processing
+        idempotent. The Telegram charge id is always set, unlike the provider charge
+        id, which is empty for Telegram Stars payments. Orders recorded before the
+        field was stored are left out of the index.
+
+        Also warns when the server does not support transactions, so payments are
+        recorded without one, see record_subscription_payment.
+        """
+        if not self.supports_transactions():
+            logger.warning(
+                "MongoDB transactions are not available (standalone mongod): subscription payments "
+                "are recorded without a transaction. Run a replica set or mongos for atomic payments."
+            )
+        index = self.payments_collection.index_information().get("order_id_1")
+        if index and index["key"] == [("order_id", 1)] and index.get("unique"):
+            # The former unique index on provider charge ids rejects all Stars payments but the first
+            self.payments_collection.drop_index("order_id_1")
+        self.payments_collection.create_index(
+            "telegram_payment_charge_id",
+            unique=True,
+            partialFilterExpression={"telegram_payment_charge_id": {"$gt": ""}},
+        )
+        self.payments_collection.create_index([("user_id", 1), ("_id", 1)])
+        self.subscription_collection.create_index([("is_premium", 1), ("premium_expiration", 1)])
+        self.users_collection.create_index("user_id")
+
+    def supports_transactions(self) -> bool:
+        """Whether the server is a replica set member or mongos.
+
+        Transactions are not available on a standalone mongod. The answer is asked
+        once per client.
+        """
+        if self._transactions is None:
+            hello = self.client.admin.command("hello")
+            self._transactions = bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+        return self._transactions
+
     def create_user(self, user_id: int) -> None:
         """Create a new user in the database."""
         user_data = self.user_schema.copy()
@@ -63,6 +150,49 @@ class MongoManager:
         orders = self.payments_collection.find({"user_id": user_id})
         return list(orders)
 
+    def iter_orders(
+        self, user_id: int, projection: dict = None, batch_size: int = 100, after: ObjectId = None
+    ) -> Iterator[dict]:
+        """Stream a user's orders oldest first, fetching batch_size documents per round trip.
+
+        Args:
+            user_id (int): User ID
+            projection (dict): Fields to return
+            batch_size (int): Documents fetched per round trip
+            after (ObjectId): Resume after the order with this _id
+        """
+        query = {"user_id": user_id}
+        if after is not None:
+            query["_id"] = {"$gt": after}
+        yield from self.payments_collection.find(query, projection).sort("_id", 1).batch_size(batch_size)
+
+    def get_orders_page(
+        self, user_id: int, limit: int = 50, after: ObjectId = None, projection: dict = None
+    ) -> tuple[list, ObjectId | None]:
+        """Get a page of a user's orders using keyset pagination on _id.
+
+        Returns:
+            tuple[list, ObjectId | None]: Orders and the `after` value of the next page,
+            None on the last page
+        """
+        query = {"user_id": user_id}
+        if after is not None:
+            query["_id"] = {"$gt": after}
+        orders = list(self.payments_collection.find(query, projection).sort("_id", 1).limit(limit))
+        next_after = orders[-1]["_id"] if len(orders) == limit else None
+        return orders, next_after
+
+    def get_orders_summary(self, user_id: int) -> dict:
+        """Count a user's orders and total the amounts per currency on the server."""
+        summary = {"count": 0, "totals": {}}
+        for group in self.payments_collection.aggregate([
+            {"$match": {"user_id": user_id}},
+            {"$group": {"_id": "$currency", "count": {"$sum": 1}, "total": {"$sum": "$amount"}}},
+        ]):
+            summary["count"] += group["count"]
+            summary["totals"][group["_id"]] = group["total"]
+        return summary
+
     def update_order(self, user_id: int, order_id: int, updates: dict) -> None:
         """Update an order for a user."""
         self.payments_collection.update_one(
@@ -96,27 +226,181 @@ class MongoManager:
             {"user_id": user_id}, {"$set": updates}, upsert=True
         )
 
-    def add_subscription_payment(self, user_id: int, payment_data: dict) -> None:
-        """Add a subscription payment record."""
-        self.subscription_collection.update_one(
-            {"user_id": user_id},
-            {
-                "$push": {"payments": payment_data},
-                "$set": {
-                    "is_premium": True,
-                    "premium_expiration": payment_data["expiration_date"],
-                    "last_payment": payment_data["date"],
+    def add_subscription_payment(self, user_id: int, payment_data: dict, session=None) -> str:
+        """Add a subscription payment record and extend the subscription.
+
+        The new expiration is max(current expiration, payment date) + duration_days,
+        computed by the server in a single pipeline update, so early renewals keep
+        their remaining days and concurrent payments stack instead of overwriting.
+        A payment whose telegram_payment_charge_id is already in the subscription's
+        payments leaves it unchanged, so replays are not counted twice.
+        $dateAdd needs MongoDB 5.0 or newer.
+
+        Returns:
+            str: New premium expiration in ISO format
+        """
+        payment_date = datetime.fromisoformat(payment_data["date"])
+        # Expirations written before this update are Python isoformat strings with
+        # microseconds, which $dateFromString rejects: cut the fraction to
+        # milliseconds and keep any UTC offset. Other unparsable values fail the
+        # update rather than silently dropping the remaining days.
+        legacy_parts = {"$regexFind": {"input": "$premium_expiration", "regex": r"^(.{19}(?:\.\d{1,3})?)\d*(.*)$"}}
+        normalized_expiration = {
+            "$let": {
+                "vars": {"parts": legacy_parts},
+                "in": {
+                    "$concat": [
+                        {"$arrayElemAt": ["$$parts.captures", 0]},
+                        {"$arrayElemAt": ["$$parts.captures", 1]},
+                    ]
+                },
+            }
+        }
+        current_expiration = {
+            "$dateFromString": {
+                "dateString": {"$ifNull": [normalized_expiration, "$premium_expiration"]},
+                "onNull": payment_date,
+            }
+        }
+        new_expiration = {
+            "$dateToString": {
+                "date": {
+                    "$dateAdd": {
+                        "startDate": {"$max": [current_expiration, payment_date]},
+                        "unit": "day",
+                        "amount": payment_data["duration_days"],
+                    }
                 },
+                "format": "%Y-%m-%dT%H:%M:%S.%L",
+            }
+        }
+        updates = {
+            "payments": {
+                "$concatArrays": [
+                    {"$ifNull": ["$payments", []]},
+                    [{"$mergeObjects": [{"$literal": payment_data}, {"expiration_date": new_expiration}]}],
+                ]
             },
+            "is_premium": True,
+            "premium_expiration": new_expiration,
+            "last_payment": {"$literal": payment_data["date"]},
+        }
+        charge_id = payment_data.get("telegram_payment_charge_id")
+        if charge_id:
+            recorded = {"$in": [charge_id, {"$ifNull": ["$payments.telegram_payment_charge_id", []]}]}
+            updates = {field: {"$cond": [recorded, f"${field}", value]} for field, value in updates.items()}
+        subscription = self.subscription_collection.find_one_and_update(
+            {"user_id": user_id},
+            [{"$set": updates}],
+            projection={"_id": 0, "premium_expiration": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+            session=session,
+        )
+        return subscription["premium_expiration"]
+
+    def record_subscription_payment(self, user_id: int, order: dict, payment_data: dict) -> str | None:
+        """Add an order and the matching subscription payment, once per telegram_payment_charge_id.
+
+        On a replica set or mongos both are written in one transaction, and replays
+        of a recorded charge id hit the unique index and abort it. On a standalone
+        mongod the order is upserted by charge id and the subscription update skips
+        charge ids it already holds, so a replay after a failure between the two
+        writes completes the payment instead of counting it twice.
+
+        Returns:
+            str | None: New premium expiration, None if the payment was already recorded
+        """
+        if not self.supports_transactions():
+            return self._record_subscription_payment_without_transaction(user_id, order, payment_data)
+
+        def _write(session):
+            self.payments_collection.insert_one({"user_id": user_id, **order}, session=session)
+            return self.add_subscription_payment(user_id, payment_data, session=session)
+
+        try:
+            with self.client.start_session() as session:
+                # with_transaction retries transient errors and unknown commit results
+                return session.with_transaction(_write, write_concern=WriteConcern("majority"))
+        except DuplicateKeyError:
+            return None
+
+    def _record_subscription_payment_without_transaction(
+        self, user_id: int, order: dict, payment_data: dict
+    ) -> str | None:
+        charge_id = order["telegram_payment_charge_id"]
+        result = self.payments_collection.update_one(
+            {"telegram_payment_charge_id": charge_id},
+            {"$setOnInsert": {"user_id": user_id, **order}},
             upsert=True,
         )
+        if result.upserted_id is None and self.subscription_collection.find_one(
+            {"user_id": user_id, "payments.telegram_payment_charge_id": charge_id}, {"_id": 1}
+        ):
+            return None
+        return self.add_subscription_payment(user_id, payment_data)
 
     def check_subscription_status(self, user_id: int) -> bool:
         """Check if user has an active subscription."""
-        subscription = self.get_subscription(user_id)
+        # ISO timestamps order lexicographically, so the expiry check runs on the server
+        subscription = self.subscription_collection.find_one(
+            {
+                "user_id": user_id,
+                "is_premium": True,
+                "premium_expiration": {"$gt": datetime.now().isoformat()},
+            },
+            {"_id": 1},
+        )
+        return subscription is not None
+
+    def expire_subscriptions(self) -> int:
+        """Downgrade all subscriptions whose expiration has passed.
+
+        Returns:
+            int: Number of subscriptions downgraded
+        """
+        result = self.subscription_collection.update_many(
+            {"is_premium": True, "premium_expiration": {"$lte": datetime.now().isoformat()}},
+            {"$set": {"is_premium": False}},
+        )
+        return result.modified_count
+
+    def get_expiring_subscriptions(self, within_days: float) -> list:
+        """Get active subscriptions expiring within the given days and not reminded yet.
 
-        if not subscription.get("is_premium"):
-            return False
+        One range query on the (is_premium, premium_expiration) index.
+        """
+        now = datetime.now()
+        return list(
+            self.subscription_collection.find(
+                {
+                    "is_premium": True,
+                    "premium_expiration": {
+                        "$gt": now.isoformat(),
+                        "$lte": (now + timedelta(days=within_days)).isoformat(),
+                    },
+                    # Renewals change premium_expiration, so renewed users are reminded again
+                    "$expr": {"$ne": ["$reminded_for", "$premium_expiration"]},
+                },
+                {"_id": 0, "user_id": 1, "premium_expiration": 1},
+            )
+        )
 
-        expiration = datetime.fromisoformat(subscription["premium_expiration"])
-        return expiration > datetime.now()
+    def mark_reminded(self, user_ids: list) -> int:
+        """Mark the current subscription period of the users as reminded in one bulk update."""
+        if not user_ids:
+            return 0
+        result = self.subscription_collection.update_many(
+            {"user_id": {"$in": user_ids}, "is_premium": True},
+            [{"$set": {"reminded_for": "$premium_expiration"}}],
+        )
+        return result.modified_count
+
+    def get_user_languages(self, user_ids: list) -> dict:
+        """Map the user ids known to this bot to their language in one query."""
+        return {
+            user["user_id"]: user.get("language", "en")
+            for user in self.users_collection.find(
+                {"user_id": {"$in": user_ids}}, {"_id": 0, "user_id": 1, "language": 1}
+            )
+        }
@@ -1,25 +1,136 @@
+import asyncio
+from collections import deque
 from datetime import datetime, timedelta
 from logging import getLogger
+from threading import Lock
+from time import monotonic
 from telegram import Update
 from telegram.ext import ContextTypes
+from telegram_libs.cache import TTLCache
 from telegram_libs.translation import t
 from telegram_libs.mongo import MongoManager
 from telegram_libs.logger import BotLogger
+from telegram_libs.middleware import get_user_info
+from telegram_libs.plans import PlanRegistry, default_plan_registry
 
 logger = getLogger(__name__)
 
 
-async def precheckout_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+class PrecheckoutValidator:
+    """Validate pre-checkout queries within a time budget.
+
+    Telegram drops pre-checkout queries not answered within 10 seconds. Plans come
+    from the in-memory registry and user state from a TTL cache, so most answers
+    need no database read; when validation exceeds `budget` seconds or fails, the
+    query is answered with `fallback_ok`. Validation runs in worker threads, so
+    the cache is only accessed under a lock.
+    """
+
+    def __init__(
+        self,
+        mongo_manager: MongoManager,
+        plan_registry: PlanRegistry = default_plan_registry,
+        budget: float = 3.0,
+        max_subscription_days: int = 730,
+        fallback_ok: bool = True,
+        cache_ttl: float = 60,
+    ):
+        self.mongo_manager = mongo_manager
+        self.plan_registry = plan_registry
+        self.budget = budget
+        self.max_subscription_days = max_subscription_days
+        self.fallback_ok = fallback_ok
+        self.user_state_cache = TTLCache(cache_ttl)
+        self._cache_lock = Lock()
+        # Fraction of the budget used by recent answers
+        self.budget_usage = deque(maxlen=1000)
+
+    def get_user_state(self, user_id: int) -> dict:
+        """Get cached ban and subscription state of a user."""
+        with self._cache_lock:
+            state = self.user_state_cache.get(user_id)
+        if state is None:
+            user = self.mongo_manager.users_collection.find_one(
+                {"user_id": user_id}, {"_id": 0, "banned": 1}
+            ) or {}
+            subscription = self.mongo_manager.subscription_collection.find_one(
+                {"user_id": user_id}, {"_id": 0, "is_premium": 1, "premium_expiration": 1}
+            ) or {}
+            state = {
+                "banned": bool(user.get("banned")),
+                "premium_expiration": subscription.get("premium_expiration") if subscription.get("is_premium") else None,
+            }
+            with self._cache_lock:
+                self.user_state_cache.set(user_id, state)
+        return state
+
+    def invalidate(self, user_id: int) -> None:
+        """Drop the cached state of a user, e.g. after their subscription changed."""
+        with self._cache_lock:
+            self.user_state_cache.invalidate(user_id)
+
+    def validate(self, user_id: int, payload: str) -> str | None:
+        """Get the translation key of the rejection reason, None if the payment may proceed."""
+        plan = self.plan_registry.get_by_payload(payload)
+        if not plan:
+            return "payment.invalid_plan"
+
+        state = self.get_user_state(user_id)
+        if state["banned"]:
+            return "payment.banned"
+
+        if state["premium_expiration"]:
+            remaining = datetime.fromisoformat(state["premium_expiration"]) - datetime.now()
+            if remaining + timedelta(days=plan.duration) > timedelta(days=self.max_subscription_days):
+                return "payment.max_subscription"
+        return None
+
+    async def check(self, user_id: int, payload: str) -> tuple[bool, str | None]:
+        """Validate within the budget.
+
+        Returns:
+            tuple[bool, str | None]: Whether to accept and the rejection translation key
+        """
+        start = monotonic()
+        try:
+            error_key = await asyncio.wait_for(
+                asyncio.to_thread(self.validate, user_id, payload), timeout=self.budget
+            )
+            ok = error_key is None
+        except Exception as e:
+            logger.warning(f"Pre-checkout validation for user {user_id} fell back: {e!r}")
+            ok = self.fallback_ok
+            error_key = None if ok else "payment.unavailable"
+        usage = (monotonic() - start) / self.budget
+        self.budget_usage.append(usage)
+        logger.info(f"Pre-checkout validation for user {user_id} used {usage:.0%} of budget")
+        return ok, error_key
+
+
+async def precheckout_handler(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    validator: PrecheckoutValidator | None = None,
+):
     """Handle the pre-checkout query"""
     query = update.pre_checkout_query
     user_id = query.from_user.id
 
-    # Always accept the pre-checkout query in this basic implementation
-    # You could add additional validation here if needed (e.g., check user status, inventory, etc.)
+    # Without a validator every pre-checkout query is accepted
+    ok, error_key = True, None
+    if validator is not None:
+        ok, error_key = await validator.check(user_id, query.invoice_payload)
 
     try:
-        await query.answer(ok=True)
-        logger.info(f"Pre-checkout approved for user {user_id}")
+        if ok:
+            await query.answer(ok=True)
+            logger.info(f"Pre-checkout approved for user {user_id}")
+        else:
+            await query.answer(
+                ok=False,
+                error_message=t(error_key, query.from_user.language_code, common=True),
+            )
+            logger.info(f"Pre-checkout rejected for user {user_id}: {error_key}")
     except Exception as e:
         logger.error(f"Error answering pre-checkout query: {e}")
         # Try to answer with error if something went wrong
@@ -32,60 +143,72 @@ async def precheckout_handler(update: Update, context: ContextTypes.DEFAULT_TYPE
             logger.error(f"Error sending pre-checkout error: {e2}")
 
 
-async def successful_payment(update: Update, context: ContextTypes.DEFAULT_TYPE, mongo_manager: MongoManager, bot_logger: BotLogger) -> None:
+async def successful_payment(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    mongo_manager: MongoManager,
+    bot_logger: BotLogger,
+    plan_registry: PlanRegistry = default_plan_registry,
+    validator: PrecheckoutValidator | None = None,
+) -> None:
     """Handle successful payments"""
-    user_info = mongo_manager.get_user_info(update)
+    user_info = get_user_info(update, context, mongo_manager)
     user_id = user_info["user_id"]
     lang = user_info["lang"]
     payment_info = update.message.successful_payment
     bot_name = context.bot.name
-    bot_logger.log_action(user_id, "successful_payment", bot_name, {"payload": payment_info.invoice_payload, "amount": payment_info.total_amount, "currency": payment_info.currency})
+    log_details = {"payload": payment_info.invoice_payload, "amount": payment_info.total_amount, "currency": payment_info.currency}
     logger.info(f"Payment info received: {payment_info}")
 
     # Determine which plan was purchased
-    plans = {"1month_sub": 30, "3months_sub": 90, "1year_sub": 365}
-
-    duration_days = plans.get(payment_info.invoice_payload, 0)
-    if duration_days == 0:
+    plan = plan_registry.get_by_payload(payment_info.invoice_payload)
+    if not plan:
         logger.warning(f"Invalid subscription plan: {payment_info.invoice_payload}")
+        bot_logger.log_action(user_id, "payment_issue", bot_name, log_details)
         await update.message.reply_text(
             t("subscription.payment_issue", lang, common=True)
         )
         return
 
-    # Add order to bot-specific database
-    mongo_manager.add_order(
+    current_time = datetime.now()
+    order_id = payment_info.provider_payment_charge_id
+    # Always set, unlike the provider charge id, which is empty for Telegram Stars
+    charge_id = payment_info.telegram_payment_charge_id
+
+    # Add order to bot-specific database and subscription payment to shared
+    # subscription database atomically, keyed by the Telegram charge id
+    premium_expiration = mongo_manager.record_subscription_payment(
         user_id,
         {
-            "order_id": payment_info.provider_payment_charge_id,
+            "order_id": order_id,
+            "telegram_payment_charge_id": charge_id,
             "amount": payment_info.total_amount,
             "currency": payment_info.currency,
             "status": "completed",
-            "date": datetime.now().isoformat(),
+            "date": current_time.isoformat(),
         },
-    )
-
-    # Calculate expiration date
-    expiration_date = datetime.now() + timedelta(days=duration_days)
-    current_time = datetime.now()
-
-    # Add subscription payment to shared subscription database
-    mongo_manager.add_subscription_payment(
-        user_id,
         {
-            "order_id": payment_info.provider_payment_charge_id,
+            "order_id": order_id,
+            "telegram_payment_charge_id": charge_id,
             "amount": payment_info.total_amount,
             "currency": payment_info.currency,
             "status": "completed",
             "date": current_time.isoformat(),
-            "expiration_date": expiration_date.isoformat(),
             "plan": payment_info.invoice_payload,
-            "duration_days": duration_days
-        }
+            "duration_days": plan.duration
+        },
     )
+    if premium_expiration is None:
+        logger.info(f"Payment {charge_id} of user {user_id} was already processed, skipping")
+        return
+    if validator is not None:
+        # The cached expiration no longer holds for the next pre-checkout
+        validator.invalidate(user_id)
+    bot_logger.log_action(user_id, "successful_payment", bot_name, log_details)
 
+    expiration_date = datetime.fromisoformat(premium_expiration)
     logger.info(
-        f"User {user_id} subscribed successfully. Premium expires on {expiration_date.isoformat()}."
+        f"User {user_id} subscribed successfully. Premium expires on {premium_expiration}."
     )
 
     await update.message.reply_text(
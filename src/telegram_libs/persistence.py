@@ -0,0 +1,248 @@
+import asyncio
+from copy import deepcopy
+from logging import getLogger
+from pymongo import DeleteOne, ReplaceOne, UpdateOne
+from telegram.ext import BasePersistence, PersistenceInput
+from telegram_libs.constants import DEBUG
+from telegram_libs.mongo import MongoManager
+
+logger = getLogger(__name__)
+
+USER_DATA = "user_data"
+CHAT_DATA = "chat_data"
+BOT_DATA = "bot_data"
+CONVERSATIONS = "conversations"
+BOT_DATA_ID = "bot_data"
+
+
+class MongoPersistence(BasePersistence):
+    """PTB persistence storing user, chat and bot data in the bot's database.
+
+    Nothing is loaded at startup except bot data and conversation states: a
+    user's or chat's data is read on the first update from them. The Application
+    hands every touched entry over each update_interval seconds; entries equal to
+    what was last loaded or written are skipped and the changed ones are written
+    with one unordered bulk write per collection.
+
+    Changes are written as $set/$unset of the changed top-level keys, so
+    processes sharing the collections and changing different keys of one entry
+    keep each other's changes. An entry is still read once per process: changes
+    other processes make afterwards are not seen until it is loaded again, and
+    concurrent changes of the same key are last writer wins.
+
+    Data is stored as BSON, so dictionary keys must be strings and values
+    BSON-encodable. Callback data is not stored.
+
+    Usage:
+        Application.builder().token(token).persistence(MongoPersistence(mongo_manager)).build()
+    """
+
+    def __init__(self, mongo_manager: MongoManager, update_interval: float = 60, store_data: PersistenceInput = None):
+        super().__init__(
+            store_data=store_data or PersistenceInput(callback_data=False),
+            update_interval=update_interval,
+        )
+        self.mongo_manager = mongo_manager
+        self.collections = {
+            kind: mongo_manager.db[f"persistence_{kind}_test" if DEBUG else f"persistence_{kind}"]
+            for kind in (USER_DATA, CHAT_DATA, BOT_DATA, CONVERSATIONS)
+        }
+        # Last loaded or written data per (kind, key), to detect changes
+        self._snapshots = {}
+        # In-flight loads per (kind, key), so concurrent updates load once
+        self._loading = {}
+        # Writes waiting for the next flush per kind: {key: (stored data or None if
+        # unknown, data) or None to delete}; conversations map to the new state
+        self._pending = {kind: {} for kind in self.collections}
+        self._flush_task = None
+        # Entries evicted from memory, whose next drop keeps the stored data
+        self._evicted = {USER_DATA: set(), CHAT_DATA: set()}
+        self.writes = 0
+
+    # Loading
+
+    async def get_user_data(self) -> dict:
+        return {}
+
+    async def get_chat_data(self) -> dict:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        document = await asyncio.to_thread(self.collections[BOT_DATA].find_one, {"_id": BOT_DATA_ID})
+        data = document["data"] if document else {}
+        self._snapshots[(BOT_DATA, BOT_DATA_ID)] = deepcopy(data)
+        return data
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def get_conversations(self, name: str) -> dict:
+        documents = await asyncio.to_thread(
+            lambda: list(self.collections[CONVERSATIONS].find({"_id.name": name}))
+        )
+        return {tuple(document["_id"]["key"]): document["state"] for document in documents}
+
+    def _load(self, kind: str, key: int) -> dict:
+        document = self.collections[kind].find_one({"_id": key})
+        return document["data"] if document else {}
+
+    async def _refresh(self, kind: str, key: int, data: dict) -> None:
+        """Fill data from the database on the first touch of key."""
+        if (kind, key) in self._snapshots:
+            return
+        loading = self._loading.get((kind, key))
+        if loading is None:
+            loading = self._loading[(kind, key)] = asyncio.ensure_future(
+                asyncio.to_thread(self._load, kind, key)
+            )
+            try:
+                stored = await loading
+            finally:
+                del self._loading[(kind, key)]
+            data.update(stored)
+            self._snapshots[(kind, key)] = deepcopy(data)
+        else:
+            await loading
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        await self._refresh(USER_DATA, user_id, user_data)
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        await self._refresh(CHAT_DATA, chat_id, chat_data)
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
+
+    def forget(self, kind: str, key: int) -> None:
+        """Stop tracking an entry evicted from memory; it is loaded again on its next touch.
+
+        The Application's next drop of the entry then keeps its stored data.
+        """
+        self._snapshots.pop((kind, key), None)
+        self._evicted[kind].add(key)
+
+    def _drop(self, kind: str, key: int) -> None:
+        if key in self._evicted[kind]:
+            self._evicted[kind].discard(key)
+            return
+        self._mark(kind, key, None)
+
+    # Writing
+
+    def _mark(self, kind: str, key, data) -> None:
+        snapshot = self._snapshots.get((kind, key))
+        if data is not None and snapshot == data:
+            return
+        pending = self._pending[kind]
+        if data is None:
+            pending[key] = None
+        elif key in pending:
+            # Diff against what the database holds, not the unwritten change
+            pending[key] = (pending[key][0] if pending[key] is not None else None, data)
+        else:
+            pending[key] = (snapshot, data)
+        # A dropped entry is known to be empty, so it is not loaded again before
+        # its delete is written
+        self._snapshots[(kind, key)] = {} if data is None else data
+        self._schedule_flush()
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        self._mark(USER_DATA, user_id, data)
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        self._mark(CHAT_DATA, chat_id, data)
+
+    async def update_bot_data(self, data: dict) -> None:
+        self._mark(BOT_DATA, BOT_DATA_ID, data)
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def update_conversation(self, name: str, key: tuple, new_state: object | None) -> None:
+        self._pending[CONVERSATIONS][(name, key)] = new_state
+        self._schedule_flush()
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._drop(USER_DATA, user_id)
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        self._drop(CHAT_DATA, chat_id)
+
+    @staticmethod
+    def _diff(stored: dict | None, data: dict) -> dict | None:
+        """$set/$unset update of the changed top-level keys, None to replace the whole document."""
+        if stored is None or not all(
+            isinstance(key, str) and "." not in key and not key.startswith("$") for key in stored.keys() | data.keys()
+        ):
+            return None
+        update = {}
+        changed = {f"data.{key}": value for key, value in data.items() if key not in stored or stored[key] != value}
+        if changed:
+            update["$set"] = changed
+        removed = {f"data.{key}": "" for key in stored.keys() - data.keys()}
+        if removed:
+            update["$unset"] = removed
+        return update
+
+    def _write(self, pending: dict) -> None:
+        for kind, entries in pending.items():
+            requests = []
+            for key, entry in entries.items():
+                if kind == CONVERSATIONS:
+                    name, conversation_key = key
+                    document_id = {"name": name, "key": list(conversation_key)}
+                    if entry is None:
+                        requests.append(DeleteOne({"_id": document_id}))
+                    else:
+                        requests.append(ReplaceOne({"_id": document_id}, {"_id": document_id, "state": entry}, upsert=True))
+                    continue
+                if entry is None:
+                    requests.append(DeleteOne({"_id": key}))
+                    continue
+                stored, data = entry
+                update = self._diff(stored, data)
+                if update is None:
+                    requests.append(ReplaceOne({"_id": key}, {"_id": key, "data": data}, upsert=True))
+                elif update:
+                    requests.append(UpdateOne({"_id": key}, update, upsert=True))
+            if requests:
+                self.collections[kind].bulk_write(requests, ordered=False)
+                self.writes += len(requests)
+
+    def _restore(self, failed: dict) -> None:
+        """Put the entries of a failed write back, merged with the ones marked since."""
+        for kind, entries in failed.items():
+            pending = self._pending[kind]
+            for key, entry in entries.items():
+                if key not in pending:
+                    pending[key] = entry
+                elif kind != CONVERSATIONS and pending[key] is not None:
+                    # The newer change was diffed against the failed write
+                    pending[key] = (entry[0] if entry is not None else None, pending[key][1])
+
+    def _schedule_flush(self) -> None:
+        if self._flush_task is None:
+            # Runs once the Application has handed over all entries of this round
+            self._flush_task = asyncio.create_task(self._flush_pending())
+
+    async def _flush_pending(self, raise_errors: bool = False) -> None:
+        pending, self._pending = self._pending, {kind: {} for kind in self.collections}
+        try:
+            await asyncio.to_thread(self._write, pending)
+        except Exception:
+            self._restore(pending)
+            self._flush_task = None
+            if raise_errors:
+                raise
+            logger.exception("Persistence flush failed, retrying with the next one")
+            return
+        self._flush_task = None
+        if not raise_errors and any(self._pending.values()):
+            # Entries handed over while writing
+            self._schedule_flush()
+
+    async def flush(self) -> None:
+        while self._flush_task is not None:
+            await self._flush_task
+        if any(self._pending.values()):
+            await self._flush_pending(raise_errors=True)
@@ -0,0 +1,178 @@
+from dataclasses import dataclass, fields
+from logging import getLogger
+from types import MappingProxyType
+from typing import Callable
+from telegram import LabeledPrice
+from telegram_libs.constants import DEBUG, SUBSCRIPTION_DB_NAME
+from telegram_libs.mongo import MongoManager
+
+logger = getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Plan:
+    """Subscription plan sold through Telegram Stars invoices."""
+
+    callback_data: str
+    payload: str
+    title: str
+    description: str
+    price: int
+    duration: int
+    currency: str = "XTR"
+
+
+DEFAULT_PLANS = (
+    Plan(
+        callback_data="sub_1month",
+        payload="1month_sub",
+        title="1 Month Subscription",
+        description="Premium access for 1 month",
+        price=400 if not DEBUG else 1,
+        duration=30,
+    ),
+    Plan(
+        callback_data="sub_3months",
+        payload="3months_sub",
+        title="3 Months Subscription",
+        description="Premium access for 3 months",
+        price=1100 if not DEBUG else 1,
+        duration=90,
+    ),
+    Plan(
+        callback_data="sub_1year",
+        payload="1year_sub",
+        title="1 Year Subscription",
+        description="Premium access for 1 year",
+        price=3600 if not DEBUG else 1,
+        duration=365,
+    ),
+)
+
+_PLAN_FIELDS = {field.name for field in fields(Plan)}
+
+_load_callbacks = []
+
+
+def on_load(callback: Callable[[], None]) -> Callable[[], None]:
+    """Register a callback run after any registry loads plans, e.g. to clear keyboard caches"""
+    _load_callbacks.append(callback)
+    return callback
+
+
+def _plan_from_document(document: dict) -> Plan:
+    """Build a plan from a plans collection document, raising ValueError if it is invalid."""
+    try:
+        plan = Plan(**{key: value for key, value in document.items() if key in _PLAN_FIELDS})
+    except TypeError as e:
+        raise ValueError(str(e)) from e
+    for field in fields(Plan):
+        value = getattr(plan, field.name)
+        if not isinstance(value, field.type) or isinstance(value, bool):
+            raise ValueError(f"{field.name} must be {field.type.__name__}, got {value!r}")
+    if plan.price <= 0 or plan.duration <= 0:
+        raise ValueError(f"price and duration must be positive, got {plan.price} and {plan.duration}")
+    return plan
+
+
+class PlanRegistry:
+    """Subscription plans indexed by callback data and invoice payload.
+
+    Plans come from code or from a Mongo collection. Lookups, price lists and invoice
+    parameters are built once per load, so a price change only needs refresh().
+
+    Plans removed from the collection, or stored with "active": false, are no
+    longer offered but stay resolvable by payload, so invoices issued before the
+    change can still be paid.
+    """
+
+    def __init__(self, plans: tuple = DEFAULT_PLANS, collection=None):
+        self.collection = collection
+        self._load(plans)
+
+    @classmethod
+    def from_mongo(cls, mongo_manager: MongoManager) -> "PlanRegistry":
+        """Create a registry backed by the shared plans collection, falling back to the default plans."""
+        db = mongo_manager.client[SUBSCRIPTION_DB_NAME]
+        registry = cls(collection=db["plans_test"] if DEBUG else db["plans"])
+        registry.refresh()
+        return registry
+
+    def _load(self, plans, inactive: tuple = ()) -> None:
+        plans = tuple(plans)
+        invoice_params = {}
+        for plan in plans:
+            prices = (LabeledPrice(plan.title, plan.price),)
+            invoice_params[plan.callback_data] = MappingProxyType({
+                "title": plan.title,
+                "description": plan.description,
+                "payload": plan.payload,
+                "provider_token": "",
+                "currency": plan.currency,
+                "prices": prices,
+                "start_parameter": "subscription",
+            })
+        # Plans of earlier loads stay payable, current ones take precedence
+        by_payload = dict(self._state[2]) if hasattr(self, "_state") else {}
+        by_payload.update({plan.payload: plan for plan in inactive})
+        by_payload.update({plan.payload: plan for plan in plans})
+        # Buttons of earlier loads may still be in chats
+        callbacks = self._state[4] if hasattr(self, "_state") else frozenset()
+        callbacks = callbacks.union(plan.callback_data for plan in (*plans, *inactive))
+        # Swap all indexes in one assignment so readers never see a half-loaded registry
+        self._state = (
+            plans,
+            {plan.callback_data: plan for plan in plans},
+            by_payload,
+            invoice_params,
+            callbacks,
+        )
+        for callback in _load_callbacks:
+            callback()
+
+    def refresh(self) -> None:
+        """Reload plans from the collection.
+
+        Invalid documents are logged and skipped; the current plans are kept if no
+        valid active plan is left.
+        """
+        if self.collection is None:
+            return
+        docs = list(self.collection.find({}, {"_id": 0}).sort("duration", 1))
+        plans, inactive = [], []
+        for doc in docs:
+            try:
+                plan = _plan_from_document(doc)
+            except ValueError as e:
+                logger.error(f"Skipping invalid plan document {doc!r}: {e}")
+                continue
+            (plans if doc.get("active", True) else inactive).append(plan)
+        if not plans:
+            logger.warning("Plans collection has no valid active plans, keeping current plans")
+            return
+        self._load(plans, inactive)
+
+    def __iter__(self):
+        return iter(self._state[0])
+
+    def get_by_callback(self, callback_data: str) -> Plan | None:
+        """Get plan by the callback data of its keyboard button."""
+        return self._state[1].get(callback_data)
+
+    def is_plan_callback(self, callback_data: str) -> bool:
+        """Whether callback data belongs to a plan button, including plans no longer offered.
+
+        Use as the pattern of the subscription CallbackQueryHandler.
+        """
+        return callback_data in self._state[4]
+
+    def get_by_payload(self, payload: str) -> Plan | None:
+        """Get plan by its invoice payload, including plans no longer offered."""
+        return self._state[2].get(payload)
+
+    def get_invoice_params(self, plan: Plan) -> MappingProxyType:
+        """Keyword arguments for Bot.send_invoice, except chat_id."""
+        return self._state[3][plan.callback_data]
+
+
+default_plan_registry = PlanRegistry()
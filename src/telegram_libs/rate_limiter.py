@@ -0,0 +1,229 @@
+import asyncio
+import heapq
+import warnings
+from datetime import timedelta
+from itertools import count
+from logging import getLogger
+from time import monotonic
+from typing import Any, Callable, Coroutine
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+logger = getLogger(__name__)
+
+# Lower values are sent first
+PRIORITY_PAYMENT = 0
+PRIORITY_REPLY = 1
+PRIORITY_BULK = 2
+
+ENDPOINT_PRIORITIES = {
+    "answerPreCheckoutQuery": PRIORITY_PAYMENT,
+    "sendInvoice": PRIORITY_PAYMENT,
+    "refundStarPayment": PRIORITY_PAYMENT,
+}
+# Not counted against any limit
+UNLIMITED_ENDPOINTS = frozenset({"getUpdates", "getMe", "setWebhook", "deleteWebhook"})
+
+
+def get_retry_after_seconds(exc: RetryAfter) -> float:
+    """Seconds to wait after a RetryAfter, on any python-telegram-bot 22.x.
+
+    retry_after is an int before 22.2 and, depending on the time period setting,
+    an int or a timedelta after it, where reading it warns of the migration.
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", DeprecationWarning)
+        retry_after = exc.retry_after
+    return retry_after.total_seconds() if isinstance(retry_after, timedelta) else float(retry_after)
+
+
+def parse_chat_id(chat_id: Any) -> int | str:
+    """Chat ids as ints, also when passed as numeric strings; @usernames are kept."""
+    if isinstance(chat_id, str) and chat_id.lstrip("-").isdigit():
+        return int(chat_id)
+    return chat_id
+
+
+class TokenBucket:
+    """Token bucket handing out send slots as reservations."""
+
+    __slots__ = ("rate", "capacity", "_tokens", "_updated_at")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = monotonic()
+
+    def _refill(self) -> None:
+        now = monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def delay(self) -> float:
+        """Seconds until a token is available."""
+        self._refill()
+        return max(0.0, (1 - self._tokens) / self.rate)
+
+    def reserve(self) -> float:
+        """Take a token, possibly ahead of time; returns the seconds to wait before using it."""
+        delay = self.delay()
+        self._tokens -= 1
+        return delay
+
+    @property
+    def idle(self) -> bool:
+        self._refill()
+        return self._tokens >= self.capacity
+
+
+class FloodControlRateLimiter(BaseRateLimiter[dict]):
+    """Keep a bot's Bot API calls within Telegram's flood limits.
+
+    Requests wait for a slot in their chat's bucket (about 1 msg/s in private chats,
+    20 msg/min in groups) and then queue for the bot-wide bucket (about 30 msg/s),
+    which is handed out by priority. Payment calls are sent first; bulk messages
+    such as broadcasts pass rate_limit_args={"priority": PRIORITY_BULK}. A RetryAfter
+    pauses all sending for the requested time before the call is retried.
+
+    Usage:
+        Application.builder().token(token).rate_limiter(FloodControlRateLimiter()).build()
+    """
+
+    def __init__(
+        self,
+        overall_rate: float = 30,
+        chat_rate: float = 1,
+        group_rate: float = 20 / 60,
+        chat_burst: int = 3,
+        max_retries: int = 3,
+        max_chat_buckets: int = 10000,
+    ):
+        self.overall_bucket = TokenBucket(overall_rate, overall_rate)
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.max_chat_buckets = max_chat_buckets
+        self._chat_buckets = {}
+        self._waiting = []
+        self._sequence = count()
+        self._wakeup = asyncio.Event()
+        self._dispatcher = None
+        self._paused_until = 0.0
+        self.max_queue_depth = 0
+        self.retry_after_count = 0
+        self.sent_count = 0
+
+    async def initialize(self) -> None:
+        if self._dispatcher is None:
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def shutdown(self) -> None:
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiting)
+
+    @property
+    def metrics(self) -> dict:
+        by_priority = {}
+        for priority, _, future in self._waiting:
+            if not future.done():
+                by_priority[priority] = by_priority.get(priority, 0) + 1
+        return {
+            "queue_depth": self.queue_depth,
+            "queue_depth_by_priority": by_priority,
+            "max_queue_depth": self.max_queue_depth,
+            "retry_after_count": self.retry_after_count,
+            "paused_for": max(0.0, self._paused_until - monotonic()),
+            "sent": self.sent_count,
+        }
+
+    def _chat_bucket(self, chat_id: Any) -> TokenBucket:
+        chat_id = parse_chat_id(chat_id)
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= self.max_chat_buckets:
+                self._chat_buckets = {
+                    key: value for key, value in self._chat_buckets.items() if not value.idle
+                }
+            # Groups and channels have negative ids or @usernames, private chats positive ids
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            rate = self.group_rate if is_group else self.chat_rate
+            bucket = self._chat_buckets[chat_id] = TokenBucket(rate, self.chat_burst)
+        return bucket
+
+    async def _dispatch(self) -> None:
+        """Hand out overall slots to waiting requests in priority order."""
+        while True:
+            if not self._waiting:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            delay = max(self._paused_until - monotonic(), self.overall_bucket.delay())
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            _, _, future = heapq.heappop(self._waiting)
+            if future.done():
+                # The caller was cancelled
+                continue
+            self.overall_bucket.reserve()
+            future.set_result(None)
+
+    async def _acquire_overall(self, priority: int) -> None:
+        if self._dispatcher is None:
+            await self.initialize()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiting, (priority, next(self._sequence), future))
+        self.max_queue_depth = max(self.max_queue_depth, len(self._waiting))
+        self._wakeup.set()
+        await future
+
+    def _get_priority(self, endpoint: str, rate_limit_args: dict | int | None) -> int:
+        if isinstance(rate_limit_args, int):
+            return rate_limit_args
+        if rate_limit_args and "priority" in rate_limit_args:
+            return rate_limit_args["priority"]
+        return ENDPOINT_PRIORITIES.get(endpoint, PRIORITY_REPLY)
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, bool | dict | list[dict]]],
+        args: Any,
+        kwargs: dict[str, Any],
+        endpoint: str,
+        data: dict[str, Any],
+        rate_limit_args: dict | int | None,
+    ) -> bool | dict | list[dict]:
+        if endpoint in UNLIMITED_ENDPOINTS:
+            return await callback(*args, **kwargs)
+
+        priority = self._get_priority(endpoint, rate_limit_args)
+        chat_id = data.get("chat_id")
+        for attempt in range(self.max_retries + 1):
+            if chat_id is not None:
+                delay = self._chat_bucket(chat_id).reserve()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            await self._acquire_overall(priority)
+            try:
+                result = await callback(*args, **kwargs)
+            except RetryAfter as exc:
+                retry_after = get_retry_after_seconds(exc)
+                self.retry_after_count += 1
+                self._paused_until = max(self._paused_until, monotonic() + retry_after)
+                if attempt == self.max_retries:
+                    raise
+                logger.warning(f"Flood control on {endpoint}, retrying in {retry_after}s")
+                continue
+            self.sent_count += 1
+            return result
@@ -0,0 +1,150 @@
+import asyncio
+import signal
+from dataclasses import dataclass, field
+from logging import getLogger
+from typing import Callable
+import httpx
+from telegram import Update
+from telegram.ext import Application, BaseUpdateProcessor
+from telegram.request import HTTPXRequest
+from telegram_libs.handlers import register_common_handlers
+from telegram_libs.logger import BotLogger
+from telegram_libs.middleware import MiddlewareApplication
+from telegram_libs.mongo import MongoManager
+from telegram_libs.tracing import TracedRequestMixin, install_tracing
+from telegram_libs.rate_limiter import FloodControlRateLimiter
+from telegram_libs.persistence import MongoPersistence
+from telegram_libs.eviction import DataEvictor
+
+logger = getLogger(__name__)
+
+
+class SharedHTTPXPool:
+    """One httpx client, and so one connection pool, for the Bot API calls of all hosted bots."""
+
+    def __init__(self, connection_pool_size: int = 512, timeout: float = 5.0):
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(timeout),
+            limits=httpx.Limits(max_connections=connection_pool_size),
+        )
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+
+class SharedHTTPXRequest(TracedRequestMixin, HTTPXRequest):
+    """HTTPXRequest sending through a SharedHTTPXPool.
+
+    The pool outlives the applications, so initialize/shutdown leave the client alone.
+    Bot API calls are traced when tracing is enabled.
+    """
+
+    __slots__ = ("_pool",)
+
+    def __init__(self, pool: SharedHTTPXPool):
+        self._pool = pool
+        super().__init__()
+
+    def _build_client(self) -> httpx.AsyncClient:
+        return self._pool.client
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+
+@dataclass
+class BotConfig:
+    """Configuration of one hosted bot."""
+
+    token: str
+    bot_name: str
+    mongo_database_name: str
+    user_schema: dict = None
+    concurrent_updates: int | BaseUpdateProcessor = 1
+    # Extra keyword arguments for register_common_handlers
+    handler_options: dict = field(default_factory=dict)
+    # Registers the bot's own handlers
+    setup: Callable[[Application, MongoManager], None] = None
+    # Flood limits apply per bot token
+    rate_limiter: bool = True
+    # Keep user, chat and bot data in the bot's database across restarts
+    persistence: bool = True
+    # Drop user and chat data of idle users from memory
+    data_eviction: bool = True
+
+
+class BotHost:
+    """Run several bots in one process and event loop.
+
+    All bots share the Mongo client registry, one BotLogger buffer and one HTTP
+    connection pool, so memory and connections grow with load rather than with
+    the number of bots.
+    """
+
+    def __init__(self, configs: list, connection_pool_size: int = 512, bot_logger: BotLogger = None):
+        self.pool = SharedHTTPXPool(connection_pool_size)
+        self.bot_logger = bot_logger or BotLogger(batch_size=100)
+        self.applications = [self.build_application(config) for config in configs]
+
+    def build_application(self, config: BotConfig) -> Application:
+        mongo_manager = MongoManager(
+            mongo_database_name=config.mongo_database_name, user_schema=config.user_schema
+        )
+        builder = (
+            install_tracing(Application.builder())
+            .application_class(MiddlewareApplication)
+            .token(config.token)
+            .request(SharedHTTPXRequest(self.pool))
+            .get_updates_request(SharedHTTPXRequest(self.pool))
+            .concurrent_updates(config.concurrent_updates)
+        )
+        if config.rate_limiter:
+            builder = builder.rate_limiter(FloodControlRateLimiter())
+        if config.persistence:
+            builder = builder.persistence(MongoPersistence(mongo_manager))
+        app = builder.build()
+        register_common_handlers(
+            app, config.bot_name, mongo_manager, bot_logger=self.bot_logger, **config.handler_options
+        )
+        if config.data_eviction:
+            DataEvictor().install(app)
+        if config.setup:
+            config.setup(app, mongo_manager)
+        return app
+
+    async def start(self) -> None:
+        for app in self.applications:
+            await app.initialize()
+            await app.start()
+            await app.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+            logger.info(f"Started {app.bot.name}")
+
+    async def stop(self) -> None:
+        for app in reversed(self.applications):
+            if app.updater.running:
+                await app.updater.stop()
+            if app.running:
+                await app.stop()
+            await app.shutdown()
+        await self.bot_logger.aflush()
+        await self.pool.aclose()
+
+    async def run(self) -> None:
+        """Run all bots until SIGINT or SIGTERM."""
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop_event.set)
+        try:
+            await self.start()
+            await stop_event.wait()
+        finally:
+            await self.stop()
+
+
+def run_bots(configs: list, connection_pool_size: int = 512) -> None:
+    """Entry point hosting all configured bots in this process."""
+    asyncio.run(BotHost(configs, connection_pool_size).run())
@@ -0,0 +1,188 @@
+import json
+from datetime import datetime
+from logging import getLogger
+from queue import Full, Queue
+from threading import Lock, Thread
+from time import monotonic
+from pymongo import monitoring
+from pymongo.errors import CollectionInvalid, PyMongoError
+from telegram_libs.constants import DEBUG, LOGS_DB_NAME, SLOW_OP_THRESHOLD_MS
+
+logger = getLogger(__name__)
+
+SLOW_OPS_COLLECTION = "slow_ops_test" if DEBUG else "slow_ops"
+# Commands whose plan explain can show
+EXPLAINABLE_COMMANDS = frozenset({"find", "aggregate", "count", "distinct", "update", "delete", "findAndModify"})
+# Driver and session fields that explain does not accept
+_COMMAND_META_FIELDS = frozenset({
+    "lsid", "$clusterTime", "$db", "txnNumber", "autocommit", "startTransaction", "readConcern",
+    "writeConcern", "$readPreference", "apiVersion", "apiStrict", "apiDeprecationErrors",
+    "maxTimeMS", "comment", "cursor",
+})
+
+
+def redact(value):
+    """Shape of a filter: keys and operators are kept, values replaced by "?"."""
+    if isinstance(value, dict):
+        return {key: redact(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        # $in lists and pipelines: one element shows the shape
+        return [redact(value[0])] if value else []
+    return "?"
+
+
+def get_command_shape(command_name: str, command: dict) -> dict:
+    """The redacted query part of a command."""
+    if command_name in ("find", "count", "findAndModify", "distinct"):
+        return {"filter": redact(command.get("filter", command.get("query", {})))}
+    if command_name == "aggregate":
+        return {"pipeline": [redact(stage) for stage in command.get("pipeline", [])]}
+    if command_name == "update":
+        return {"filter": [redact(update.get("q", {})) for update in command.get("updates", [])[:1]]}
+    if command_name == "delete":
+        return {"filter": [redact(delete.get("q", {})) for delete in command.get("deletes", [])[:1]]}
+    return {}
+
+
+def summarize_plan(explain: dict) -> dict:
+    """Stages and indexes of the winning plan, e.g. COLLSCAN for a missing index."""
+    planner = explain.get("queryPlanner") or {}
+    if not planner and explain.get("stages"):
+        # Aggregations report the planner of their $cursor stage
+        planner = explain["stages"][0].get("$cursor", {}).get("queryPlanner", {})
+    stages, indexes = [], []
+    pending = [planner.get("winningPlan", {})]
+    while pending:
+        plan = pending.pop()
+        # Newer servers wrap the plan in queryPlan
+        plan = plan.get("queryPlan", plan)
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        if "indexName" in plan:
+            indexes.append(plan["indexName"])
+        pending.extend(plan.get("inputStages", []))
+        if "inputStage" in plan:
+            pending.append(plan["inputStage"])
+    return {"stages": stages, "indexes": indexes, "winning_plan": planner.get("winningPlan")}
+
+
+class SlowOpListener(monitoring.CommandListener):
+    """Sample Mongo operations slower than threshold_ms to a capped collection.
+
+    The listener only keeps the command of operations in flight. For a slow one
+    it queues the sample; a background thread runs explain on it and writes the
+    redacted filter shape, duration and plan summary to the slow_ops collection.
+    Each shape is sampled at most once per sample_interval seconds, and samples
+    are dropped when the queue is full, so slow periods do not cause more load.
+    """
+
+    def __init__(
+        self,
+        threshold_ms: float = SLOW_OP_THRESHOLD_MS,
+        sample_interval: float = 60,
+        capped_size: int = 16 * 1024 * 1024,
+        max_queued: int = 100,
+        uri: str = None,
+    ):
+        self.threshold_micros = threshold_ms * 1000
+        self.sample_interval = sample_interval
+        self.capped_size = capped_size
+        self.uri = uri
+        self.queue = Queue(maxsize=max_queued)
+        self.sampled = 0
+        self.dropped = 0
+        self._in_flight = {}
+        self._last_sampled = {}
+        self._lock = Lock()
+        self._worker = None
+        self._collection = None
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        if event.command_name not in EXPLAINABLE_COMMANDS:
+            return
+        if event.command.get(event.command_name) == SLOW_OPS_COLLECTION:
+            return
+        self._in_flight[event.request_id] = (event.database_name, event.command)
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        started = self._in_flight.pop(event.request_id, None)
+        if started is None or event.duration_micros < self.threshold_micros:
+            return
+        database_name, command = started
+        shape = get_command_shape(event.command_name, command)
+        collection = command.get(event.command_name)
+        key = json.dumps([database_name, collection, event.command_name, shape], sort_keys=True, default=str)
+        now = monotonic()
+        with self._lock:
+            if now - self._last_sampled.get(key, -self.sample_interval) < self.sample_interval:
+                return
+            self._last_sampled[key] = now
+        sample = {
+            "timestamp": datetime.now().isoformat(),
+            "database": database_name,
+            "collection": collection,
+            "command": event.command_name,
+            "shape": shape,
+            "duration_ms": event.duration_micros / 1000,
+        }
+        try:
+            self.queue.put_nowait((sample, command))
+        except Full:
+            self.dropped += 1
+            return
+        self._ensure_worker()
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self._in_flight.pop(event.request_id, None)
+
+    def _ensure_worker(self) -> None:
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = Thread(target=self._run, daemon=True, name="slow-op-explain")
+                self._worker.start()
+
+    def _get_client(self):
+        from telegram_libs.mongo import get_mongo_client
+
+        return get_mongo_client(self.uri) if self.uri else get_mongo_client()
+
+    def _get_collection(self):
+        if self._collection is None:
+            db = self._get_client()[LOGS_DB_NAME]
+            try:
+                db.create_collection(SLOW_OPS_COLLECTION, capped=True, size=self.capped_size)
+            except CollectionInvalid:
+                pass
+            self._collection = db[SLOW_OPS_COLLECTION]
+        return self._collection
+
+    def explain(self, database_name: str, command_name: str, command: dict) -> dict:
+        explained = {key: value for key, value in command.items() if key not in _COMMAND_META_FIELDS}
+        if command_name == "aggregate":
+            explained["cursor"] = {}
+        result = self._get_client()[database_name].command({"explain": explained, "verbosity": "queryPlanner"})
+        return summarize_plan(result)
+
+    def process(self, sample: dict, command: dict) -> None:
+        """Explain one sample and store it."""
+        try:
+            sample["plan"] = self.explain(sample["database"], sample["command"], command)
+        except PyMongoError as e:
+            sample["plan_error"] = str(e)
+        self._get_collection().insert_one(sample)
+        self.sampled += 1
+
+    def _run(self) -> None:
+        while True:
+            sample, command = self.queue.get()
+            try:
+                self.process(sample, command)
+            except Exception:
+                logger.exception("Failed to record slow operation")
+            finally:
+                self.queue.task_done()
+
+
+def get_slow_op_listeners(uri: str = None) -> list:
+    """Listeners for a new Mongo client, none unless SLOW_OP_THRESHOLD_MS is set."""
+    return [SlowOpListener(uri=uri)] if SLOW_OP_THRESHOLD_MS > 0 else []
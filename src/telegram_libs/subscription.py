@@ -1,44 +1,25 @@
-from datetime import datetime, timedelta
-from telegram import Update, LabeledPrice, InlineKeyboardMarkup, InlineKeyboardButton
+import asyncio
+from datetime import datetime
+from logging import getLogger
+from telegram import Update
+from telegram.error import Forbidden, TelegramError
 from telegram.ext import ContextTypes
-from telegram_libs.constants import BOTS_AMOUNT, DEBUG
 from telegram_libs.mongo import MongoManager
 from telegram_libs.translation import t
 from telegram_libs.logger import BotLogger
+from telegram_libs.middleware import get_user_info
+from telegram_libs.plans import PlanRegistry, default_plan_registry
+from telegram_libs.utils import get_subscription_keyboard, get_subscription_markup
+from telegram_libs.rate_limiter import PRIORITY_BULK
 
-
-async def get_subscription_keyboard(update: Update, lang: str) -> InlineKeyboardMarkup:
-    """Get subscription keyboard
-
-    Args:
-        update (Update): Update object
-        lang (str): Language code
-
-    Returns:
-        InlineKeyboardMarkup: Inline keyboard markup
-    """
-    await update.message.reply_text(
-        t("subscription.info", lang, common=True).format(int(BOTS_AMOUNT) - 1)
-    )
-    return InlineKeyboardMarkup([
-        [
-            InlineKeyboardButton(
-                t("subscription.plans.1month", lang, common=True), callback_data="sub_1month"
-            ),
-            InlineKeyboardButton(
-                t("subscription.plans.3months", lang, common=True), callback_data="sub_3months"
-            ),
-        ],
-        [
-            InlineKeyboardButton(
-                t("subscription.plans.1year", lang, common=True), callback_data="sub_1year"
-            ),
-        ],
-    ])
+logger = getLogger(__name__)
 
 
 async def subscription_callback(
-    update: Update, context: ContextTypes.DEFAULT_TYPE, bot_logger: BotLogger
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    bot_logger: BotLogger,
+    plan_registry: PlanRegistry = default_plan_registry,
 ) -> None:
     """Handle subscription button clicks"""
     query = update.callback_query
@@ -46,64 +27,34 @@ async def subscription_callback(
     bot_name = context.bot.name
     bot_logger.log_action(user_id, "subscription_button_click", bot_name, {"plan": query.data})
     await query.answer()
-    plan = query.data
-
-    # Define subscription plans
-    plans = {
-        "sub_1month": {
-            "title": "1 Month Subscription",
-            "description": "Premium access for 1 month",
-            "payload": "1month_sub",
-            "price": 400 if not DEBUG else 1,
-            "duration": 30,
-        },
-        "sub_3months": {
-            "title": "3 Months Subscription",
-            "description": "Premium access for 3 months",
-            "payload": "3months_sub",
-            "price": 1100 if not DEBUG else 1,
-            "duration": 90,
-        },
-        "sub_1year": {
-            "title": "1 Year Subscription",
-            "description": "Premium access for 1 year",
-            "payload": "1year_sub",
-            "price": 3600 if not DEBUG else 1,
-            "duration": 365,
-        },
-    }
 
-    selected_plan = plans.get(plan)
+    selected_plan = plan_registry.get_by_callback(query.data)
     if not selected_plan:
         await query.message.reply_text("Invalid subscription option")
         return
 
     # Create invoice for Telegram Stars
-    prices = [LabeledPrice(selected_plan["title"], selected_plan["price"])]
-
     await context.bot.send_invoice(
         chat_id=query.message.chat_id,
-        title=selected_plan["title"],
-        description=selected_plan["description"],
-        payload=selected_plan["payload"],
-        provider_token="",
-        currency="XTR",
-        prices=prices,
-        start_parameter="subscription",
+        **plan_registry.get_invoice_params(selected_plan),
     )
 
 
 async def subscribe_command(
-    update: Update, context: ContextTypes.DEFAULT_TYPE, mongo_manager: MongoManager, bot_logger: BotLogger
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    mongo_manager: MongoManager,
+    bot_logger: BotLogger,
+    plan_registry: PlanRegistry = default_plan_registry,
 ) -> None:
     """Show subscription options"""
-    user_info = mongo_manager.get_user_info(update)
+    user_info = get_user_info(update, context, mongo_manager)
     user_id = user_info["user_id"]
     lang = user_info["lang"]
     bot_name = context.bot.name
     bot_logger.log_action(user_id, "subscribe_command", bot_name)
 
-    reply_markup = await get_subscription_keyboard(update, lang)
+    reply_markup = await get_subscription_keyboard(update, lang, plan_registry)
 
     await update.message.reply_text(
         t("subscription.choose_plan", lang, common=True), reply_markup=reply_markup
@@ -114,7 +65,7 @@ async def check_subscription_command(
     update: Update, context: ContextTypes.DEFAULT_TYPE, mongo_manager: MongoManager
 ):
     """Check user's subscription status"""
-    user_info = mongo_manager.get_user_info(update)
+    user_info = get_user_info(update, context, mongo_manager)
     user_id = user_info["user_id"]
     lang = user_info["lang"]
 
@@ -131,7 +82,69 @@ async def check_subscription_command(
                 )
             )
         else:
-            mongo_manager.update_subscription(user_id, {"is_premium": False})
+            # Downgrading is left to expire_subscriptions_job
             await update.message.reply_text(t("subscription.expired", lang))
     else:
         await update.message.reply_text(t("subscription.none", lang))
+
+
+async def expire_subscriptions_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Job queue callback downgrading expired subscriptions in one bulk update
+
+    Expects the MongoManager as the job data.
+    """
+    mongo_manager: MongoManager = context.job.data
+    expired = await asyncio.to_thread(mongo_manager.expire_subscriptions)
+    logger.info(f"Subscription sweeper downgraded {expired} expired subscriptions")
+
+
+async def expiry_reminder_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Job queue callback reminding users whose subscription expires soon
+
+    Expects job data {"mongo_manager": MongoManager, "days": float, "batch_size": int,
+    "plan_registry": PlanRegistry}.
+    Only users of this bot are reminded; the reminder is rendered once per language
+    and sent in batches at bulk priority through the bot's rate limiter. Reminded
+    users (and users who blocked the bot) are marked with one bulk update per batch,
+    so reruns skip them until they renew.
+    """
+    mongo_manager: MongoManager = context.job.data["mongo_manager"]
+    days = context.job.data["days"]
+    batch_size = context.job.data.get("batch_size", 500)
+    plan_registry = context.job.data.get("plan_registry", default_plan_registry)
+
+    expiring = await asyncio.to_thread(mongo_manager.get_expiring_subscriptions, days)
+    if not expiring:
+        return
+    languages = await asyncio.to_thread(
+        mongo_manager.get_user_languages, [subscription["user_id"] for subscription in expiring]
+    )
+    messages = {
+        lang: (t("subscription.expiry_reminder", lang, common=True, days=days), get_subscription_markup(lang, plan_registry))
+        for lang in set(languages.values())
+    }
+
+    async def send(user_id: int) -> bool:
+        text, reply_markup = messages[languages[user_id]]
+        try:
+            await context.bot.send_message(
+                chat_id=user_id,
+                text=text,
+                reply_markup=reply_markup,
+                rate_limit_args={"priority": PRIORITY_BULK},
+            )
+        except Forbidden:
+            pass
+        except TelegramError as e:
+            logger.warning(f"Expiry reminder to {user_id} failed: {e}")
+            return False
+        return True
+
+    user_ids = list(languages)
+    reminded = 0
+    for start in range(0, len(user_ids), batch_size):
+        batch = user_ids[start:start + batch_size]
+        results = await asyncio.gather(*(send(user_id) for user_id in batch))
+        done = [user_id for user_id, ok in zip(batch, results) if ok]
+        reminded += await asyncio.to_thread(mongo_manager.mark_reminded, done)
+    logger.info(f"Sent expiry reminders to {reminded} of {len(user_ids)} users")
@@ -0,0 +1,138 @@
+from datetime import datetime
+from logging import getLogger
+from bson import ObjectId
+from pymongo.errors import PyMongoError
+from telegram_libs.constants import DEBUG
+from telegram_libs.mongo import MongoManager
+
+logger = getLogger(__name__)
+
+SUPPORT_DB_NAME = "support"
+# Counters document recording that existing tickets were counted; usernames cannot start with "_"
+COUNTED_MARKER_ID = "_counted"
+
+
+class SupportInbox:
+    """Read and resolve the support tickets written by the support handlers.
+
+    Unresolved tickets are counted per bot in a counters collection that is
+    updated with $inc after every insert and resolve, so counts are one indexed
+    read instead of a collection scan. The writes are not transactional: when a
+    counter update fails, the counted marker is removed so the next
+    ensure_indexes recounts from the tickets.
+    """
+
+    def __init__(self, mongo_manager: MongoManager):
+        # Collections are looked up on use, so the inbox follows the manager's client
+        self.mongo_manager = mongo_manager
+
+    @property
+    def tickets_collection(self):
+        return self.mongo_manager.client[SUPPORT_DB_NAME]["support_test" if DEBUG else "support"]
+
+    @property
+    def counters_collection(self):
+        return self.mongo_manager.client[SUPPORT_DB_NAME]["support_counters_test" if DEBUG else "support_counters"]
+
+    def ensure_indexes(self) -> None:
+        """Create the tickets index, and count the tickets when the counters are not known to match them.
+
+        That is on first use, when tickets may predate the counters, and after a
+        counter update failed.
+        """
+        # _id breaks ties between tickets with the same timestamp when paginating
+        self.tickets_collection.create_index([("bot_name", 1), ("resolved", 1), ("timestamp", 1), ("_id", 1)])
+        if self.counters_collection.find_one({"_id": COUNTED_MARKER_ID}) is None:
+            self.recount()
+            self.counters_collection.update_one(
+                {"_id": COUNTED_MARKER_ID}, {"$set": {"counted_at": datetime.now().isoformat()}}, upsert=True
+            )
+
+    def _count(self, bot_name: str, amount: int) -> None:
+        try:
+            self.counters_collection.update_one({"_id": bot_name}, {"$inc": {"unresolved": amount}}, upsert=True)
+        except PyMongoError:
+            logger.exception(f"Could not update the unresolved ticket count of {bot_name}, recounting on next start")
+            try:
+                self.counters_collection.delete_one({"_id": COUNTED_MARKER_ID})
+            except PyMongoError:
+                logger.exception("Could not schedule the ticket recount")
+
+    def add_ticket(self, ticket: dict) -> ObjectId:
+        """Store a ticket and count it as unresolved for its bot."""
+        ticket_id = self.tickets_collection.insert_one(ticket).inserted_id
+        if not ticket.get("resolved"):
+            self._count(ticket["bot_name"], 1)
+        return ticket_id
+
+    def list_tickets(
+        self, bot_name: str, resolved: bool = False, limit: int = 50, after: tuple = None
+    ) -> tuple[list, tuple | None]:
+        """Get a page of a bot's tickets, oldest first, using keyset pagination.
+
+        Args:
+            after (tuple): (timestamp, _id) of the last ticket of the previous page
+
+        Returns:
+            tuple[list, tuple | None]: Tickets and the `after` value of the next page,
+            None on the last page
+        """
+        query = {"bot_name": bot_name, "resolved": resolved}
+        if after is not None:
+            timestamp, ticket_id = after
+            query["$or"] = [
+                {"timestamp": {"$gt": timestamp}},
+                {"timestamp": timestamp, "_id": {"$gt": ticket_id}},
+            ]
+        tickets = list(self.tickets_collection.find(query).sort([("timestamp", 1), ("_id", 1)]).limit(limit))
+        next_after = (tickets[-1]["timestamp"], tickets[-1]["_id"]) if len(tickets) == limit else None
+        return tickets, next_after
+
+    def resolve(self, ticket_ids: list) -> int:
+        """Resolve tickets in one update per bot.
+
+        Returns:
+            int: Number of tickets resolved; already resolved ones are not counted
+        """
+        bot_names = self.tickets_collection.distinct(
+            "bot_name", {"_id": {"$in": ticket_ids}, "resolved": False}
+        )
+        resolved_at = datetime.now().isoformat()
+        resolved = 0
+        for bot_name in bot_names:
+            result = self.tickets_collection.update_many(
+                {"_id": {"$in": ticket_ids}, "bot_name": bot_name, "resolved": False},
+                {"$set": {"resolved": True, "resolved_at": resolved_at}},
+            )
+            if result.modified_count:
+                self._count(bot_name, -result.modified_count)
+            resolved += result.modified_count
+        return resolved
+
+    def get_unresolved_counts(self) -> dict:
+        """Unresolved tickets per bot."""
+        return {
+            counter["_id"]: counter["unresolved"]
+            for counter in self.counters_collection.find({"unresolved": {"$gt": 0}})
+        }
+
+    def get_unresolved_count(self, bot_name: str) -> int:
+        counter = self.counters_collection.find_one({"_id": bot_name})
+        return counter["unresolved"] if counter else 0
+
+    def recount(self) -> dict:
+        """Rebuild the counters from the tickets, e.g. after tickets were edited by hand.
+
+        Scans the tickets; meant for maintenance, not per request.
+        """
+        counts = {
+            group["_id"]: group["count"]
+            for group in self.tickets_collection.aggregate([
+                {"$match": {"resolved": False}},
+                {"$group": {"_id": "$bot_name", "count": {"$sum": 1}}},
+            ])
+        }
+        self.counters_collection.update_many({"_id": {"$nin": [*counts, COUNTED_MARKER_ID]}}, {"$set": {"unresolved": 0}})
+        for bot_name, count in counts.items():
+            self.counters_collection.update_one({"_id": bot_name}, {"$set": {"unresolved": count}}, upsert=True)
+        return counts
@@ -0,0 +1,174 @@
+import json
+from itertools import count
+from time import time
+from pymongo import monitoring
+from telegram.request import BaseRequest, RequestData
+
+FAKE_BOT_USER = {"id": 1, "is_bot": True, "first_name": "Test Bot", "username": "test_bot"}
+
+
+class FakeTelegramRequest(BaseRequest):
+    """Bot API transport answering locally instead of calling Telegram.
+
+    Every call is recorded in `calls` as (endpoint, parameters). Send methods
+    answer with a message in the target chat, all other methods with True.
+
+    Usage:
+        Application.builder().token("1:fake").request(FakeTelegramRequest()).build()
+    """
+
+    def __init__(self, bot_user: dict = None):
+        self.bot_user = bot_user or FAKE_BOT_USER
+        self.calls = []
+        self._message_ids = count(1)
+
+    @property
+    def read_timeout(self) -> float | None:
+        return None
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def _result(self, endpoint: str, parameters: dict):
+        if endpoint == "getMe":
+            return self.bot_user
+        if endpoint == "getUpdates":
+            return []
+        if endpoint.startswith("send"):
+            return {
+                "message_id": next(self._message_ids),
+                "date": int(time()),
+                "chat": {"id": int(parameters.get("chat_id", 0)), "type": "private"},
+                "from": self.bot_user,
+                "text": parameters.get("text", ""),
+            }
+        return True
+
+    async def do_request(
+        self,
+        url: str,
+        method: str,
+        request_data: RequestData | None = None,
+        read_timeout=None,
+        write_timeout=None,
+        connect_timeout=None,
+        pool_timeout=None,
+    ) -> tuple[int, bytes]:
+        endpoint = url.rsplit("/", 1)[-1]
+        parameters = request_data.parameters if request_data else {}
+        self.calls.append((endpoint, parameters))
+        body = {"ok": True, "result": self._result(endpoint, parameters)}
+        return 200, json.dumps(body).encode()
+
+
+# Command names as reported to pymongo command listeners
+MONGO_READS = frozenset({"find", "getMore", "aggregate", "count", "distinct", "listIndexes"})
+MONGO_WRITES = frozenset({"insert", "update", "delete", "findAndModify", "createIndexes", "dropIndexes"})
+
+
+# Round trip counting
+
+class _RoundTripListener(monitoring.CommandListener):
+    """Forwards commands to the active RoundTripCounters."""
+
+    def __init__(self):
+        self.counters = []
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        for counter in self.counters:
+            counter.record(event)
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        pass
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        pass
+
+
+# Attached to every registry client; pass it to other clients whose commands should be counted
+round_trip_listener = _RoundTripListener()
+
+
+def get_round_trip_listeners() -> list:
+    """Listeners for new Mongo clients; they record nothing outside a RoundTripCounter block."""
+    return [round_trip_listener]
+
+
+class RoundTripCounter:
+    """Count the Mongo commands and Bot API calls made inside a block.
+
+    Mongo commands are counted as reported to command listeners, so cursor
+    getMores and commands on any collection of the client count, including ones
+    reached through client[...]. The clients of get_mongo_client are counted, as
+    are other clients created with round_trip_listener among their
+    event_listeners. Bot API calls are counted from the FakeTelegramRequests
+    passed as requests.
+
+    Usage:
+        mongo_manager = MongoManager(mongo_database_name="test")
+        with RoundTripCounter() as counter:
+            await check_subscription_command(update, context, mongo_manager)
+        counter.assert_budget(reads=2, writes=0)
+    """
+
+    def __init__(self, requests: tuple = ()):
+        self.requests = requests
+        # (kind, collection, command name, command) with kind "read", "write" or "other"
+        self.operations = []
+        self.bot_api_calls = []
+        self._request_offsets = []
+
+    def record(self, event) -> None:
+        name = event.command_name
+        kind = "read" if name in MONGO_READS else "write" if name in MONGO_WRITES else "other"
+        collection = event.command.get(name)
+        if name == "getMore":
+            collection = event.command.get("collection")
+        self.operations.append((kind, f"{event.database_name}.{collection}", name, event.command))
+
+    def __enter__(self) -> "RoundTripCounter":
+        round_trip_listener.counters.append(self)
+        self._request_offsets = [len(request.calls) for request in self.requests]
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        round_trip_listener.counters.remove(self)
+        self.bot_api_calls = [
+            call
+            for request, offset in zip(self.requests, self._request_offsets)
+            for call in request.calls[offset:]
+        ]
+
+    @property
+    def reads(self) -> int:
+        return sum(1 for kind, *_ in self.operations if kind == "read")
+
+    @property
+    def writes(self) -> int:
+        return sum(1 for kind, *_ in self.operations if kind == "write")
+
+    @property
+    def round_trips(self) -> int:
+        return len(self.operations)
+
+    def assert_budget(
+        self, reads: int = None, writes: int = None, bot_api_calls: int = None, round_trips: int = None
+    ) -> None:
+        """Fail when more round trips than budgeted were made; None leaves a kind unchecked."""
+        over = []
+        if reads is not None and self.reads > reads:
+            over.append(f"{self.reads} reads > {reads}")
+        if writes is not None and self.writes > writes:
+            over.append(f"{self.writes} writes > {writes}")
+        if round_trips is not None and self.round_trips > round_trips:
+            over.append(f"{self.round_trips} Mongo commands > {round_trips}")
+        if bot_api_calls is not None and len(self.bot_api_calls) > bot_api_calls:
+            over.append(f"{len(self.bot_api_calls)} Bot API calls > {bot_api_calls}")
+        if over:
+            made = "\n".join(
+                f"  {kind} {collection} {name} {command!r}" for kind, collection, name, command in self.operations
+            )
+            raise AssertionError(f"Round trip budget exceeded: {', '.join(over)}\n{made}")
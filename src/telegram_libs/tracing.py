@@ -0,0 +1,292 @@
+import json
+import os
+import sys
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from functools import wraps
+from statistics import quantiles
+from threading import Lock
+from time import time_ns
+from typing import Callable
+from pymongo import monitoring
+from telegram.ext import Application, ApplicationBuilder
+from telegram.request import HTTPXRequest
+
+# JSONL file receiving finished spans; tracing is off when unset. Read here rather
+# than in constants.py, which requires MONGO_URI: the translation module imports
+# the tracer and is used without a database.
+TRACE_FILE = os.getenv("TRACE_FILE")
+
+current_span: ContextVar["Span | None"] = ContextVar("current_span", default=None)
+_NO_SPAN = nullcontext()
+
+
+def _new_id(size: int) -> str:
+    return os.urandom(size).hex()
+
+
+class Span:
+    """One timed operation, exported with OTLP span field names."""
+
+    __slots__ = ("trace_id", "span_id", "parent_span_id", "name", "attributes", "start_ns", "end_ns", "status")
+
+    def __init__(self, name: str, parent: "Span | None" = None, attributes: dict = None):
+        self.trace_id = parent.trace_id if parent else _new_id(16)
+        self.span_id = _new_id(8)
+        self.parent_span_id = parent.span_id if parent else None
+        self.name = name
+        self.attributes = attributes or {}
+        self.start_ns = time_ns()
+        self.end_ns = None
+        self.status = "OK"
+
+    def end(self, error: BaseException = None) -> None:
+        self.end_ns = time_ns()
+        if error is not None:
+            self.status = "ERROR"
+            self.attributes["error"] = repr(error)
+
+    def to_dict(self) -> dict:
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_span_id,
+            "name": self.name,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "attributes": self.attributes,
+            "status": self.status,
+        }
+
+
+class JsonlSpanSink:
+    """Append finished spans to a file, one JSON object per line.
+
+    Spans are buffered and written when a root span ends or the buffer is full.
+    """
+
+    def __init__(self, path: str, buffer_size: int = 256):
+        self.path = path
+        self.buffer_size = buffer_size
+        self._buffer = []
+        self._lock = Lock()
+
+    def export(self, span: Span) -> None:
+        with self._lock:
+            self._buffer.append(json.dumps(span.to_dict(), default=str))
+            if span.parent_span_id is None or len(self._buffer) >= self.buffer_size:
+                self._flush()
+
+    def _flush(self) -> None:
+        if self._buffer:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("\n".join(self._buffer) + "\n")
+            self._buffer = []
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush()
+
+
+class Tracer:
+    """Create spans nested through a contextvar; a no-op without a sink."""
+
+    def __init__(self, sink: JsonlSpanSink = None):
+        self.sink = sink
+
+    @property
+    def enabled(self) -> bool:
+        return self.sink is not None
+
+    def start_span(self, name: str, attributes: dict = None) -> Span:
+        """Start a child of the current span without making it current, for callbacks."""
+        return Span(name, current_span.get(), attributes)
+
+    def end_span(self, span: Span, error: BaseException = None) -> None:
+        span.end(error)
+        self.sink.export(span)
+
+    @contextmanager
+    def _span(self, name: str, attributes: dict):
+        span = self.start_span(name, attributes)
+        token = current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            self.end_span(span, e)
+            raise
+        else:
+            self.end_span(span)
+        finally:
+            current_span.reset(token)
+
+    def span(self, name: str, **attributes):
+        """Context manager timing a block as a child of the current span."""
+        if self.sink is None:
+            return _NO_SPAN
+        return self._span(name, attributes)
+
+
+tracer = Tracer(JsonlSpanSink(TRACE_FILE) if TRACE_FILE else None)
+
+
+def trace_handler(callback: Callable, name: str) -> Callable:
+    """Open a span for every update the handler callback processes.
+
+    Returns the callback itself when tracing is disabled.
+    """
+    if not tracer.enabled:
+        return callback
+
+    @wraps(callback)
+    async def wrapper(update, context, *args, **kwargs):
+        parent = current_span.get()
+        if parent is not None and parent.parent_span_id is None:
+            # Names the update span of TracedApplication for summarize_traces
+            parent.attributes.setdefault("handler", name)
+        with tracer.span(name, update_id=getattr(update, "update_id", None)):
+            return await callback(update, context, *args, **kwargs)
+
+    return wrapper
+
+
+class MongoTraceListener(monitoring.CommandListener):
+    """Record every Mongo command as a child span of the operation that issued it."""
+
+    def __init__(self):
+        self._spans = {}
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        if current_span.get() is None:
+            # Background work outside any traced update
+            return
+        collection = event.command.get(event.command_name)
+        self._spans[event.request_id] = tracer.start_span(
+            f"mongo {event.command_name}",
+            {
+                "db.system": "mongodb",
+                "db.name": event.database_name,
+                "db.operation": event.command_name,
+                "db.collection": collection if isinstance(collection, str) else "",
+            },
+        )
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        span = self._spans.pop(event.request_id, None)
+        if span is not None:
+            tracer.end_span(span)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        span = self._spans.pop(event.request_id, None)
+        if span is not None:
+            tracer.end_span(span, Exception(str(event.failure)))
+
+
+def get_trace_listeners() -> list:
+    """Listeners for new Mongo clients, none unless TRACE_FILE is set."""
+    return [MongoTraceListener()] if tracer.enabled else []
+
+
+class TracedRequestMixin:
+    """Record Bot API calls of a telegram.request.BaseRequest as spans."""
+
+    __slots__ = ()
+
+    async def do_request(self, url: str, method: str, request_data=None, *args, **kwargs):
+        if current_span.get() is None:
+            # Tracing is disabled, or a call outside any update such as getUpdates
+            return await super().do_request(url, method, request_data, *args, **kwargs)
+        endpoint = url.rsplit("/", 1)[-1]
+        with tracer.span(f"bot_api {endpoint}", endpoint=endpoint) as span:
+            code, payload = await super().do_request(url, method, request_data, *args, **kwargs)
+            span.attributes["http.status_code"] = code
+            return code, payload
+
+
+class TracedHTTPXRequest(TracedRequestMixin, HTTPXRequest):
+    """HTTPXRequest recording the Bot API calls made while processing updates."""
+
+    __slots__ = ()
+
+
+class TracedApplication(Application):
+    """Application processing every update inside an "update" span.
+
+    The span is opened before any handler group runs, so the middleware stages,
+    their Mongo commands and rate limiter waits are part of the update's trace.
+    """
+
+    async def process_update(self, update: object) -> None:
+        if not tracer.enabled:
+            return await super().process_update(update)
+        with tracer.span("update", update_id=getattr(update, "update_id", None)):
+            await super().process_update(update)
+
+
+def install_tracing(builder: ApplicationBuilder) -> ApplicationBuilder:
+    """Trace the updates and Bot API calls of the application being built.
+
+    Leaves the builder unchanged unless TRACE_FILE is set. Sets the request, so
+    call it before other request options; pass a TracedRequestMixin subclass to
+    builder.request to trace a custom request class.
+
+    Usage:
+        app = install_tracing(Application.builder()).token(token).build()
+    """
+    if not tracer.enabled:
+        return builder
+    return builder.application_class(TracedApplication).request(TracedHTTPXRequest())
+
+
+def summarize_traces(path: str) -> dict:
+    """Per handler or root span name: count, p50/p99 duration and average child spans per trace by name.
+
+    Returns:
+        dict: {name: {"count", "p50_ms", "p99_ms", "children": {span name: avg per trace}}}
+    """
+    spans_by_trace = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            span = json.loads(line)
+            spans_by_trace.setdefault(span["traceId"], []).append(span)
+
+    roots = {}
+    for spans in spans_by_trace.values():
+        root = next((span for span in spans if span["parentSpanId"] is None), None)
+        if root is None:
+            continue
+        # Update spans are summarized under the handler that processed them
+        name = root["attributes"].get("handler", root["name"])
+        entry = roots.setdefault(name, {"durations": [], "children": {}})
+        entry["durations"].append((root["endTimeUnixNano"] - root["startTimeUnixNano"]) / 1e6)
+        for span in spans:
+            if span is not root:
+                entry["children"][span["name"]] = entry["children"].get(span["name"], 0) + 1
+
+    summary = {}
+    for name, entry in roots.items():
+        durations = sorted(entry["durations"])
+        count = len(durations)
+        cuts = quantiles(durations, n=100, method="inclusive") if count > 1 else durations * 99
+        summary[name] = {
+            "count": count,
+            "p50_ms": cuts[49],
+            "p99_ms": cuts[98],
+            "children": {child: total / count for child, total in sorted(entry["children"].items())},
+        }
+    return summary
+
+
+def main(argv: list | None = None) -> None:
+    """Print the per-handler summary of a trace file
+
+    Usage: python -m telegram_libs.tracing <trace_file>
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 1:
+        raise SystemExit("Usage: python -m telegram_libs.tracing <trace_file>")
+    print(json.dumps(summarize_traces(argv[0]), indent=2))
+
+
+if __name__ == "__main__":
+    main()
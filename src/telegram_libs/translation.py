@@ -1,32 +1,138 @@
+import hashlib
 import json
+import marshal
+import mmap
 import os
-from typing import Any
+import sys
+from typing import Any, Callable
+from telegram_libs.tracing import tracer
 
 
-def _load_translations_from_dir(locales_dir: str) -> dict:
-    """Helper to load translations from a given directory"""
+# Directory for compiled catalogs. Kept out of constants.py so translations can be
+# loaded without MONGO_URI being configured.
+TRANSLATIONS_CACHE_DIR = os.getenv("TRANSLATIONS_CACHE_DIR")
+# Bump when the layout of the compiled artifact changes
+CACHE_FORMAT_VERSION = 1
+
+
+def _catalog_files(locales_dir: str) -> list:
+    """Sorted list of JSON catalog filenames in a locales directory"""
+    return sorted(
+        filename for filename in os.listdir(locales_dir) if filename.endswith('.json')
+    )
+
+
+def _parse_catalogs(locales_dir: str, filenames: list) -> dict:
+    translations = {}
+    for filename in filenames:
+        lang = filename.split('.')[0]
+        with open(os.path.join(locales_dir, filename), 'r', encoding='utf-8') as f:
+            translations[lang] = json.load(f)
+    return translations
+
+
+def catalog_hash(locales_dir: str) -> str:
+    """Content hash of all JSON catalogs in a locales directory
+
+    The marshal format and interpreter are hashed too, as marshal data is only
+    guaranteed to load on the Python version that wrote it.
+    """
+    digest = hashlib.sha256(
+        f"v{CACHE_FORMAT_VERSION}\0{marshal.version}\0{sys.implementation.cache_tag}\0{sys.version}".encode()
+    )
+    for filename in _catalog_files(locales_dir):
+        digest.update(filename.encode('utf-8') + b"\0")
+        with open(os.path.join(locales_dir, filename), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def _compiled_path(cache_dir: str, digest: str) -> str:
+    return os.path.join(cache_dir, f"translations-{digest}.bin")
+
+
+def _read_compiled(path: str) -> dict | None:
+    """Memory-map a compiled artifact and decode it, None if missing or corrupt"""
+    try:
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            translations = marshal.loads(mapped)
+    except (OSError, ValueError, EOFError, TypeError):
+        return None
+    return translations if isinstance(translations, dict) else None
+
+
+def _write_compiled(path: str, translations: dict) -> None:
+    """Atomically write a compiled artifact so concurrent readers never see a partial file"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(marshal.dumps(translations))
+        os.replace(tmp_path, path)
+    finally:
+        # Left behind only when writing or replacing failed
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def compile_translations(locales_dir: str, cache_dir: str) -> str:
+    """Compile JSON catalogs into a binary artifact keyed by their content hash
+
+    Args:
+        locales_dir (str): Directory with <lang>.json catalogs
+        cache_dir (str): Directory to store the compiled artifact in
+
+    Returns:
+        str: Path of the compiled artifact
+    """
+    path = _compiled_path(cache_dir, catalog_hash(locales_dir))
+    if not os.path.exists(path):
+        _write_compiled(path, _parse_catalogs(locales_dir, _catalog_files(locales_dir)))
+    return path
+
+
+def _load_translations_from_dir(locales_dir: str, cache_dir: str | None = None) -> dict:
+    """Helper to load translations from a given directory
+
+    When cache_dir is set, catalogs are read from the compiled artifact matching their
+    current content hash, and the artifact is built on a miss. Editing any JSON file
+    changes the hash, so stale artifacts are never used.
+    """
     translations = {}
     if not os.path.exists(locales_dir):
         print(f"Warning: No 'locales' directory found in {locales_dir}")
         return translations
-    for filename in os.listdir(locales_dir):
-        if filename.endswith('.json'):
-            lang = filename.split('.')[0]
-            with open(os.path.join(locales_dir, filename), 'r', encoding='utf-8') as f:
-                translations[lang] = json.load(f)
+    cache_dir = cache_dir or TRANSLATIONS_CACHE_DIR
+    if not cache_dir:
+        return _parse_catalogs(locales_dir, _catalog_files(locales_dir))
+
+    path = _compiled_path(cache_dir, catalog_hash(locales_dir))
+    translations = _read_compiled(path)
+    if translations is None:
+        translations = _parse_catalogs(locales_dir, _catalog_files(locales_dir))
+        try:
+            _write_compiled(path, translations)
+        except OSError as e:
+            print(f"Warning: Could not write compiled translations to {path}: {e}")
     return translations
 
 
+def _project_locales_dir() -> str:
+    # Get the project's root directory (where the script is being run from)
+    return os.path.join(os.path.abspath(os.getcwd()), 'locales')
+
+
+def _common_locales_dir() -> str:
+    return os.path.join(os.path.dirname(__file__), 'locales')
+
+
 def load_translations() -> dict:
     """Load translations from locales directory
 
     Returns:
         dict: Translations dictionary
     """
-    # Get the project's root directory (where the script is being run from)
-    project_root = os.path.abspath(os.getcwd())
-    locales_dir = os.path.join(project_root, 'locales')
-    return _load_translations_from_dir(locales_dir)
+    return _load_translations_from_dir(_project_locales_dir())
 
 
 def load_common_translations() -> dict:
@@ -35,16 +141,39 @@ def load_common_translations() -> dict:
     Returns:
         dict: Translations dictionary
     """
-    locales_dir = os.path.join(os.path.dirname(__file__), 'locales')
-    return _load_translations_from_dir(locales_dir)
+    return _load_translations_from_dir(_common_locales_dir())
 
 
 TRANSLATIONS = load_translations()
 COMMON_TRANSLATIONS = load_common_translations()
 
+_reload_callbacks = []
+
+
+def on_reload(callback: Callable[[], None]) -> Callable[[], None]:
+    """Register a callback run after catalogs are reloaded, e.g. to clear render caches"""
+    _reload_callbacks.append(callback)
+    return callback
+
+
+def reload_translations() -> None:
+    """Reload project and common catalogs and invalidate everything built from them"""
+    global TRANSLATIONS, COMMON_TRANSLATIONS
+    TRANSLATIONS = load_translations()
+    COMMON_TRANSLATIONS = load_common_translations()
+    for callback in _reload_callbacks:
+        callback()
+
 
 def t(key: str, lang: str = 'ru', common: bool = False, **kwargs: Any) -> str:
     """Get translation for a key with optional formatting"""
+    if tracer.enabled:
+        with tracer.span("t", key=key, lang=lang):
+            return _translate(key, lang, common, **kwargs)
+    return _translate(key, lang, common, **kwargs)
+
+
+def _translate(key: str, lang: str, common: bool, **kwargs: Any) -> str:
     try:
         # Support nested keys like "buttons.start"
         keys = key.split('.')
@@ -54,10 +183,28 @@ def t(key: str, lang: str = 'ru', common: bool = False, **kwargs: Any) -> str:
             value = TRANSLATIONS[lang]
         for k in keys:
             value = value[k]
-        
+
         return value.format(**kwargs) if kwargs else value
     except KeyError:
         # Fallback to English if translation missing
         if lang != 'en':
-            return t(key, 'en', common=common, **kwargs)
-        return key  # Return the key itself as last resort
\ No newline at end of file
+            return _translate(key, 'en', common, **kwargs)
+        return key  # Return the key itself as last resort
+
+
+def main(argv: list | None = None) -> None:
+    """Precompile the common and project catalogs, e.g. as a deploy build step
+
+    Usage: python -m telegram_libs.translation [cache_dir] [locales_dir ...]
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    cache_dir = argv[0] if argv else TRANSLATIONS_CACHE_DIR
+    if not cache_dir:
+        raise SystemExit("Usage: python -m telegram_libs.translation <cache_dir> [locales_dir ...]")
+    for locales_dir in argv[1:] or [_common_locales_dir(), _project_locales_dir()]:
+        if os.path.exists(locales_dir):
+            print(compile_translations(locales_dir, cache_dir))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+import asyncio
+from collections import deque
+from logging import getLogger
+from time import monotonic
+from typing import Any, Awaitable
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+from telegram_libs.cache import TTLCache
+from telegram_libs.mongo import MongoManager
+
+logger = getLogger(__name__)
+
+PREMIUM = "premium"
+FREE = "free"
+
+
+def get_update_user_id(update: object) -> int | None:
+    """User the update belongs to, None for updates without a user."""
+    if isinstance(update, Update) and update.effective_user:
+        return update.effective_user.id
+    return None
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Process updates of different users concurrently and of the same user in order.
+
+    Per-user state (rate limit counters, the support waiting flag) is updated with
+    read-modify-write, so two updates of one user must not interleave. Users are
+    hashed onto a fixed table of shard locks, locks[user_id % shards], so the lock
+    table never grows; users sharing a shard are serialized too, which is rare with
+    many more shards than concurrent updates. Updates wait for their shard's lock
+    before taking one of the max_concurrent_updates slots, so a user flooding the
+    bot occupies at most one slot and users of other shards keep being processed.
+
+    Usage:
+        Application.builder().concurrent_updates(PerUserUpdateProcessor(256))
+    """
+
+    def __init__(self, max_concurrent_updates: int, shards: int = 4096):
+        super().__init__(max_concurrent_updates)
+        if shards < 1:
+            raise ValueError("`shards` must be a positive integer!")
+        self._locks = [asyncio.Lock() for _ in range(shards)]
+        self.lock_waits = 0
+        self.lock_wait_total = 0.0
+        self.lock_wait_max = 0.0
+
+    @property
+    def metrics(self) -> dict:
+        """Lock wait statistics, times in seconds."""
+        return {
+            "locked_shards": sum(lock.locked() for lock in self._locks),
+            "lock_waits": self.lock_waits,
+            "lock_wait_total": self.lock_wait_total,
+            "lock_wait_max": self.lock_wait_max,
+        }
+
+    async def process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        # Overrides the base class, which takes the concurrency slot before calling
+        # do_process_update, to wait for the shard's lock without holding a slot
+        user_id = get_update_user_id(update)
+        if user_id is None:
+            await super().process_update(update, coroutine)
+            return
+
+        lock = self._locks[user_id % len(self._locks)]
+        if lock.locked():
+            start = monotonic()
+            try:
+                await lock.acquire()
+            except asyncio.CancelledError:
+                if hasattr(coroutine, "close"):
+                    coroutine.close()
+                raise
+            waited = monotonic() - start
+            self.lock_waits += 1
+            self.lock_wait_total += waited
+            self.lock_wait_max = max(self.lock_wait_max, waited)
+        else:
+            await lock.acquire()
+        try:
+            await super().process_update(update, coroutine)
+        finally:
+            lock.release()
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        await coroutine
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+
+class PremiumStatusCache:
+    """Premium status of users answered from memory, never waiting for the database.
+
+    A miss answers False and refreshes the user in the background, so a premium
+    user is classified as free at most once per ttl.
+    """
+
+    def __init__(self, mongo_manager: MongoManager, ttl: float = 300, maxsize: int = 100000):
+        self.mongo_manager = mongo_manager
+        self.cache = TTLCache(ttl, maxsize)
+        self._refreshing = {}
+
+    def is_premium(self, user_id: int) -> bool:
+        status = self.cache.get(user_id)
+        if status is None:
+            if user_id not in self._refreshing:
+                self._refreshing[user_id] = asyncio.get_running_loop().create_task(self._refresh(user_id))
+            return False
+        return status
+
+    async def _refresh(self, user_id: int) -> None:
+        try:
+            status = await asyncio.to_thread(self.mongo_manager.check_subscription_status, user_id)
+            self.cache.set(user_id, status)
+        except Exception as e:
+            logger.warning(f"Could not refresh premium status of user {user_id}: {e}")
+        finally:
+            self._refreshing.pop(user_id, None)
+
+
+class PriorityUpdateProcessor(BaseUpdateProcessor):
+    """Schedule updates of premium users ahead of free users under overload.
+
+    At most max_running updates run at once, and at most class_limits[class] of
+    each class. Updates beyond that wait in one queue per class, and freed slots
+    go to the queues by smooth weighted round robin. Up to max_concurrent_updates
+    updates may be accepted from PTB, running or queued.
+
+    Usage:
+        processor = PriorityUpdateProcessor(PremiumStatusCache(mongo_manager), max_running=64)
+        Application.builder().concurrent_updates(processor)
+    """
+
+    def __init__(
+        self,
+        status_cache: PremiumStatusCache,
+        max_running: int = 64,
+        max_concurrent_updates: int = 4096,
+        weights: dict = None,
+        class_limits: dict = None,
+    ):
+        super().__init__(max_concurrent_updates)
+        self.status_cache = status_cache
+        self.max_running = max_running
+        self.weights = weights or {PREMIUM: 4, FREE: 1}
+        self.class_limits = class_limits or {PREMIUM: max_running, FREE: max(1, max_running * 3 // 4)}
+        self._queues = {update_class: deque() for update_class in self.weights}
+        self._running = dict.fromkeys(self.weights, 0)
+        self._current_weights = dict.fromkeys(self.weights, 0)
+        self._total_running = 0
+        self.wait_total = dict.fromkeys(self.weights, 0.0)
+        self.processed = dict.fromkeys(self.weights, 0)
+
+    def classify(self, update: object) -> str:
+        user_id = get_update_user_id(update)
+        if user_id is not None and self.status_cache.is_premium(user_id):
+            return PREMIUM
+        return FREE
+
+    @property
+    def metrics(self) -> dict:
+        """Queue depth, running count, processed count and total queue wait per class."""
+        return {
+            update_class: {
+                "queued": len(self._queues[update_class]),
+                "running": self._running[update_class],
+                "processed": self.processed[update_class],
+                "wait_total": self.wait_total[update_class],
+            }
+            for update_class in self.weights
+        }
+
+    def _has_slot(self, update_class: str) -> bool:
+        return (
+            self._total_running < self.max_running
+            and self._running[update_class] < self.class_limits[update_class]
+        )
+
+    def _start(self, update_class: str) -> None:
+        self._running[update_class] += 1
+        self._total_running += 1
+
+    def _pick_class(self) -> str | None:
+        eligible = [
+            update_class for update_class, queue in self._queues.items()
+            if queue and self._has_slot(update_class)
+        ]
+        if not eligible:
+            return None
+        for update_class in eligible:
+            self._current_weights[update_class] += self.weights[update_class]
+        picked = max(eligible, key=self._current_weights.__getitem__)
+        self._current_weights[picked] -= sum(self.weights[update_class] for update_class in eligible)
+        return picked
+
+    def _dispatch(self) -> None:
+        while (update_class := self._pick_class()) is not None:
+            waiter = self._queues[update_class].popleft()
+            if waiter.done():
+                continue
+            self._start(update_class)
+            waiter.set_result(None)
+
+    def _release(self, update_class: str) -> None:
+        self._running[update_class] -= 1
+        self._total_running -= 1
+        self._dispatch()
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        update_class = self.classify(update)
+        if not self._queues[update_class] and self._has_slot(update_class):
+            self._start(update_class)
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            self._queues[update_class].append(waiter)
+            start = monotonic()
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    self._release(update_class)
+                if hasattr(coroutine, "close"):
+                    coroutine.close()
+                raise
+            self.wait_total[update_class] += monotonic() - start
+
+        try:
+            await coroutine
+        finally:
+            self.processed[update_class] += 1
+            self._release(update_class)
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
@@ -1,5 +1,6 @@
 from logging import basicConfig, getLogger, INFO
 from datetime import datetime
+from functools import lru_cache
 from telegram import (
     InlineKeyboardButton,
     InlineKeyboardMarkup,
@@ -7,9 +8,11 @@ from telegram import (
 from telegram import Update
 from telegram.ext import ContextTypes
 from telegram_libs.constants import BOTS, BOTS_AMOUNT
-from telegram_libs.translation import t
+from telegram_libs.translation import t, on_reload
 from telegram_libs.mongo import MongoManager
 from telegram_libs.logger import BotLogger
+from telegram_libs.middleware import get_update_state, get_user_info
+from telegram_libs.plans import Plan, PlanRegistry, default_plan_registry, on_load
 
 
 
@@ -19,62 +22,91 @@ basicConfig(
 logger = getLogger(__name__)
 
 
-async def get_subscription_keyboard(update: Update, lang: str) -> InlineKeyboardMarkup:
+@lru_cache(maxsize=64)
+def get_subscription_info_message(lang: str) -> str:
+    """Rendered subscription info message, cached per language"""
+    return t("subscription.info", lang, common=True).format(BOTS_AMOUNT - 1)
+
+
+def _plan_button_text(plan: Plan, lang: str) -> str:
+    key = f"subscription.plans.{plan.callback_data}"
+    title = t(key, lang, common=True)
+    if title == key:
+        # Plans added to the collection without a translation are shown by their title
+        title = plan.title
+    return t("subscription.plan_button", lang, common=True, title=title, price=plan.price)
+
+
+@lru_cache(maxsize=64)
+def get_subscription_markup(lang: str, plan_registry: PlanRegistry = default_plan_registry) -> InlineKeyboardMarkup:
+    """Keyboard of the offered plans with their current prices, two per row, cached per language
+
+    Markups are immutable, so one instance is safely shared by all replies. The
+    cache is cleared whenever translations are reloaded or plans are loaded.
+    """
+    buttons = [
+        InlineKeyboardButton(_plan_button_text(plan, lang), callback_data=plan.callback_data)
+        for plan in plan_registry
+    ]
+    return InlineKeyboardMarkup([buttons[start:start + 2] for start in range(0, len(buttons), 2)])
+
+
+on_reload(get_subscription_info_message.cache_clear)
+on_reload(get_subscription_markup.cache_clear)
+on_load(get_subscription_markup.cache_clear)
+
+
+async def get_subscription_keyboard(
+    update: Update, lang: str, plan_registry: PlanRegistry = default_plan_registry
+) -> InlineKeyboardMarkup:
     """Get subscription keyboard
 
     Args:
         update (Update): Update object
         lang (str): Language code
+        plan_registry (PlanRegistry): Plans to offer
 
     Returns:
         InlineKeyboardMarkup: Inline keyboard markup
     """
-    await update.message.reply_text(
-        t("subscription.info", lang, common=True).format(BOTS_AMOUNT - 1)
-    )
-    return InlineKeyboardMarkup([
-        [
-            InlineKeyboardButton(
-                t("subscription.plans.1month", lang, common=True), callback_data="sub_1month"
-            ),
-            InlineKeyboardButton(
-                t("subscription.plans.3months", lang, common=True), callback_data="sub_3months"
-            ),
-        ],
-        [
-            InlineKeyboardButton(
-                t("subscription.plans.1year", lang, common=True), callback_data="sub_1year"
-            ),
-        ],
-    ])
-    
+    await update.effective_message.reply_text(get_subscription_info_message(lang))
+    return get_subscription_markup(lang, plan_registry)
+
+
+MORE_BOTS_MESSAGE = "Here is the list of all bots:\n\n" + "\n".join(
+    f"- <a href='{url}'>{name}</a>" for url, name in BOTS.items()
+)
+
 
 async def more_bots_list_command(update: Update, context: ContextTypes.DEFAULT_TYPE, bot_logger: BotLogger) -> None:
     user_id = update.effective_user.id
     bot_name = context.bot.name
     bot_logger.log_action(user_id, "more_bots_list_command", bot_name)
-    message = "Here is the list of all bots:\n\n"
-    bots_list  = "\n".join(
-        f"- <a href='{url}'>{name}</a>" for url, name in BOTS.items()
-    )
-    message += bots_list
-    await update.message.reply_text(message, disable_web_page_preview=True, parse_mode='HTML')
+    await update.message.reply_text(MORE_BOTS_MESSAGE, disable_web_page_preview=True, parse_mode='HTML')
     
     
 class RateLimitManager:
     """Rate limit manager to handle user rate limits."""
     
-    def __init__(self, mongo_manager: MongoManager, rate_limit: int = 5):
+    def __init__(
+        self, mongo_manager: MongoManager, rate_limit: int = 5, plan_registry: PlanRegistry = default_plan_registry
+    ):
         self.mongo_manager = mongo_manager
         self.rate_limit = rate_limit
+        # Plans offered to users over the limit
+        self.plan_registry = plan_registry
+
+    def check_limit(self, user_id: int, user_data: dict = None) -> tuple[bool, dict]:
+        """Check if user has exceeded the daily rate limit.
 
-    def check_limit(self, user_id: int) -> tuple[bool, dict]:
-        """Check if user has exceeded the daily rate limit."""
+        Pass user_data when it is already loaded to skip reading it again.
+        """
         # Get today's date and reset time to midnight
         today = datetime.now().date()
 
         # If last action date is not today, reset the counter
-        user_data = self.mongo_manager.get_user_data(user_id)
+        if user_data is None:
+            user_data = self.mongo_manager.get_user_data(user_id)
         last_action_date_str = user_data.get("last_action_date")
         if last_action_date_str:
             last_action_date = datetime.fromisoformat(last_action_date_str).date()
@@ -97,12 +129,12 @@ class RateLimitManager:
 
         return True, user_data
     
-    def check_and_increment(self, user_id: int) -> bool:
+    def check_and_increment(self, user_id: int, user_data: dict = None) -> bool:
         """Check if user can perform an action and increment the count if allowed."""
         if self.mongo_manager.check_subscription_status(user_id):
             return True
 
-        can_perform, user_data = self.check_limit(user_id)
+        can_perform, user_data = self.check_limit(user_id, user_data)
         if can_perform:
             self.increment_action_count(user_id, user_data)
             return True
@@ -110,12 +142,21 @@ class RateLimitManager:
     
     async def check_limit_with_response(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int) -> bool:
         """Check if user can perform an action and handle the response."""
-        if not self.check_and_increment(user_id):
-            lang = self.mongo_manager.get_user_info(update).get("lang")
-            message = t("rate_limit.exceeded", lang, common=True)
-            await update.message.reply_text(message)
-            reply_markup = await get_subscription_keyboard(update, lang)
-            await update.message.reply_text(
+        state = get_update_state(context)
+        if state is not None:
+            # Reuse the user loaded by the middleware instead of reading it again
+            allowed = self.check_and_increment(user_id, dict(state.user_info))
+        else:
+            allowed = self.check_and_increment(user_id)
+        if not allowed:
+            # Callback queries carry the message of their button, other updates may have none
+            message = update.effective_message
+            if message is None:
+                return False
+            lang = get_user_info(update, context, self.mongo_manager).get("lang")
+            await message.reply_text(t("rate_limit.exceeded", lang, common=True))
+            reply_markup = await get_subscription_keyboard(update, lang, self.plan_registry)
+            await message.reply_text(
                 t("subscription.choose_plan", lang, common=True), reply_markup=reply_markup
             )
             return False
@@ -0,0 +1,146 @@
+import asyncio
+import multiprocessing
+import os
+from logging import getLogger
+from typing import Callable
+from telegram import Bot, Update
+from telegram.ext import Application, Updater
+from telegram_libs.mongo import reconnect_after_fork
+
+logger = getLogger(__name__)
+
+
+def get_worker_index(update: Update, workers: int) -> int:
+    """Worker handling an update; all updates of one user go to the same worker."""
+    if update.effective_user:
+        key = update.effective_user.id
+    elif update.effective_chat:
+        key = update.effective_chat.id
+    else:
+        key = update.update_id
+    return key % workers
+
+
+async def process_worker_updates(app: Application, queue) -> None:
+    """Feed updates received from the master into the worker's application until a None sentinel.
+
+    An update that fails outside the application's own error handling is logged
+    and dropped, so the worker keeps serving the users hashed to it.
+    """
+    async with app:
+        await app.start()
+        try:
+            while True:
+                try:
+                    data = await asyncio.to_thread(queue.get)
+                    if data is None:
+                        break
+                    await app.update_queue.put(Update.de_json(data, app.bot))
+                except (EOFError, OSError):
+                    # The master is gone
+                    logger.exception("Update queue of the worker closed")
+                    break
+                except Exception:
+                    logger.exception("Worker dropped an update it could not process")
+        finally:
+            await app.stop()
+
+
+def _worker_main(app_factory: Callable[[], Application], queue) -> None:
+    # Clients inherited from the master must not be used after fork
+    reconnect_after_fork()
+    asyncio.run(process_worker_updates(app_factory(), queue))
+
+
+class WebhookServer:
+    """Receive updates over a webhook and process them in pre-forked worker processes.
+
+    Workers are forked before the master opens any connection. Each worker builds
+    its own Application (and Mongo clients) with app_factory after the fork, and
+    receives all updates of the users hashed to it, so per-user ordering holds
+    as long as the worker application processes a user's updates in order.
+
+    A worker found dead when an update is dispatched to it is replaced by a new
+    worker at the same index, so its users keep being served. The replacement
+    gets a new queue, since the dead worker may have held the old queue's read
+    lock; updates still queued for the dead worker are lost.
+    """
+
+    def __init__(self, token: str, app_factory: Callable[[], Application], workers: int = None):
+        self.token = token
+        self.app_factory = app_factory
+        self.workers = workers or os.cpu_count() or 1
+        self.queues = []
+        self.processes = []
+
+    def _start_worker(self):
+        context = multiprocessing.get_context("fork")
+        queue = context.Queue()
+        process = context.Process(target=_worker_main, args=(self.app_factory, queue), daemon=True)
+        process.start()
+        return queue, process
+
+    def start_workers(self) -> None:
+        for _ in range(self.workers):
+            queue, process = self._start_worker()
+            self.queues.append(queue)
+            self.processes.append(process)
+
+    def restart_worker(self, index: int) -> None:
+        """Replace the dead worker at index, keeping the users hashed to it."""
+        process = self.processes[index]
+        logger.error(f"Worker {index} (pid {process.pid}) exited with code {process.exitcode}, restarting it")
+        # Nobody reads the old queue anymore, don't wait for its buffer at exit
+        self.queues[index].cancel_join_thread()
+        self.queues[index].close()
+        self.queues[index], self.processes[index] = self._start_worker()
+
+    def stop_workers(self, timeout: float = 30) -> None:
+        for queue in self.queues:
+            queue.put(None)
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+
+    def dispatch(self, update: Update) -> None:
+        index = get_worker_index(update, self.workers)
+        if not self.processes[index].is_alive():
+            self.restart_worker(index)
+        self.queues[index].put(update.to_dict())
+
+    async def serve(self, update_queue: asyncio.Queue) -> None:
+        """Dispatch updates from the queue to the workers until cancelled."""
+        while True:
+            self.dispatch(await update_queue.get())
+
+    async def run(self, webhook_url: str, listen: str = "0.0.0.0", port: int = 8443, url_path: str = "", secret_token: str = None) -> None:
+        """Run until cancelled. Requires python-telegram-bot[webhooks]."""
+        self.start_workers()
+        update_queue = asyncio.Queue()
+        updater = Updater(Bot(self.token), update_queue)
+        try:
+            async with updater:
+                await updater.start_webhook(
+                    listen=listen,
+                    port=port,
+                    url_path=url_path,
+                    webhook_url=webhook_url,
+                    secret_token=secret_token,
+                    allowed_updates=Update.ALL_TYPES,
+                )
+                logger.info(f"Webhook listening on {listen}:{port}, {self.workers} workers")
+                try:
+                    await self.serve(update_queue)
+                finally:
+                    await updater.stop()
+        finally:
+            self.stop_workers()
+
+
+def run_webhook(token: str, app_factory: Callable[[], Application], webhook_url: str, workers: int = None, **kwargs) -> None:
+    """Entry point serving one bot over a webhook with a pool of worker processes."""
+    try:
+        asyncio.run(WebhookServer(token, app_factory, workers).run(webhook_url, **kwargs))
+    except KeyboardInterrupt:
+        pass
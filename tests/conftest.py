@@ -1,10 +1,59 @@
+import os
 import pytest
 from unittest.mock import MagicMock, patch
 
+# Tests using the mongod_client fixture run against this server and drop the
+# databases they used; they are skipped when it is unset or unreachable.
+TEST_MONGO_URI = os.getenv("TEST_MONGO_URI")
+
 @pytest.fixture(scope="module", autouse=True)
 def mock_pymongo_client():
     """Patch pymongo.mongo_client.MongoClient to return a mock client globally."""
     with patch('pymongo.mongo_client.MongoClient') as mock_mongo_client_class:
         mock_client_instance = MagicMock()
         mock_mongo_client_class.return_value = mock_client_instance
-        yield mock_client_instance 
\ No newline at end of file
+        yield mock_client_instance
+
+@pytest.fixture
+def round_trips():
+    """Count round trips of a block: `with round_trips() as counter: ...`"""
+    from telegram_libs.testing import RoundTripCounter
+
+    return RoundTripCounter
+
+@pytest.fixture(scope="session")
+def mongod_uri():
+    """URI of a real mongod, see TEST_MONGO_URI."""
+    from pymongo import MongoClient
+    from pymongo.errors import PyMongoError
+
+    if not TEST_MONGO_URI:
+        pytest.skip("TEST_MONGO_URI is not set")
+    probe = MongoClient(TEST_MONGO_URI, serverSelectionTimeoutMS=1000)
+    try:
+        probe.admin.command("ping")
+    except PyMongoError as e:
+        pytest.skip(f"No mongod at {TEST_MONGO_URI}: {e}")
+    finally:
+        probe.close()
+    return TEST_MONGO_URI
+
+@pytest.fixture
+def mongod_client(mongod_uri, monkeypatch):
+    """Registry client of the real mongod, as get_mongo_client creates it."""
+    from pymongo import MongoClient
+    from telegram_libs import mongo
+    from telegram_libs.constants import LOGS_DB_NAME, SUBSCRIPTION_DB_NAME
+    from telegram_libs.support_inbox import SUPPORT_DB_NAME
+
+    # The real class, whichever MongoClient mongo was imported with
+    monkeypatch.setattr(mongo, "MongoClient", MongoClient)
+    monkeypatch.setattr(mongo, "_mongo_clients", {})
+    client = mongo.get_mongo_client(mongod_uri)
+    databases = ("test_db", SUBSCRIPTION_DB_NAME, SUPPORT_DB_NAME, LOGS_DB_NAME)
+    for name in databases:
+        client.drop_database(name)
+    yield client
+    for name in databases:
+        client.drop_database(name)
+    client.close()
@@ -0,0 +1,703 @@
+"""In-memory stand-in for the subset of pymongo the library and its tests use.
+
+Kept with the tests rather than in the package: it emulates the server's
+operators closely enough for unit tests and benchmarks, but behaviour that
+matters in production is also checked against a real mongod (see the
+mongod_client fixture in conftest.py).
+"""
+import re
+from copy import deepcopy
+from datetime import datetime, timedelta, timezone
+from itertools import count
+from time import perf_counter, sleep
+from types import SimpleNamespace
+from pymongo import DeleteOne, InsertOne, ReplaceOne, ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+
+def _get_path(document: dict, path: str):
+    value = document
+    for key in path.split("."):
+        if isinstance(value, list):
+            # A path through an array resolves to the values of its elements, as on the server
+            value = [item[key] for item in value if isinstance(item, dict) and key in item]
+        elif isinstance(value, dict):
+            value = value.get(key)
+        else:
+            return None
+    return value
+
+
+def _set_path(document: dict, path: str, value) -> None:
+    *parents, last = path.split(".")
+    for key in parents:
+        document = document.setdefault(key, {})
+    document[last] = value
+
+
+def _unset_path(document: dict, path: str) -> None:
+    *parents, last = path.split(".")
+    for key in parents:
+        document = document.get(key)
+        if not isinstance(document, dict):
+            return
+    document.pop(last, None)
+
+
+def _compare(value, condition) -> bool:
+    if not isinstance(condition, dict) or not any(key.startswith("$") for key in condition):
+        # Equality also matches an element of an array field
+        return value == condition or (isinstance(value, list) and condition in value)
+    for operator, operand in condition.items():
+        if operator == "$in":
+            ok = value in operand
+        elif operator == "$nin":
+            ok = value not in operand
+        elif operator == "$ne":
+            ok = value != operand
+        elif operator == "$exists":
+            ok = (value is not None) == operand
+        elif value is None or type(value) is not type(operand):
+            # Comparisons only match values of the same type
+            ok = False
+        elif operator == "$gt":
+            ok = value > operand
+        elif operator == "$gte":
+            ok = value >= operand
+        elif operator == "$lt":
+            ok = value < operand
+        elif operator == "$lte":
+            ok = value <= operand
+        else:
+            raise NotImplementedError(f"Filter operator {operator}")
+        if not ok:
+            return False
+    return True
+
+
+def matches(document: dict, query: dict) -> bool:
+    """Whether a document matches a query filter."""
+    for key, condition in (query or {}).items():
+        if key == "$or":
+            if not any(matches(document, branch) for branch in condition):
+                return False
+        elif key == "$and":
+            if not all(matches(document, branch) for branch in condition):
+                return False
+        elif key == "$expr":
+            if not evaluate(condition, document):
+                return False
+        elif not _compare(_get_path(document, key), condition):
+            return False
+    return True
+
+
+def _date_to_string(date: datetime) -> str:
+    return date.strftime("%Y-%m-%dT%H:%M:%S.") + f"{date.microsecond // 1000:03d}"
+
+
+def _date_from_string(arg: dict, document: dict):
+    value = evaluate(arg["dateString"], document)
+    if value is None:
+        return evaluate(arg.get("onNull"), document)
+    try:
+        # The server accepts at most millisecond precision, unlike fromisoformat
+        if re.search(r"\.\d{4}", value):
+            raise ValueError(value)
+        date = datetime.fromisoformat(value)
+    except ValueError:
+        if "onError" not in arg:
+            raise OperationFailure(f"$dateFromString cannot parse {value!r}", code=241)
+        return evaluate(arg["onError"], document)
+    # The server converts offsets to UTC
+    return date.astimezone(timezone.utc).replace(tzinfo=None) if date.tzinfo else date
+
+
+def _regex_find(arg: dict, document: dict) -> dict | None:
+    value = evaluate(arg["input"], document)
+    match = re.search(arg["regex"], value) if isinstance(value, str) else None
+    if match is None:
+        return None
+    return {"match": match.group(0), "idx": match.start(), "captures": list(match.groups())}
+
+
+def _let(arg: dict, document: dict):
+    variables = {name: evaluate(value, document) for name, value in arg["vars"].items()}
+    return evaluate(arg["in"], {**document, "$$": {**document.get("$$", {}), **variables}})
+
+
+def _concat(arg: list, document: dict) -> str | None:
+    values = [evaluate(item, document) for item in arg]
+    return None if None in values else "".join(values)
+
+
+def _cond(arg, document: dict):
+    if isinstance(arg, dict):
+        arg = [arg["if"], arg["then"], arg["else"]]
+    return evaluate(arg[1] if evaluate(arg[0], document) else arg[2], document)
+
+
+def _array_elem_at(arg: list, document: dict):
+    array, index = evaluate(arg[0], document), evaluate(arg[1], document)
+    return array[index] if array is not None and -len(array) <= index < len(array) else None
+
+
+EXPRESSIONS = {
+    "$literal": lambda arg, document: arg,
+    "$ifNull": lambda arg, document: next(
+        (value for value in (evaluate(item, document) for item in arg) if value is not None), None
+    ),
+    "$concatArrays": lambda arg, document: [item for array in arg for item in evaluate(array, document)],
+    "$mergeObjects": lambda arg, document: {
+        key: value for item in arg for key, value in evaluate(item, document).items()
+    },
+    "$max": lambda arg, document: max(value for value in evaluate(arg, document) if value is not None),
+    "$ne": lambda arg, document: evaluate(arg[0], document) != evaluate(arg[1], document),
+    "$eq": lambda arg, document: evaluate(arg[0], document) == evaluate(arg[1], document),
+    "$in": lambda arg, document: evaluate(arg[0], document) in evaluate(arg[1], document),
+    "$cond": _cond,
+    "$substrCP": lambda arg, document: evaluate(arg[0], document)[
+        evaluate(arg[1], document):evaluate(arg[1], document) + evaluate(arg[2], document)
+    ],
+    "$concat": _concat,
+    "$arrayElemAt": _array_elem_at,
+    "$regexFind": _regex_find,
+    "$let": _let,
+    "$dateFromString": _date_from_string,
+    "$dateAdd": lambda arg, document: evaluate(arg["startDate"], document)
+    + timedelta(**{f"{arg['unit']}s": evaluate(arg["amount"], document)}),
+    "$dateToString": lambda arg, document: _date_to_string(evaluate(arg["date"], document)),
+}
+
+
+def evaluate(expression, document: dict):
+    """Evaluate an aggregation expression against a document."""
+    if isinstance(expression, str) and expression.startswith("$$"):
+        # Variable bound by $let
+        return _get_path(document.get("$$", {}), expression[2:])
+    if isinstance(expression, str) and expression.startswith("$"):
+        return _get_path(document, expression[1:])
+    if isinstance(expression, list):
+        return [evaluate(item, document) for item in expression]
+    if isinstance(expression, dict):
+        if len(expression) == 1:
+            operator, arg = next(iter(expression.items()))
+            if operator.startswith("$"):
+                if operator not in EXPRESSIONS:
+                    raise NotImplementedError(f"Expression operator {operator}")
+                return EXPRESSIONS[operator](arg, document)
+        return {key: evaluate(value, document) for key, value in expression.items()}
+    if isinstance(expression, (datetime, int, float, bool)) or expression is None:
+        return expression
+    return deepcopy(expression)
+
+
+def _project(document: dict | None, projection: dict = None) -> dict | None:
+    if document is None:
+        return None
+    if not projection:
+        return deepcopy(document)
+    included = {key for key, value in projection.items() if value and key != "_id"}
+    if included:
+        result = {key: deepcopy(document[key]) for key in included if key in document}
+        if projection.get("_id", 1) and "_id" in document:
+            result["_id"] = document["_id"]
+        return result
+    return {key: deepcopy(value) for key, value in document.items() if key not in projection}
+
+
+def _sort_key(value) -> tuple:
+    # Missing fields sort first, as null does on the server
+    return (value is not None, value if value is not None else 0)
+
+
+def _sort(documents: list, keys: list) -> list:
+    for field, direction in reversed(keys):
+        documents.sort(key=lambda document: _sort_key(_get_path(document, field)), reverse=direction < 0)
+    return documents
+
+
+class _CommandEvent(SimpleNamespace):
+    """Duck-typed pymongo command event handed to command listeners."""
+
+
+class MemoryCursor:
+    """Cursor fetching its results on iteration, in batches like the server.
+
+    The first batch holds 101 documents unless batch_size is set, every further
+    batch is a getMore command.
+    """
+
+    def __init__(self, collection: "MemoryCollection", query: dict, projection: dict = None, session=None):
+        self.collection = collection
+        self.query = query or {}
+        self.projection = projection
+        self.session = session
+        self._sort = []
+        self._limit = 0
+        self._skip = 0
+        self._batch_size = 0
+
+    def sort(self, key, direction: int = None) -> "MemoryCursor":
+        self._sort = key if isinstance(key, list) else [(key, direction or 1)]
+        return self
+
+    def limit(self, limit: int) -> "MemoryCursor":
+        self._limit = limit
+        return self
+
+    def skip(self, skip: int) -> "MemoryCursor":
+        self._skip = skip
+        return self
+
+    def batch_size(self, batch_size: int) -> "MemoryCursor":
+        self._batch_size = batch_size
+        return self
+
+    def _fetch(self) -> list:
+        documents = _sort(self.collection._find(self.query), self._sort)[self._skip:]
+        if self._limit:
+            documents = documents[:self._limit]
+        return [_project(document, self.projection) for document in documents]
+
+    def __iter__(self):
+        command = {"filter": self.query, "sort": dict(self._sort), "limit": self._limit}
+        documents = self.collection._command("find", command, self._fetch)
+        first_batch = self._batch_size or 101
+        yield from documents[:first_batch]
+        for start in range(first_batch, len(documents), self._batch_size or first_batch):
+            batch = self.collection.database.client._run(
+                self.collection.database.name,
+                "getMore",
+                {"getMore": 1, "collection": self.collection.name},
+                lambda start=start: documents[start:start + (self._batch_size or first_batch)],
+            )
+            yield from batch
+
+
+class MemoryCollection:
+    def __init__(self, database: "MemoryDatabase", name: str):
+        self.database = database
+        self.name = name
+        self.documents = {}
+        self.indexes = {"_id_": {"key": [("_id", 1)]}}
+        self._ids = count(1)
+
+    def _command(self, command_name: str, command: dict, operation):
+        return self.database.client._run(
+            self.database.name, command_name, {command_name: self.name, **command}, operation
+        )
+
+    def _find(self, query: dict) -> list:
+        return [document for document in self.documents.values() if matches(document, query)]
+
+    def _journal(self, session, document_id) -> None:
+        if session is not None:
+            session._journal(self, document_id)
+
+    def _check_unique(self, document: dict) -> None:
+        for name, index in self.indexes.items():
+            if not index.get("unique") or len(index["key"]) != 1:
+                continue
+            field = index["key"][0][0]
+            partial = index.get("partialFilterExpression") or {}
+            value = _get_path(document, field)
+            if value is None or not matches(document, partial):
+                continue
+            for other in self.documents.values():
+                if other is not document and other["_id"] != document.get("_id") and matches(other, partial):
+                    if _get_path(other, field) == value:
+                        raise DuplicateKeyError(f"E11000 duplicate key error index: {name} dup key: {value!r}")
+
+    def _insert(self, document: dict, session=None) -> object:
+        document = deepcopy(document)
+        document.setdefault("_id", next(self._ids))
+        if document["_id"] in self.documents:
+            raise DuplicateKeyError(f"E11000 duplicate key error index: _id_ dup key: {document['_id']!r}")
+        self._check_unique(document)
+        self._journal(session, document["_id"])
+        self.documents[document["_id"]] = document
+        return document["_id"]
+
+    def _apply(self, document: dict, update, inserting: bool = False) -> dict:
+        """Updated copy of a document."""
+        document = deepcopy(document)
+        if isinstance(update, list):
+            for stage in update:
+                for operator, values in stage.items():
+                    if operator == "$set":
+                        evaluated = {key: evaluate(value, document) for key, value in values.items()}
+                        for key, value in evaluated.items():
+                            _set_path(document, key, value)
+                    elif operator == "$unset":
+                        for key in [values] if isinstance(values, str) else values:
+                            _unset_path(document, key)
+                    else:
+                        raise NotImplementedError(f"Pipeline stage {operator}")
+            return document
+        if not any(key.startswith("$") for key in update):
+            # Replacement document
+            return {"_id": document.get("_id"), **deepcopy(update)}
+        for operator, values in update.items():
+            if operator == "$set" or (operator == "$setOnInsert" and inserting):
+                for key, value in values.items():
+                    _set_path(document, key, deepcopy(value))
+            elif operator == "$unset":
+                for key in values:
+                    _unset_path(document, key)
+            elif operator == "$inc":
+                for key, amount in values.items():
+                    _set_path(document, key, (_get_path(document, key) or 0) + amount)
+            elif operator == "$push":
+                for key, value in values.items():
+                    _set_path(document, key, (_get_path(document, key) or []) + [deepcopy(value)])
+            elif operator != "$setOnInsert":
+                raise NotImplementedError(f"Update operator {operator}")
+        return document
+
+    def _replace(self, old: dict, new: dict, session=None) -> None:
+        new["_id"] = old["_id"]
+        self._check_unique(new)
+        self._journal(session, old["_id"])
+        self.documents[old["_id"]] = new
+
+    def _upsert(self, query: dict, update, session=None) -> dict:
+        seed = {
+            key: value
+            for key, value in query.items()
+            if not key.startswith("$") and not (isinstance(value, dict) and any(k.startswith("$") for k in value))
+        }
+        document = self._apply(seed, update, inserting=True)
+        for key, value in seed.items():
+            if _get_path(document, key) is None:
+                _set_path(document, key, value)
+        document_id = self._insert(document, session)
+        return self.documents[document_id]
+
+    def _update(self, query: dict, update, upsert: bool, multi: bool, session) -> SimpleNamespace:
+        found = self._find(query)
+        if not multi:
+            found = found[:1]
+        modified = 0
+        for document in found:
+            updated = self._apply(document, update)
+            if updated != document:
+                self._replace(document, updated, session)
+                modified += 1
+        upserted_id = None
+        if not found and upsert:
+            upserted_id = self._upsert(query, update, session)["_id"]
+        return SimpleNamespace(matched_count=len(found), modified_count=modified, upserted_id=upserted_id)
+
+    def _delete(self, query: dict, multi: bool, session) -> SimpleNamespace:
+        found = self._find(query)
+        if not multi:
+            found = found[:1]
+        for document in found:
+            self._journal(session, document["_id"])
+            del self.documents[document["_id"]]
+        return SimpleNamespace(deleted_count=len(found))
+
+    def create_index(self, keys, unique: bool = False, name: str = None, **kwargs) -> str:
+        keys = [(keys, 1)] if isinstance(keys, str) else list(keys)
+        name = name or "_".join(f"{field}_{direction}" for field, direction in keys)
+
+        def create():
+            self.indexes[name] = {"key": keys, "unique": unique, **kwargs}
+            return name
+
+        return self._command("createIndexes", {"indexes": [{"key": dict(keys), "name": name}]}, create)
+
+    def index_information(self) -> dict:
+        return self._command("listIndexes", {}, lambda: deepcopy(self.indexes))
+
+    def drop_index(self, name: str) -> None:
+        self._command("dropIndexes", {"index": name}, lambda: self.indexes.pop(name))
+
+    def find(self, filter: dict = None, projection: dict = None, session=None, **kwargs) -> MemoryCursor:
+        cursor = MemoryCursor(self, filter, projection, session)
+        if "sort" in kwargs:
+            cursor.sort(kwargs["sort"])
+        return cursor.limit(kwargs.get("limit", 0)).batch_size(kwargs.get("batch_size", 0))
+
+    def find_one(self, filter: dict = None, projection: dict = None, session=None, **kwargs) -> dict | None:
+        return next(iter(self.find(filter, projection, session, **kwargs).limit(1)), None)
+
+    def count_documents(self, filter: dict, session=None, **kwargs) -> int:
+        return self._command("aggregate", {"pipeline": [{"$match": filter}]}, lambda: len(self._find(filter)))
+
+    def distinct(self, key: str, filter: dict = None, session=None) -> list:
+        def distinct():
+            values = []
+            for document in self._find(filter):
+                value = _get_path(document, key)
+                if value not in values:
+                    values.append(value)
+            return values
+
+        return self._command("distinct", {"key": key, "query": filter or {}}, distinct)
+
+    def aggregate(self, pipeline: list, session=None, **kwargs) -> list:
+        """Supports $match, $group with $sum, $sort, $skip and $limit stages."""
+        def aggregate():
+            documents = list(self.documents.values())
+            for stage in pipeline:
+                (operator, arg), = stage.items()
+                if operator == "$match":
+                    documents = [document for document in documents if matches(document, arg)]
+                elif operator == "$group":
+                    groups = {}
+                    for document in documents:
+                        key = evaluate(arg["_id"], document)
+                        group = groups.setdefault(repr(key), {"_id": key, **{field: 0 for field in arg if field != "_id"}})
+                        for field, accumulator in arg.items():
+                            if field != "_id":
+                                group[field] += evaluate(accumulator["$sum"], document) or 0
+                    documents = list(groups.values())
+                elif operator == "$sort":
+                    documents = _sort(list(documents), list(arg.items()))
+                elif operator == "$skip":
+                    documents = documents[arg:]
+                elif operator == "$limit":
+                    documents = documents[:arg]
+                else:
+                    raise NotImplementedError(f"Aggregation stage {operator}")
+            return [deepcopy(document) for document in documents]
+
+        return iter(self._command("aggregate", {"pipeline": pipeline}, aggregate))
+
+    def insert_one(self, document: dict, session=None, **kwargs) -> SimpleNamespace:
+        def insert():
+            document_id = self._insert(document, session)
+            # pymongo sets the generated _id on the passed document
+            document.setdefault("_id", document_id)
+            return SimpleNamespace(inserted_id=document_id)
+
+        return self._command("insert", {"documents": [document]}, insert)
+
+    def insert_many(self, documents: list, ordered: bool = True, session=None, **kwargs) -> SimpleNamespace:
+        def insert():
+            return SimpleNamespace(inserted_ids=[self._insert(document, session) for document in documents])
+
+        return self._command("insert", {"documents": documents, "ordered": ordered}, insert)
+
+    def update_one(self, filter: dict, update, upsert: bool = False, session=None, **kwargs) -> SimpleNamespace:
+        return self._command(
+            "update",
+            {"updates": [{"q": filter, "u": update, "upsert": upsert}]},
+            lambda: self._update(filter, update, upsert, False, session),
+        )
+
+    def update_many(self, filter: dict, update, upsert: bool = False, session=None, **kwargs) -> SimpleNamespace:
+        return self._command(
+            "update",
+            {"updates": [{"q": filter, "u": update, "upsert": upsert, "multi": True}]},
+            lambda: self._update(filter, update, upsert, True, session),
+        )
+
+    def replace_one(self, filter: dict, replacement: dict, upsert: bool = False, session=None, **kwargs) -> SimpleNamespace:
+        return self._command(
+            "update",
+            {"updates": [{"q": filter, "u": replacement, "upsert": upsert}]},
+            lambda: self._update(filter, replacement, upsert, False, session),
+        )
+
+    def delete_one(self, filter: dict, session=None, **kwargs) -> SimpleNamespace:
+        return self._command(
+            "delete", {"deletes": [{"q": filter, "limit": 1}]}, lambda: self._delete(filter, False, session)
+        )
+
+    def delete_many(self, filter: dict, session=None, **kwargs) -> SimpleNamespace:
+        return self._command(
+            "delete", {"deletes": [{"q": filter, "limit": 0}]}, lambda: self._delete(filter, True, session)
+        )
+
+    def bulk_write(self, requests: list, ordered: bool = True, session=None, **kwargs) -> SimpleNamespace:
+        """One command per run of consecutive requests of the same kind, as the driver sends them."""
+        result = SimpleNamespace(inserted_count=0, matched_count=0, modified_count=0, deleted_count=0, upserted_count=0)
+        runs = []
+        for request in requests:
+            kind = "insert" if isinstance(request, InsertOne) else "delete" if isinstance(request, DeleteOne) else "update"
+            if runs and runs[-1][0] == kind:
+                runs[-1][1].append(request)
+            else:
+                runs.append((kind, [request]))
+
+        for kind, run in runs:
+            def write(kind=kind, run=run):
+                for request in run:
+                    if kind == "insert":
+                        self._insert(request._doc, session)
+                        result.inserted_count += 1
+                    elif kind == "delete":
+                        result.deleted_count += self._delete(request._filter, False, session).deleted_count
+                    else:
+                        multi = not isinstance(request, (ReplaceOne, UpdateOne))
+                        updated = self._update(request._filter, request._doc, request._upsert, multi, session)
+                        result.matched_count += updated.matched_count
+                        result.modified_count += updated.modified_count
+                        result.upserted_count += updated.upserted_id is not None
+
+            self._command(kind, {"ordered": ordered, "n": len(run)}, write)
+        return result
+
+    def find_one_and_update(
+        self,
+        filter: dict,
+        update,
+        projection: dict = None,
+        sort: list = None,
+        upsert: bool = False,
+        return_document: bool = ReturnDocument.BEFORE,
+        session=None,
+        **kwargs,
+    ) -> dict | None:
+        def find_and_modify():
+            found = _sort(self._find(filter), sort or [])
+            if found:
+                before = found[0]
+                after = self._apply(before, update)
+                self._replace(before, after, session)
+                return _project(after if return_document == ReturnDocument.AFTER else before, projection)
+            if upsert:
+                document = self._upsert(filter, update, session)
+                return _project(document, projection) if return_document == ReturnDocument.AFTER else None
+            return None
+
+        return self._command(
+            "findAndModify", {"query": filter, "update": update, "upsert": upsert}, find_and_modify
+        )
+
+
+class MemoryDatabase:
+    def __init__(self, client: "MemoryMongoClient", name: str):
+        self.client = client
+        self.name = name
+        self._collections = {}
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        if name not in self._collections:
+            self._collections[name] = MemoryCollection(self, name)
+        return self._collections[name]
+
+    def list_collection_names(self) -> list:
+        return [name for name, collection in self._collections.items() if collection.documents]
+
+    def create_collection(self, name: str, **kwargs) -> MemoryCollection:
+        return self[name]
+
+    def command(self, command: str | dict, **kwargs) -> dict:
+        command_name = command if isinstance(command, str) else next(iter(command))
+        if command_name != "hello":
+            raise NotImplementedError(f"Command {command_name}")
+        # Transactions are supported, as on a replica set member
+        return self.client._run(
+            self.name, "hello", {"hello": 1}, lambda: {"isWritablePrimary": True, "setName": "memory", "ok": 1}
+        )
+
+
+class MemorySession:
+    """Session running transactions that are undone when their callback raises.
+
+    Transactions are not isolated from other sessions.
+    """
+
+    def __init__(self, client: "MemoryMongoClient"):
+        self.client = client
+        self._undo = None
+
+    def __enter__(self) -> "MemorySession":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+    def _journal(self, collection: MemoryCollection, document_id) -> None:
+        if self._undo is not None and (collection, document_id) not in self._undo:
+            self._undo[(collection, document_id)] = deepcopy(collection.documents.get(document_id))
+
+    def with_transaction(self, callback, **kwargs):
+        self._undo = {}
+        try:
+            result = callback(self)
+        except BaseException:
+            for (collection, document_id), document in self._undo.items():
+                if document is None:
+                    collection.documents.pop(document_id, None)
+                else:
+                    collection.documents[document_id] = document
+            self.client._run("admin", "abortTransaction", {"abortTransaction": 1}, lambda: None)
+            raise
+        finally:
+            undo, self._undo = self._undo, None
+        self.client._run("admin", "commitTransaction", {"commitTransaction": 1}, lambda: None)
+        return result
+
+
+class MemoryMongoClient:
+    """In-memory stand-in for the subset of pymongo.MongoClient the library uses.
+
+    Supports the filters, update operators, aggregation expressions and stages
+    the library's queries use, unique and partial unique indexes, and
+    transactions. Every operation is reported to the command listeners passed as
+    event_listeners like a real client reports its commands, so metrics, tracing
+    and RoundTripCounter work against it. latency seconds are slept per command
+    to mimic a network round trip.
+
+    Usage:
+        client = MemoryMongoClient(event_listeners=[round_trip_listener])
+        MongoManager(mongo_database_name="test", client=client)
+    """
+
+    def __init__(self, event_listeners: list = (), latency: float = 0.0):
+        self.listeners = list(event_listeners)
+        self.latency = latency
+        self._databases = {}
+        self._request_ids = count(1)
+
+    def __getitem__(self, name: str) -> MemoryDatabase:
+        if name not in self._databases:
+            self._databases[name] = MemoryDatabase(self, name)
+        return self._databases[name]
+
+    @property
+    def admin(self) -> MemoryDatabase:
+        return self["admin"]
+
+    def get_database(self, name: str) -> MemoryDatabase:
+        return self[name]
+
+    def start_session(self) -> MemorySession:
+        return MemorySession(self)
+
+    def close(self) -> None:
+        pass
+
+    def _run(self, database_name: str, command_name: str, command: dict, operation):
+        request_id = next(self._request_ids)
+        event = _CommandEvent(
+            command_name=command_name,
+            command=command,
+            database_name=database_name,
+            request_id=request_id,
+            operation_id=request_id,
+            connection_id=("memory", 0),
+        )
+        for listener in self.listeners:
+            listener.started(event)
+        started = perf_counter()
+        if self.latency:
+            sleep(self.latency)
+        try:
+            result = operation()
+        except Exception as e:
+            event.duration_micros = int((perf_counter() - started) * 1e6)
+            event.failure = {"errmsg": str(e)}
+            for listener in self.listeners:
+                listener.failed(event)
+            raise
+        event.duration_micros = int((perf_counter() - started) * 1e6)
+        event.reply = {"ok": 1}
+        for listener in self.listeners:
+            listener.succeeded(event)
+        return result
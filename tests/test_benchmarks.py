@@ -0,0 +1,67 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def run_benchmark(script: str, *args: str) -> subprocess.CompletedProcess:
+    # A separate process, as the benchmark configures the library through the environment
+    env = {**os.environ, "PYTHONPATH": str(ROOT / "src")}
+    env.pop("MONGO_URI", None)
+    return subprocess.run(
+        [sys.executable, str(ROOT / "benchmarks" / script), *args],
+        capture_output=True, text=True, env=env, timeout=120,
+    )
+
+
+def test_e2e_benchmark_memory_backend(tmp_path):
+    output = tmp_path / "e2e.json"
+    result = run_benchmark("e2e.py", "--updates", "60", "--warmup", "10", "--concurrency", "4", "--output", str(output))
+    assert result.returncode == 0, result.stderr
+
+    results = json.loads(output.read_text())
+    assert results["benchmark"] == "e2e"
+    assert results["errors"] == 0
+    assert results["updates"] >= 60
+    assert results["updates_per_second"] > 0
+    assert set(results["scenarios"]) <= {"subscribe", "status", "action", "support_command", "support_message", "payment"}
+    for scenario in results["scenarios"].values():
+        assert scenario["p50_ms"] <= scenario["p95_ms"] <= scenario["p99_ms"]
+        assert scenario["bot_calls_per_update"] >= 1
+    # The middleware loads the user once; /status then reads the subscription
+    assert results["scenarios"]["status"]["db_ops_per_update"] >= 2
+
+
+def test_micro_benchmark_compare_flags_regressions(tmp_path):
+    results_path = tmp_path / "micro.json"
+    result = run_benchmark(
+        "micro.py", "--filter", "translation", "--repeat", "2", "--min-time", "0.001", "--save", str(results_path)
+    )
+    assert result.returncode == 0, result.stderr
+    results = json.loads(results_path.read_text())
+    assert set(results["results"]) == {
+        "translation.t.hit", "translation.t.miss", "translation.t.fallback", "translation.t.kwargs"
+    }
+
+    # A baseline ten times faster than the current code
+    baseline = {
+        **results,
+        "results": {name: {**case, "min_ns": case["min_ns"] / 10} for name, case in results["results"].items()},
+    }
+    baseline_path = tmp_path / "baseline.json"
+    baseline_path.write_text(json.dumps(baseline))
+    result = run_benchmark(
+        "micro.py", "--filter", "translation.t.hit", "--repeat", "2", "--min-time", "0.001",
+        "--compare", str(baseline_path), "--threshold", "0.5",
+    )
+    assert result.returncode == 1
+    assert "REGRESSION translation.t.hit" in result.stdout
+
+
+def test_micro_baseline_covers_all_cases():
+    baseline = json.loads((ROOT / "benchmarks" / "baselines" / "micro.json").read_text())
+    assert {"translation.t.hit", "utils.get_subscription_keyboard", "mongo.get_user_info",
+            "mongo.check_subscription_status", "logger.log_action"} <= set(baseline["results"])
@@ -0,0 +1,100 @@
+import os
+
+os.environ["MONGO_URI"] = "mongodb://localhost:27017"
+os.environ["SUBSCRIPTION_DB_NAME"] = "subscription_db"
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from telegram.error import BadRequest, Forbidden
+from telegram_libs.broadcast import Broadcast
+from telegram_libs.rate_limiter import PRIORITY_BULK
+
+
+def make_checkpoint(**kwargs):
+    return {
+        "_id": "news",
+        "text": "Hello",
+        "premium_only": None,
+        "status": "running",
+        "last_id": None,
+        "batches": 0,
+        **kwargs,
+    }
+
+
+@pytest.fixture
+def mongo_manager():
+    manager = MagicMock()
+    manager.broadcasts = MagicMock()
+    manager.db.__getitem__.return_value = manager.broadcasts
+    manager.broadcasts.find_one.return_value = make_checkpoint()
+    return manager
+
+
+def set_user_batches(mongo_manager, *batches):
+    batches = [[{"_id": user_id, "user_id": user_id} for user_id in batch] for batch in batches]
+    mongo_manager.users_collection.find.return_value.sort.return_value.limit.side_effect = [*batches, []]
+
+
+@pytest.fixture
+def bot():
+    bot = MagicMock()
+    bot.send_message = AsyncMock()
+    return bot
+
+
+@pytest.mark.asyncio
+async def test_broadcast_sends_in_batches_and_checkpoints(bot, mongo_manager):
+    set_user_batches(mongo_manager, [1, 2], [3])
+    bot.send_message.side_effect = [None, Forbidden("blocked"), BadRequest("chat not found")]
+    reports = []
+
+    await Broadcast(bot, mongo_manager, "news", "Hello", batch_size=2, on_batch=reports.append).run()
+
+    bot.send_message.assert_any_await(chat_id=1, text="Hello", rate_limit_args={"priority": PRIORITY_BULK})
+    assert [(r.batch, r.users, r.sent, r.blocked, r.failed) for r in reports] == [(1, 2, 1, 1, 0), (2, 1, 0, 0, 1)]
+    checkpoints = [c for c in mongo_manager.broadcasts.update_one.call_args_list if "$inc" in c.args[1]]
+    assert [c.args[1]["$set"]["last_id"] for c in checkpoints] == [2, 3]
+    assert mongo_manager.broadcasts.update_one.call_args.args[1]["$set"]["status"] == "done"
+    assert mongo_manager.users_collection.find.call_args_list[1].args == ({"_id": {"$gt": 2}}, {"user_id": 1})
+
+
+@pytest.mark.asyncio
+async def test_broadcast_resumes_from_checkpoint(bot, mongo_manager):
+    mongo_manager.broadcasts.find_one.return_value = make_checkpoint(text="Saved", last_id=10, batches=3)
+    set_user_batches(mongo_manager, [11])
+    reports = []
+
+    await Broadcast(bot, mongo_manager, "news", on_batch=reports.append).run()
+
+    assert mongo_manager.users_collection.find.call_args_list[0].args[0] == {"_id": {"$gt": 10}}
+    bot.send_message.assert_awaited_once_with(chat_id=11, text="Saved", rate_limit_args={"priority": PRIORITY_BULK})
+    assert reports[0].batch == 4
+
+
+@pytest.mark.asyncio
+async def test_broadcast_premium_filter_uses_one_lookup_per_batch(bot, mongo_manager):
+    set_user_batches(mongo_manager, [1, 2, 3])
+    mongo_manager.subscription_collection.find.return_value = [{"user_id": 2}]
+
+    await Broadcast(bot, mongo_manager, "news", "Hello", premium_only=False).run()
+
+    mongo_manager.subscription_collection.find.assert_called_once()
+    assert mongo_manager.subscription_collection.find.call_args.args[0]["user_id"] == {"$in": [1, 2, 3]}
+    assert [c.kwargs["chat_id"] for c in bot.send_message.await_args_list] == [1, 3]
+
+
+@pytest.mark.asyncio
+async def test_finished_broadcast_is_not_resent(bot, mongo_manager):
+    mongo_manager.broadcasts.find_one.return_value = make_checkpoint(status="done")
+
+    await Broadcast(bot, mongo_manager, "news", "Hello").run()
+
+    bot.send_message.assert_not_awaited()
+    mongo_manager.users_collection.find.assert_not_called()
+
+
+def test_broadcast_requires_rate_limiter(mongo_manager):
+    bot = MagicMock(rate_limiter=None)
+    with pytest.raises(ValueError):
+        Broadcast(bot, mongo_manager, "news", "Hello")
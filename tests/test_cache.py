@@ -0,0 +1,35 @@
+from unittest.mock import patch
+from telegram_libs.cache import TTLCache
+
+
+def test_get_set_and_invalidate():
+    cache = TTLCache(ttl=60)
+    cache.set("a", 1)
+
+    assert cache.get("a") == 1
+    assert "a" in cache
+    cache.invalidate("a")
+    assert cache.get("a", "missing") == "missing"
+
+
+def test_entries_expire():
+    cache = TTLCache(ttl=10)
+    with patch("telegram_libs.cache.monotonic", return_value=100):
+        cache.set("a", 1)
+    with patch("telegram_libs.cache.monotonic", return_value=109):
+        assert cache.get("a") == 1
+    with patch("telegram_libs.cache.monotonic", return_value=110):
+        assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_least_recently_used_entry_evicted():
+    cache = TTLCache(ttl=60, maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert "a" in cache
+    assert "b" not in cache
+    assert "c" in cache
@@ -0,0 +1,152 @@
+import os
+
+os.environ["MONGO_URI"] = "mongodb://localhost:27017"
+os.environ["SUBSCRIPTION_DB_NAME"] = "subscription_db"
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from telegram import Update
+from telegram.ext import Application
+from telegram_libs.eviction import EVICTION_GROUP, DataEvictor
+from telegram_libs.testing import FakeTelegramRequest
+
+
+def make_update(update_id, user_id):
+    return Update.de_json(
+        {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": 0,
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": user_id, "is_bot": False, "first_name": "User"},
+                "text": "hi",
+            },
+        },
+        None,
+    )
+
+
+@pytest.fixture
+def app():
+    return Application.builder().token("1:fake").request(FakeTelegramRequest()).build()
+
+
+async def touch_users(evictor, app, clock, user_ids):
+    for user_id in user_ids:
+        clock.return_value += 1
+        await evictor.touch(make_update(user_id, user_id), None)
+        app._user_data[user_id]["key"] = user_id
+
+
+def test_install_registers_touch_and_job(app):
+    evictor = DataEvictor(interval=60)
+    evictor.install(app)
+    assert evictor.touch in [h.callback for h in app.handlers[EVICTION_GROUP]]
+    assert app.job_queue.get_jobs_by_name("data_eviction")
+
+
+@pytest.mark.asyncio
+@patch("telegram_libs.eviction.monotonic")
+async def test_idle_entries_evicted(clock, app):
+    clock.return_value = 0
+    evictor = DataEvictor(max_idle=10)
+    evictor.app = app
+    await touch_users(evictor, app, clock, [1, 2, 3])
+
+    clock.return_value = 12.5
+    assert await evictor.evict() == 2
+
+    assert set(app.user_data) == {3}
+    assert set(app.chat_data) == set()
+    assert evictor.metrics["evicted_users"] == 2
+    assert evictor.metrics["resident_users"] == 1
+    assert evictor.evicted_idle == 2
+
+
+@pytest.mark.asyncio
+@patch("telegram_libs.eviction.monotonic")
+async def test_least_recently_used_evicted_above_limit(clock, app):
+    clock.return_value = 0
+    evictor = DataEvictor(max_idle=100, max_entries=2)
+    evictor.app = app
+    await touch_users(evictor, app, clock, [1, 2, 3])
+    # User 1 is used again
+    await touch_users(evictor, app, clock, [1])
+
+    await evictor.evict()
+
+    assert set(app.user_data) == {3, 1}
+    assert evictor.metrics["evicted_over_limit"] == 1
+
+
+@pytest.mark.asyncio
+@patch("telegram_libs.eviction.monotonic")
+async def test_spill_writes_persistence_before_evicting(clock, app):
+    clock.return_value = 0
+    evictor = DataEvictor(max_idle=10)
+    evictor.app = app
+    persistence = MagicMock(flush=AsyncMock())
+    app.persistence = persistence
+    app.update_persistence = AsyncMock()
+    await touch_users(evictor, app, clock, [1])
+
+    clock.return_value = 20
+    await evictor.evict()
+
+    # Once to spill, once to hand over the drops
+    assert app.update_persistence.await_count == 2
+    persistence.flush.assert_awaited_once()
+    persistence.forget.assert_any_call("user_data", 1)
+    assert 1 not in app.user_data
+
+
+@pytest.mark.asyncio
+@patch("telegram_libs.eviction.monotonic")
+async def test_evicted_data_kept_by_mongo_persistence(clock):
+    from telegram_libs.mongo import MongoManager
+    from telegram_libs.persistence import MongoPersistence
+    from memory_mongo import MemoryMongoClient
+
+    persistence = MongoPersistence(MongoManager(mongo_database_name="test_db", client=MemoryMongoClient()))
+    app = Application.builder().token("1:fake").request(FakeTelegramRequest()).persistence(persistence).build()
+    clock.return_value = 0
+    evictor = DataEvictor(max_idle=10)
+    evictor.app = app
+    await touch_users(evictor, app, clock, [1])
+    app.mark_data_for_update_persistence(user_ids=1)
+
+    clock.return_value = 20
+    async with app:
+        await evictor.evict()
+        await persistence.flush()
+
+    assert 1 not in app.user_data
+    assert persistence._load("user_data", 1) == {"key": 1}
+
+
+def test_install_refuses_persistence_without_lazy_reload(app):
+    from telegram.ext import DictPersistence
+
+    app = Application.builder().token("1:fake").request(FakeTelegramRequest()).persistence(DictPersistence()).build()
+
+    with pytest.raises(RuntimeError, match="DictPersistence"):
+        DataEvictor().install(app)
+
+
+@pytest.mark.asyncio
+@patch("telegram_libs.eviction.monotonic")
+async def test_evict_keeps_data_of_persistence_without_lazy_reload(clock, app):
+    clock.return_value = 0
+    evictor = DataEvictor(max_idle=10, spill=False)
+    evictor.app = app
+    app.persistence = MagicMock(spec=["flush"])
+    app.update_persistence = AsyncMock()
+    await touch_users(evictor, app, clock, [1])
+
+    clock.return_value = 20
+    with pytest.raises(RuntimeError):
+        await evictor.evict()
+
+    assert app.user_data[1] == {"key": 1}
+    assert 1 not in app._user_ids_to_be_deleted_in_persistence
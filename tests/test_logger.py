@@ -93,4 +93,50 @@ class TestBotLogger:
             "timestamp": "2024-01-01T12:00:00",
             "details": {},
         }
-        mock_collection.insert_one.assert_called_once_with(expected_log_entry) 
\ No newline at end of file
+        mock_collection.insert_one.assert_called_once_with(expected_log_entry) 
+    def test_log_action_batched(self, mock_mongo_manager):
+        MockMongoManager_class, mock_collection = mock_mongo_manager
+        logger = BotLogger(batch_size=2)
+
+        logger.log_action(1, "first", "TestBot")
+        mock_collection.insert_one.assert_not_called()
+        mock_collection.insert_many.assert_called_once()
+        assert mock_collection.insert_many.call_args.args[0][0]["action_type"] == "first"
+
+    @pytest.mark.asyncio
+    async def test_log_action_batched_in_event_loop(self, mock_mongo_manager):
+        MockMongoManager_class, mock_collection = mock_mongo_manager
+        logger = BotLogger(batch_size=3, flush_interval=60)
+
+        logger.log_action(1, "first", "TestBot")
+        logger.log_action(2, "second", "TestBot")
+        mock_collection.insert_many.assert_not_called()
+
+        import threading
+
+        insert_threads = []
+        mock_collection.insert_many.side_effect = lambda *args, **kwargs: insert_threads.append(threading.get_ident())
+        logger.log_action(3, "third", "TestBot")
+        await logger.aflush()
+        entries = mock_collection.insert_many.call_args.args[0]
+        assert [entry["action_type"] for entry in entries] == ["first", "second", "third"]
+        assert logger._flush_handle is None
+        # Written from a worker thread, not the event loop
+        assert insert_threads and insert_threads[0] != threading.get_ident()
+
+    def test_batching_loggers_flushed_at_exit_without_being_kept(self, mock_mongo_manager):
+        import gc
+        import weakref
+        from telegram_libs.logger import _flush_batching_loggers
+
+        MockMongoManager_class, mock_collection = mock_mongo_manager
+        logger = BotLogger(batch_size=10)
+        logger._buffer.append({"action_type": "buffered"})
+
+        _flush_batching_loggers()
+        mock_collection.insert_many.assert_called_once()
+
+        reference = weakref.ref(logger)
+        del logger
+        gc.collect()
+        assert reference() is None
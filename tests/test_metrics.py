@@ -0,0 +1,102 @@
+import os
+
+os.environ["MONGO_URI"] = "mongodb://localhost:27017"
+os.environ["SUBSCRIPTION_DB_NAME"] = "subscription_db"
+
+import asyncio
+import urllib.request
+from types import SimpleNamespace
+import pytest
+from telegram_libs import metrics
+from telegram_libs.metrics import (
+    Histogram,
+    MetricsRegistry,
+    MongoCommandListener,
+    current_handler,
+    instrument_handler,
+    start_metrics_server,
+)
+
+
+@pytest.fixture
+def enabled_registry(monkeypatch):
+    registry = MetricsRegistry(enabled=True)
+    monkeypatch.setattr(metrics, "registry", registry)
+    return registry
+
+
+def test_histogram_quantiles():
+    histogram = Histogram(buckets=(0.01, 0.1, 1.0))
+    for value in (0.005, 0.01, 0.05, 0.5, 2.0):
+        histogram.observe(value)
+
+    assert histogram.counts == [2, 1, 1, 1]
+    assert histogram.quantile(0.5) == 0.1
+    assert histogram.quantile(1.0) == float("inf")
+
+
+def test_disabled_registry_records_nothing():
+    registry = MetricsRegistry(enabled=False)
+    registry.observe("handler_seconds", {"handler": "x"}, 0.1)
+    assert registry.get_stats() == {}
+
+
+def test_prometheus_text(enabled_registry):
+    enabled_registry.observe("handler_seconds", {"handler": "subscribe_command"}, 0.003)
+
+    text = enabled_registry.render_prometheus()
+
+    assert "# TYPE handler_seconds histogram" in text
+    assert 'handler_seconds_bucket{handler="subscribe_command",le="0.005"} 1' in text
+    assert 'handler_seconds_bucket{handler="subscribe_command",le="+Inf"} 1' in text
+    assert 'handler_seconds_count{handler="subscribe_command"} 1' in text
+
+
+def test_listener_attributes_commands_to_handler(enabled_registry):
+    listener = MongoCommandListener()
+    token = current_handler.set("successful_payment")
+    listener.started(SimpleNamespace(request_id=1, command_name="insert", command={"insert": "order"}))
+    current_handler.reset(token)
+    listener.succeeded(SimpleNamespace(request_id=1, duration_micros=2500))
+
+    [stat] = enabled_registry.get_stats()["mongo_command_seconds"]
+    assert stat["labels"] == {
+        "handler": "successful_payment",
+        "command": "insert",
+        "collection": "order",
+        "status": "ok",
+    }
+    assert stat["sum"] == 0.0025
+
+
+def test_instrument_handler_disabled_returns_callback():
+    async def handler(update, context):
+        pass
+
+    assert instrument_handler(handler, "handler") is handler
+
+
+@pytest.mark.asyncio
+async def test_instrument_handler_times_and_sets_handler(enabled_registry):
+    seen = []
+
+    async def handler(update, context):
+        # Database calls run in threads, which inherit the context
+        seen.append(await asyncio.to_thread(current_handler.get))
+
+    await instrument_handler(handler, "subscribe_command")(None, None)
+
+    assert seen == ["subscribe_command"]
+    assert current_handler.get() == "none"
+    assert enabled_registry.get_stats()["handler_seconds"][0]["count"] == 1
+
+
+def test_metrics_server(enabled_registry):
+    enabled_registry.observe("handler_seconds", {"handler": "x"}, 0.1)
+    server = start_metrics_server(port=0, host="127.0.0.1")
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url) as response:
+            assert 'handler_seconds_count{handler="x"} 1' in response.read().decode()
+    finally:
+        server.shutdown()
@@ -0,0 +1,170 @@
+import os
+
+os.environ["MONGO_URI"] = "mongodb://localhost:27017"
+os.environ["SUBSCRIPTION_DB_NAME"] = "subscription_db"
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from telegram import Update
+from telegram.ext import Application, ApplicationHandlerStop, CallbackContext, TypeHandler
+from telegram_libs.middleware import (
+    Middleware,
+    MiddlewareApplication,
+    MIDDLEWARE_GROUP,
+    get_update_state,
+    get_user_info,
+)
+from telegram_libs.mongo import MongoManager
+from telegram_libs.subscription import subscribe_command
+
+
+@pytest.fixture
+def mongo_manager():
+    manager = MagicMock(spec=MongoManager)
+    manager.get_user_info.return_value = {"user_id": 123, "lang": "ru"}
+    return manager
+
+
+@pytest.fixture
+def update():
+    update = MagicMock(spec=Update)
+    update.effective_user.id = 123
+    update.message.reply_text = AsyncMock()
+    update.effective_message = update.message
+    return update
+
+
+@pytest.fixture
+def context():
+    context = MagicMock(spec=CallbackContext)
+    context.bot.name = "TestBot"
+    return context
+
+
+def test_install_adds_open_handler(mongo_manager):
+    app = MagicMock()
+    Middleware(mongo_manager, MagicMock()).install(app)
+
+    groups = [c.kwargs["group"] for c in app.add_handler.call_args_list]
+    assert groups == [MIDDLEWARE_GROUP]
+    assert isinstance(app.add_handler.call_args.args[0], TypeHandler)
+
+
+@pytest.mark.asyncio
+async def test_failed_and_stopped_updates_are_timed(mongo_manager):
+    from telegram_libs.testing import FakeTelegramRequest
+
+    app = (
+        Application.builder()
+        .application_class(MiddlewareApplication)
+        .token("1:fake")
+        .request(FakeTelegramRequest())
+        .build()
+    )
+    middleware = Middleware(mongo_manager, MagicMock())
+    middleware.install(app)
+
+    async def handle(update, context):
+        if update.update_id == 1:
+            raise ValueError("boom")
+        if update.update_id == 2:
+            raise ApplicationHandlerStop
+
+    app.add_handler(TypeHandler(Update, handle))
+    async with app:
+        for update_id in (1, 2, 3):
+            await app.process_update(Update(update_id))
+
+    assert len(middleware.timings) == 3
+
+
+@pytest.mark.asyncio
+async def test_user_loaded_at_most_once(mongo_manager, update, context):
+    middleware = Middleware(mongo_manager, MagicMock())
+    await middleware.open_update(update, context)
+    mongo_manager.get_user_info.assert_not_called()
+
+    assert get_user_info(update, context, mongo_manager)["lang"] == "ru"
+    assert get_update_state(context).lang == "ru"
+    mongo_manager.get_user_info.assert_called_once_with(update)
+
+
+def test_get_user_info_without_middleware(mongo_manager, update, context):
+    assert get_update_state(context) is None
+    assert get_user_info(update, context, mongo_manager) == {"user_id": 123, "lang": "ru"}
+
+
+@pytest.mark.asyncio
+async def test_handler_consumes_middleware_state(mongo_manager, update, context):
+    await Middleware(mongo_manager, MagicMock()).open_update(update, context)
+    get_update_state(context).user_info
+
+    await subscribe_command(update, context, mongo_manager, MagicMock())
+
+    mongo_manager.get_user_info.assert_called_once_with(update)
+
+
+@pytest.mark.asyncio
+async def test_rate_limited_update_stops_handlers(mongo_manager, update, context):
+    rate_limit_manager = MagicMock()
+    rate_limit_manager.check_limit_with_response = AsyncMock(return_value=False)
+    rate_limit_filter = MagicMock()
+    rate_limit_filter.check_update.return_value = True
+    middleware = Middleware(mongo_manager, MagicMock(), rate_limit_manager, rate_limit_filter)
+
+    with pytest.raises(ApplicationHandlerStop):
+        await middleware.open_update(update, context)
+
+    rate_limit_manager.check_limit_with_response.assert_called_once_with(update, context, 123)
+
+
+@pytest.mark.asyncio
+async def test_rate_limited_callback_query_replies_to_its_message(mongo_manager, context):
+    from telegram import Bot
+    from telegram_libs.testing import FakeTelegramRequest
+    from telegram_libs.utils import RateLimitManager
+
+    request = FakeTelegramRequest()
+    async with Bot("1:fake", request=request) as bot:
+        update = Update.de_json(
+            {
+                "update_id": 1,
+                "callback_query": {
+                    "id": "1",
+                    "chat_instance": "1",
+                    "data": "action",
+                    "from": {"id": 123, "is_bot": False, "first_name": "User"},
+                    "message": {
+                        "message_id": 5,
+                        "date": 0,
+                        "chat": {"id": 123, "type": "private"},
+                        "text": "Pick an action",
+                    },
+                },
+            },
+            bot,
+        )
+        rate_limit_manager = RateLimitManager(mongo_manager)
+        rate_limit_manager.check_and_increment = MagicMock(return_value=False)
+        rate_limit_filter = MagicMock()
+        rate_limit_filter.check_update.return_value = True
+        middleware = Middleware(mongo_manager, MagicMock(), rate_limit_manager, rate_limit_filter)
+
+        with pytest.raises(ApplicationHandlerStop):
+            await middleware.open_update(update, context)
+
+    assert [endpoint for endpoint, _ in request.calls[-3:]] == ["sendMessage"] * 3
+    assert all(data["chat_id"] == 123 for _, data in request.calls[-3:])
+
+
+@pytest.mark.asyncio
+async def test_unfiltered_update_not_rate_limited(mongo_manager, update, context):
+    rate_limit_manager = MagicMock()
+    rate_limit_manager.check_limit_with_response = AsyncMock(return_value=False)
+    rate_limit_filter = MagicMock()
+    rate_limit_filter.check_update.return_value = False
+    middleware = Middleware(mongo_manager, MagicMock(), rate_limit_manager, rate_limit_filter)
+
+    await middleware.open_update(update, context)
+
+    rate_limit_manager.check_limit_with_response.assert_not_called()
@@ -171,4 +171,122 @@ class TestMongoManager:
         
         mongo_manager.payments_collection.update_one.assert_called_once_with(
             {"user_id": user_id, "order_id": order_id}, {"$set": updates}
-        ) 
\ No newline at end of file
+        ) 
+    def test_ensure_indexes(self, mongo_manager):
+        mongo_manager.ensure_indexes()
+
+        mongo_manager.payments_collection.create_index.assert_any_call(
+            "telegram_payment_charge_id",
+            unique=True,
+            partialFilterExpression={"telegram_payment_charge_id": {"$gt": ""}},
+        )
+
+    def test_ensure_indexes_drops_provider_charge_id_index(self, mongo_manager):
+        mongo_manager.payments_collection.index_information.return_value = {
+            "_id_": {"key": [("_id", 1)]},
+            "order_id_1": {"key": [("order_id", 1)], "unique": True},
+        }
+
+        mongo_manager.ensure_indexes()
+
+        mongo_manager.payments_collection.drop_index.assert_called_once_with("order_id_1")
+
+    @pytest.mark.parametrize(
+        "index",
+        [{"key": [("order_id", 1)]}, {"key": [("order_id", -1)], "unique": True}],
+    )
+    def test_ensure_indexes_keeps_other_order_id_indexes(self, mongo_manager, index):
+        mongo_manager.payments_collection.index_information.return_value = {"order_id_1": index}
+
+        mongo_manager.ensure_indexes()
+
+        mongo_manager.payments_collection.drop_index.assert_not_called()
+
+    def test_ensure_indexes_warns_without_transactions(self, mongo_manager, caplog):
+        mongo_manager.client.admin.command.return_value = {"isWritablePrimary": True}
+
+        mongo_manager.ensure_indexes()
+
+        assert "transactions are not available" in caplog.text
+        mongo_manager.payments_collection.create_index.assert_called()
+        assert mongo_manager.supports_transactions() is False
+        mongo_manager.client.admin.command.assert_called_once_with("hello")
+
+    def test_record_subscription_payment_without_transactions(self, mongo_manager):
+        mongo_manager.client.admin.command.return_value = {"isWritablePrimary": True}
+        mongo_manager.payments_collection.update_one.return_value.upserted_id = "order"
+        mongo_manager.subscription_collection.find_one_and_update.return_value = {"premium_expiration": "2024-12-31T00:00:00.000"}
+        order = {"telegram_payment_charge_id": "charge", "amount": 400}
+
+        assert mongo_manager.record_subscription_payment(123, order, {"date": "2024-12-01T00:00:00", "duration_days": 30}) == "2024-12-31T00:00:00.000"
+
+        mongo_manager.client.start_session.assert_not_called()
+        mongo_manager.payments_collection.update_one.assert_called_once_with(
+            {"telegram_payment_charge_id": "charge"},
+            {"$setOnInsert": {"user_id": 123, "telegram_payment_charge_id": "charge", "amount": 400}},
+            upsert=True,
+        )
+
+    def test_record_subscription_payment(self, mongo_manager):
+        session = mongo_manager.client.start_session.return_value.__enter__.return_value
+        session.with_transaction.side_effect = lambda callback, **kwargs: callback(session)
+        order = {"order_id": "charge", "amount": 400}
+        payment = {"order_id": "charge", "duration_days": 30, "date": "2024-12-01T00:00:00"}
+        mongo_manager.subscription_collection.find_one_and_update.return_value = {"premium_expiration": "2024-12-31T00:00:00.000"}
+
+        assert mongo_manager.record_subscription_payment(123, order, payment) == "2024-12-31T00:00:00.000"
+
+        mongo_manager.payments_collection.insert_one.assert_called_once_with(
+            {"user_id": 123, "order_id": "charge", "amount": 400}, session=session
+        )
+        assert mongo_manager.subscription_collection.find_one_and_update.call_args.kwargs["session"] is session
+
+    def test_record_subscription_payment_duplicate(self, mongo_manager):
+        from pymongo.errors import DuplicateKeyError
+
+        session = mongo_manager.client.start_session.return_value.__enter__.return_value
+        session.with_transaction.side_effect = DuplicateKeyError("E11000 duplicate key")
+
+        assert mongo_manager.record_subscription_payment(123, {"order_id": "charge"}, {}) is None
+
+    def test_iter_orders(self, mongo_manager):
+        cursor = mongo_manager.payments_collection.find.return_value.sort.return_value.batch_size
+        cursor.return_value = iter([{"order_id": 1}, {"order_id": 2}])
+
+        result = list(mongo_manager.iter_orders(123, projection={"amount": 1}, batch_size=10, after="last_id"))
+
+        assert result == [{"order_id": 1}, {"order_id": 2}]
+        mongo_manager.payments_collection.find.assert_called_once_with(
+            {"user_id": 123, "_id": {"$gt": "last_id"}}, {"amount": 1}
+        )
+        mongo_manager.payments_collection.find.return_value.sort.assert_called_once_with("_id", 1)
+        cursor.assert_called_once_with(10)
+
+    def test_get_orders_page(self, mongo_manager):
+        limit = mongo_manager.payments_collection.find.return_value.sort.return_value.limit
+        limit.return_value = [{"_id": 1}, {"_id": 2}]
+
+        orders, next_after = mongo_manager.get_orders_page(123, limit=2)
+
+        assert orders == [{"_id": 1}, {"_id": 2}]
+        assert next_after == 2
+        mongo_manager.payments_collection.find.assert_called_once_with({"user_id": 123}, None)
+
+    def test_get_orders_page_last_page(self, mongo_manager):
+        limit = mongo_manager.payments_collection.find.return_value.sort.return_value.limit
+        limit.return_value = [{"_id": 3}]
+
+        orders, next_after = mongo_manager.get_orders_page(123, limit=2, after=2)
+
+        assert next_after is None
+        mongo_manager.payments_collection.find.assert_called_once_with({"user_id": 123, "_id": {"$gt": 2}}, None)
+
+    def test_get_orders_summary(self, mongo_manager):
+        mongo_manager.payments_collection.aggregate.return_value = [
+            {"_id": "XTR", "count": 3, "total": 1900},
+            {"_id": "USD", "count": 1, "total": 5},
+        ]
+
+        assert mongo_manager.get_orders_summary(123) == {"count": 4, "totals": {"XTR": 1900, "USD": 5}}
+        pipeline = mongo_manager.payments_collection.aggregate.call_args.args[0]
+        assert pipeline[0] == {"$match": {"user_id": 123}}
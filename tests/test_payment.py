@@ -46,6 +46,7 @@ def mock_update_successful_payment():
     update.message = MagicMock()
     update.message.successful_payment = MagicMock()
     update.message.successful_payment.provider_payment_charge_id = "test_charge_id"
+    update.message.successful_payment.telegram_payment_charge_id = "test_telegram_charge_id"
     update.message.successful_payment.total_amount = 1000
     update.message.successful_payment.currency = "XTR"
     update.message.successful_payment.invoice_payload = "1month_sub"
@@ -61,7 +62,7 @@ def mock_context():
 @pytest.fixture
 def mock_mongo_manager():
     manager = MagicMock(spec=MongoManager)
-    manager.add_order = MagicMock()
+    manager.record_subscription_payment.return_value = "2024-01-31T10:00:00.000"
     return manager
 
 
@@ -100,7 +101,9 @@ async def test_successful_payment_valid_plan(
     mock_datetime.now.return_value = fixed_now
     mock_datetime.isoformat.side_effect = fixed_now.isoformat
     mock_datetime.strftime.side_effect = lambda x: fixed_now.strftime(x)
-    mock_datetime.timedelta = timedelta
+    mock_datetime.fromisoformat.side_effect = datetime.fromisoformat
+    expected_expiration_date = fixed_now + timedelta(days=30)
+    mock_mongo_manager.record_subscription_payment.return_value = expected_expiration_date.isoformat()
 
     await successful_payment(
         mock_update_successful_payment, mock_context, mock_mongo_manager, mock_bot_logger
@@ -110,30 +113,26 @@ async def test_successful_payment_valid_plan(
     mock_mongo_manager.get_user_info.assert_called_once_with(
         mock_update_successful_payment
     )
-    mock_mongo_manager.add_order.assert_called_once_with(
+    mock_mongo_manager.record_subscription_payment.assert_called_once_with(
         123,
         {
             "order_id": "test_charge_id",
+            "telegram_payment_charge_id": "test_telegram_charge_id",
             "amount": 1000,
             "currency": "XTR",
             "status": "completed",
             "date": fixed_now.isoformat(),
         },
-    )
-
-    expected_expiration_date = fixed_now + timedelta(days=30)
-    mock_mongo_manager.add_subscription_payment.assert_called_once_with(
-        123,
         {
             "order_id": "test_charge_id",
+            "telegram_payment_charge_id": "test_telegram_charge_id",
             "amount": 1000,
             "currency": "XTR",
             "status": "completed",
             "date": fixed_now.isoformat(),
-            "expiration_date": expected_expiration_date.isoformat(),
             "plan": "1month_sub",
             "duration_days": 30,
-        }
+        },
     )
 
     mock_update_successful_payment.message.reply_text.assert_called_once_with(
@@ -187,10 +186,10 @@ async def test_successful_payment_invalid_plan(
     mock_update_successful_payment.message.reply_text.assert_called_once_with(
         mock_t("subscription.payment_issue", "en", common=True)
     )
-    mock_mongo_manager.add_order.assert_not_called()
+    mock_mongo_manager.record_subscription_payment.assert_not_called()
     mock_bot_logger.log_action.assert_called_once_with(
         123,
-        "successful_payment",
+        "payment_issue",
         "TestBot",
         {
             "payload": mock_update_successful_payment.message.successful_payment.invoice_payload,
@@ -199,5 +198,120 @@ async def test_successful_payment_invalid_plan(
         },
     )
 
-    # Ensure add_subscription_payment was not called for invalid plan
-    mock_mongo_manager.add_subscription_payment.assert_not_called() 
\ No newline at end of file
+
+@pytest.mark.asyncio
+async def test_successful_payment_replay_is_noop(
+    mock_update_successful_payment,
+    mock_context,
+    mock_mongo_manager,
+):
+    mock_context.bot.name = "TestBot"
+    mock_mongo_manager.get_user_info.return_value = {"user_id": 123, "lang": "en"}
+    mock_mongo_manager.record_subscription_payment.return_value = None
+    bot_logger = MagicMock()
+
+    await successful_payment(
+        mock_update_successful_payment, mock_context, mock_mongo_manager, bot_logger
+    )
+
+    mock_mongo_manager.record_subscription_payment.assert_called_once()
+    mock_update_successful_payment.message.reply_text.assert_not_called()
+    bot_logger.log_action.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_successful_payment_stars_keyed_by_telegram_charge_id(
+    mock_update_successful_payment,
+    mock_context,
+    mock_mongo_manager,
+):
+    # Stars payments have no provider charge id
+    mock_update_successful_payment.message.successful_payment.provider_payment_charge_id = ""
+    mock_context.bot.name = "TestBot"
+    mock_mongo_manager.get_user_info.return_value = {"user_id": 123, "lang": "en"}
+
+    await successful_payment(
+        mock_update_successful_payment, mock_context, mock_mongo_manager, MagicMock()
+    )
+
+    order, payment = mock_mongo_manager.record_subscription_payment.call_args.args[1:]
+    assert order["telegram_payment_charge_id"] == payment["telegram_payment_charge_id"] == "test_telegram_charge_id"
+
+
+@pytest.mark.asyncio
+async def test_successful_payment_invalidates_cached_user_state(
+    mock_update_successful_payment,
+    mock_context,
+    mock_mongo_manager,
+    validator,
+):
+    mock_context.bot.name = "TestBot"
+    mock_mongo_manager.get_user_info.return_value = {"user_id": 123, "lang": "en"}
+    validator.validate(123, "1month_sub")
+    assert 123 in validator.user_state_cache
+
+    await successful_payment(
+        mock_update_successful_payment, mock_context, mock_mongo_manager, MagicMock(), validator=validator
+    )
+
+    assert 123 not in validator.user_state_cache
+
+
+@pytest.fixture
+def validator():
+    from telegram_libs.payment import PrecheckoutValidator
+
+    manager = MagicMock(spec=MongoManager)
+    manager.users_collection = MagicMock()
+    manager.subscription_collection = MagicMock()
+    manager.users_collection.find_one.return_value = {}
+    manager.subscription_collection.find_one.return_value = None
+    return PrecheckoutValidator(manager, max_subscription_days=60)
+
+
+class TestPrecheckoutValidator:
+    def test_valid_payment(self, validator):
+        assert validator.validate(123, "1month_sub") is None
+
+    def test_unknown_plan(self, validator):
+        assert validator.validate(123, "unknown") == "payment.invalid_plan"
+        validator.mongo_manager.users_collection.find_one.assert_not_called()
+
+    def test_banned_user(self, validator):
+        validator.mongo_manager.users_collection.find_one.return_value = {"banned": True}
+        assert validator.validate(123, "1month_sub") == "payment.banned"
+
+    def test_max_stacked_subscription(self, validator):
+        validator.mongo_manager.subscription_collection.find_one.return_value = {
+            "is_premium": True,
+            "premium_expiration": (datetime.now() + timedelta(days=40)).isoformat(),
+        }
+        assert validator.validate(123, "1month_sub") == "payment.max_subscription"
+
+    def test_user_state_is_cached(self, validator):
+        validator.validate(123, "1month_sub")
+        validator.validate(123, "3months_sub")
+        validator.mongo_manager.users_collection.find_one.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_check_falls_back_when_over_budget(self, validator):
+        import time
+
+        validator.budget = 0.01
+        validator.fallback_ok = False
+        validator.mongo_manager.users_collection.find_one.side_effect = lambda *args: time.sleep(0.05)
+
+        assert await validator.check(123, "1month_sub") == (False, "payment.unavailable")
+        assert validator.budget_usage[-1] >= 1
+
+
+@pytest.mark.asyncio
+async def test_precheckout_handler_rejects_invalid(mock_update_precheckout, mock_context, validator):
+    mock_update_precheckout.pre_checkout_query.invoice_payload = "unknown"
+    mock_update_precheckout.pre_checkout_query.from_user.language_code = "en"
+
+    await precheckout_handler(mock_update_precheckout, mock_context, validator=validator)
+
+    mock_update_precheckout.pre_checkout_query.answer.assert_called_once_with(
+        ok=False, error_message=t("payment.invalid_plan", "en", common=True)
+    )
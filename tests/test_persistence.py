@@ -0,0 +1,180 @@
+import os
+
+os.environ["MONGO_URI"] = "mongodb://localhost:27017"
+os.environ["SUBSCRIPTION_DB_NAME"] = "subscription_db"
+
+import pytest
+from unittest.mock import MagicMock
+from pymongo import DeleteOne, UpdateOne
+from telegram import Update
+from telegram.ext import Application, MessageHandler, filters
+from telegram_libs.persistence import MongoPersistence
+from telegram_libs.support import SUPPORT_WAITING
+from memory_mongo import MemoryMongoClient
+from telegram_libs.testing import FakeTelegramRequest
+
+
+def make_update(update_id, user_id, text):
+    return Update.de_json(
+        {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": 0,
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": user_id, "is_bot": False, "first_name": "User"},
+                "text": text,
+            },
+        },
+        None,
+    )
+
+
+@pytest.fixture
+def collections():
+    collections = {}
+    mongo_manager = MagicMock()
+    mongo_manager.db.__getitem__.side_effect = lambda name: collections.setdefault(name, MagicMock())
+    collections["manager"] = mongo_manager
+    return collections
+
+
+@pytest.fixture
+def app(collections):
+    persistence = MongoPersistence(collections["manager"])
+    collections["persistence_bot_data"].find_one.return_value = None
+    collections["persistence_user_data"].find_one.side_effect = lambda query: (
+        {"_id": 1, "data": {SUPPORT_WAITING: True}} if query == {"_id": 1} else None
+    )
+    app = Application.builder().token("1:fake").request(FakeTelegramRequest()).persistence(persistence).build()
+
+    async def handle(update, context):
+        if update.message.text == "support":
+            context.user_data[SUPPORT_WAITING] = True
+        elif update.message.text == "answer":
+            context.user_data[SUPPORT_WAITING] = False
+        context.bot_data["seen"] = context.user_data.get(SUPPORT_WAITING)
+
+    app.add_handler(MessageHandler(filters.TEXT, handle))
+    return app
+
+
+@pytest.mark.asyncio
+async def test_user_data_loaded_lazily_once(app, collections):
+    users = collections["persistence_user_data"]
+    async with app:
+        users.find_one.assert_not_called()
+        await app.process_update(make_update(1, 1, "hello"))
+        await app.process_update(make_update(2, 1, "hello"))
+
+        assert app.user_data[1] == {SUPPORT_WAITING: True}
+        assert app.bot_data["seen"] is True
+        users.find_one.assert_called_once_with({"_id": 1})
+
+
+@pytest.mark.asyncio
+async def test_only_changed_entries_written_in_bulk(app, collections):
+    users = collections["persistence_user_data"]
+    async with app:
+        # User 1 is unchanged, user 2 is new, user 3 changes
+        await app.process_update(make_update(1, 1, "hello"))
+        await app.process_update(make_update(2, 2, "support"))
+        await app.process_update(make_update(3, 3, "answer"))
+        await app.update_persistence()
+        await app.persistence.flush()
+
+        users.bulk_write.assert_called_once()
+        requests = users.bulk_write.call_args.args[0]
+        assert sorted(request._filter["_id"] for request in requests) == [2, 3]
+        assert all(isinstance(request, UpdateOne) for request in requests)
+        assert {request._filter["_id"]: request._doc for request in requests} == {
+            2: {"$set": {f"data.{SUPPORT_WAITING}": True}},
+            3: {"$set": {f"data.{SUPPORT_WAITING}": False}},
+        }
+        assert users.bulk_write.call_args.kwargs == {"ordered": False}
+
+        users.bulk_write.reset_mock()
+        await app.process_update(make_update(4, 2, "support"))
+        await app.update_persistence()
+        await app.persistence.flush()
+        users.bulk_write.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_dropped_user_data_deleted(app, collections):
+    users = collections["persistence_user_data"]
+    async with app:
+        await app.process_update(make_update(1, 1, "hello"))
+        app.drop_user_data(1)
+        await app.update_persistence()
+        await app.persistence.flush()
+
+        requests = users.bulk_write.call_args.args[0]
+        assert len(requests) == 1 and isinstance(requests[0], DeleteOne)
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_is_retried(collections):
+    persistence = MongoPersistence(collections["manager"])
+    users = collections["persistence_user_data"]
+    users.bulk_write.side_effect = Exception("network")
+
+    await persistence.update_user_data(5, {"a": "b"})
+    with pytest.raises(Exception, match="network"):
+        await persistence.flush()
+    assert persistence._pending["user_data"] == {5: (None, {"a": "b"})}
+
+    users.bulk_write.side_effect = None
+    await persistence.flush()
+    assert users.bulk_write.call_count == 3
+    assert persistence._pending["user_data"] == {}
+
+
+@pytest.mark.asyncio
+async def test_changes_written_per_key(collections):
+    persistence = MongoPersistence(collections["manager"])
+    users = collections["persistence_user_data"]
+    users.find_one.return_value = {"_id": 1, "data": {"a": 1, "b": 2, "c": 3}}
+    data = {}
+    await persistence.refresh_user_data(1, data)
+
+    await persistence.update_user_data(1, {"a": 1, "b": 5})
+    await persistence.flush()
+
+    [request] = users.bulk_write.call_args.args[0]
+    assert request._doc == {"$set": {"data.b": 5}, "$unset": {"data.c": ""}}
+
+
+@pytest.mark.asyncio
+async def test_processes_keep_each_others_changes():
+    from telegram_libs.mongo import MongoManager
+
+    mongo_manager = MongoManager(mongo_database_name="test_db", client=MemoryMongoClient())
+    first, second = MongoPersistence(mongo_manager), MongoPersistence(mongo_manager)
+    await first.update_user_data(1, {"language": "en"})
+    await first.flush()
+
+    first_data, second_data = {}, {}
+    await first.refresh_user_data(1, first_data)
+    await second.refresh_user_data(1, second_data)
+    await first.update_user_data(1, {**first_data, "language": "de"})
+    await second.update_user_data(1, {**second_data, "plan": "1month"})
+    await first.flush()
+    await second.flush()
+
+    assert second._load("user_data", 1) == {"language": "de", "plan": "1month"}
+
+
+@pytest.mark.asyncio
+async def test_dropped_entry_not_reloaded_before_delete(collections):
+    persistence = MongoPersistence(collections["manager"])
+    users = collections["persistence_user_data"]
+    users.find_one.return_value = {"_id": 1, "data": {"a": 1}}
+    await persistence.refresh_user_data(1, {})
+
+    await persistence.drop_user_data(1)
+    data = {}
+    await persistence.refresh_user_data(1, data)
+
+    assert data == {}
+    users.find_one.assert_called_once()
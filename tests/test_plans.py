@@ -0,0 +1,149 @@
+import os
+
+os.environ["MONGO_URI"] = "mongodb://localhost:27017"
+os.environ["SUBSCRIPTION_DB_NAME"] = "subscription_db"
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from telegram import LabeledPrice
+from telegram_libs.plans import Plan, PlanRegistry, DEFAULT_PLANS
+from telegram_libs.subscription import subscription_callback
+
+
+@pytest.fixture
+def registry():
+    return PlanRegistry()
+
+
+class TestPlanRegistry:
+    def test_lookup_by_callback_and_payload(self, registry):
+        plan = registry.get_by_callback("sub_3months")
+
+        assert plan.payload == "3months_sub"
+        assert plan.duration == 90
+        assert registry.get_by_payload("3months_sub") is plan
+        assert registry.get_by_callback("sub_unknown") is None
+        assert registry.get_by_payload("unknown") is None
+
+    def test_invoice_params_are_cached(self, registry):
+        plan = registry.get_by_payload("1year_sub")
+        params = registry.get_invoice_params(plan)
+
+        assert params is registry.get_invoice_params(plan)
+        assert params["payload"] == "1year_sub"
+        assert params["currency"] == "XTR"
+        assert params["prices"] == (LabeledPrice(plan.title, plan.price),)
+
+    def test_refresh_from_collection(self):
+        collection = MagicMock()
+        collection.find.return_value.sort.return_value = [
+            {"callback_data": "sub_1month", "payload": "1month_sub", "title": "1 Month",
+             "description": "Premium", "price": 500, "duration": 30, "updated_by": "admin"},
+        ]
+        registry = PlanRegistry(collection=collection)
+        assert registry.get_by_payload("1month_sub").price == DEFAULT_PLANS[0].price
+
+        registry.refresh()
+
+        assert registry.get_by_payload("1month_sub").price == 500
+        assert registry.get_invoice_params(registry.get_by_payload("1month_sub"))["prices"][0].amount == 500
+        assert [plan.payload for plan in registry] == ["1month_sub"]
+        assert registry.get_by_callback("sub_1year") is None
+
+    def test_refresh_keeps_plans_when_collection_empty(self):
+        collection = MagicMock()
+        collection.find.return_value.sort.return_value = []
+        registry = PlanRegistry(collection=collection)
+
+        registry.refresh()
+
+        assert list(registry) == list(DEFAULT_PLANS)
+
+
+    def test_removed_plans_stay_payable(self):
+        collection = MagicMock()
+        collection.find.return_value.sort.return_value = [
+            {"callback_data": "sub_1month", "payload": "1month_sub", "title": "1 Month",
+             "description": "Premium", "price": 500, "duration": 30},
+            {"callback_data": "sub_legacy", "payload": "legacy_sub", "title": "Legacy",
+             "description": "Premium", "price": 100, "duration": 7, "active": False},
+        ]
+        registry = PlanRegistry(collection=collection)
+
+        registry.refresh()
+
+        # Issued invoices of the removed default and the inactive plan are still honored
+        assert registry.get_by_payload("1year_sub").duration == 365
+        assert registry.get_by_payload("legacy_sub").duration == 7
+        assert registry.get_by_callback("sub_legacy") is None
+        assert [plan.payload for plan in registry] == ["1month_sub"]
+
+    def test_refresh_skips_invalid_documents(self, caplog):
+        collection = MagicMock()
+        collection.find.return_value.sort.return_value = [
+            {"callback_data": "sub_1month", "payload": "1month_sub", "title": "1 Month",
+             "description": "Premium", "price": 500, "duration": 30},
+            {"callback_data": "sub_broken", "payload": "broken_sub", "title": "Broken"},
+            {"callback_data": "sub_text", "payload": "text_sub", "title": "Text",
+             "description": "Premium", "price": "500", "duration": 30},
+        ]
+        registry = PlanRegistry(collection=collection)
+
+        registry.refresh()
+
+        assert [plan.payload for plan in registry] == ["1month_sub"]
+        assert "broken_sub" in caplog.text and "text_sub" in caplog.text
+
+    def test_refresh_keeps_plans_when_no_document_is_valid(self):
+        collection = MagicMock()
+        collection.find.return_value.sort.return_value = [{"payload": "broken_sub", "price": 1}]
+        registry = PlanRegistry(collection=collection)
+
+        registry.refresh()
+
+        assert list(registry) == list(DEFAULT_PLANS)
+
+
+@pytest.mark.asyncio
+async def test_subscription_callback_sends_invoice_from_registry():
+    plan = Plan("sub_test", "test_sub", "Test", "Test plan", 7, 3)
+    registry = PlanRegistry(plans=(plan,))
+    update = MagicMock()
+    update.callback_query.data = "sub_test"
+    update.callback_query.answer = AsyncMock()
+    context = MagicMock()
+    context.bot.send_invoice = AsyncMock()
+
+    await subscription_callback(update, context, MagicMock(), plan_registry=registry)
+
+    context.bot.send_invoice.assert_called_once_with(
+        chat_id=update.callback_query.message.chat_id,
+        title="Test",
+        description="Test plan",
+        payload="test_sub",
+        provider_token="",
+        currency="XTR",
+        prices=(LabeledPrice("Test", 7),),
+        start_parameter="subscription",
+    )
+
+
+def test_subscription_handler_pattern_follows_registry():
+    from telegram import Update
+    from telegram.ext import Application, CallbackQueryHandler
+    from telegram_libs.handlers import register_subscription_handlers
+    from telegram_libs.testing import FakeTelegramRequest
+
+    registry = PlanRegistry(plans=(Plan("plan_gold", "gold_sub", "Gold", "Premium", 100, 30),))
+    app = Application.builder().token("1:fake").request(FakeTelegramRequest()).build()
+    register_subscription_handlers(app, MagicMock(), MagicMock(), registry)
+    handler = next(h for h in app.handlers[0] if isinstance(h, CallbackQueryHandler))
+
+    def query(data):
+        user = {"id": 1, "is_bot": False, "first_name": "User"}
+        return Update.de_json(
+            {"update_id": 1, "callback_query": {"id": "1", "from": user, "chat_instance": "1", "data": data}}, None
+        )
+
+    assert handler.check_update(query("plan_gold"))
+    assert not handler.check_update(query("sub_1month"))
@@ -0,0 +1,124 @@
+import asyncio
+from datetime import timedelta
+from time import monotonic
+import pytest
+import pytest_asyncio
+from telegram.error import RetryAfter
+from telegram.ext import ExtBot
+from telegram_libs.rate_limiter import (
+    PRIORITY_BULK,
+    FloodControlRateLimiter,
+    TokenBucket,
+    get_retry_after_seconds,
+)
+from telegram_libs.testing import FakeTelegramRequest
+
+
+@pytest_asyncio.fixture
+async def limiter():
+    limiter = FloodControlRateLimiter(overall_rate=100, chat_rate=20, chat_burst=1)
+    await limiter.initialize()
+    yield limiter
+    await limiter.shutdown()
+
+
+def make_callback(sent, name, result=True):
+    async def callback():
+        sent.append(name)
+        return result
+
+    return callback
+
+
+def test_token_bucket_reservations():
+    bucket = TokenBucket(rate=10, capacity=2)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(0.1, abs=0.01)
+    assert not bucket.idle
+
+
+@pytest.mark.asyncio
+async def test_payments_sent_before_bulk(limiter):
+    sent = []
+    limiter.overall_bucket._tokens = 0
+    requests = [
+        limiter.process_request(make_callback(sent, "bulk"), (), {}, "sendMessage", {"chat_id": 1}, {"priority": PRIORITY_BULK}),
+        limiter.process_request(make_callback(sent, "reply"), (), {}, "sendMessage", {"chat_id": 2}, None),
+        limiter.process_request(make_callback(sent, "invoice"), (), {}, "sendInvoice", {"chat_id": 3}, None),
+    ]
+    await asyncio.gather(*requests)
+    assert sent == ["invoice", "reply", "bulk"]
+    assert limiter.metrics["max_queue_depth"] == 3
+    assert limiter.metrics["sent"] == 3
+
+
+@pytest.mark.asyncio
+async def test_per_chat_limit(limiter):
+    sent = []
+    started = monotonic()
+    await limiter.process_request(make_callback(sent, "first"), (), {}, "sendMessage", {"chat_id": 1}, None)
+    await limiter.process_request(make_callback(sent, "other chat"), (), {}, "sendMessage", {"chat_id": 2}, None)
+    assert monotonic() - started < 0.04
+    await limiter.process_request(make_callback(sent, "second"), (), {}, "sendMessage", {"chat_id": 1}, None)
+    assert monotonic() - started >= 0.04
+    assert limiter._chat_bucket(-100).rate == limiter.group_rate
+
+
+def test_chat_bucket_parses_string_chat_ids(limiter):
+    assert limiter._chat_bucket("12345").rate == limiter.chat_rate
+    assert limiter._chat_bucket("12345") is limiter._chat_bucket(12345)
+    assert limiter._chat_bucket("-100123").rate == limiter.group_rate
+    assert limiter._chat_bucket("@channel").rate == limiter.group_rate
+
+
+def test_get_retry_after_seconds():
+    assert get_retry_after_seconds(RetryAfter(3)) == 3
+    assert get_retry_after_seconds(RetryAfter(timedelta(milliseconds=1500))) == 1.5
+
+
+@pytest.mark.asyncio
+async def test_retry_after_pauses_and_retries(limiter):
+    calls = []
+
+    async def callback():
+        calls.append(monotonic())
+        if len(calls) == 1:
+            raise RetryAfter(timedelta(milliseconds=100))
+        return True
+
+    assert await limiter.process_request(callback, (), {}, "sendMessage", {"chat_id": 1}, None) is True
+    assert calls[1] - calls[0] >= 0.09
+    assert limiter.metrics["retry_after_count"] == 1
+
+
+@pytest.mark.asyncio
+async def test_retry_after_gives_up(limiter):
+    limiter.max_retries = 1
+
+    async def callback():
+        raise RetryAfter(timedelta(milliseconds=10))
+
+    with pytest.raises(RetryAfter):
+        await limiter.process_request(callback, (), {}, "sendMessage", {"chat_id": 1}, None)
+    assert limiter.retry_after_count == 2
+
+
+@pytest.mark.asyncio
+async def test_unlimited_endpoints_skip_queue(limiter):
+    sent = []
+    limiter.overall_bucket._tokens = -100
+    await asyncio.wait_for(
+        limiter.process_request(make_callback(sent, "updates", []), (), {}, "getUpdates", {}, None), 0.1
+    )
+    assert sent == ["updates"]
+
+
+@pytest.mark.asyncio
+async def test_bot_routes_through_limiter(limiter):
+    request = FakeTelegramRequest()
+    bot = ExtBot("1:fake", request=request, rate_limiter=limiter)
+    async with bot:
+        await bot.send_message(chat_id=5, text="news", rate_limit_args={"priority": PRIORITY_BULK})
+    assert request.calls[-1][0] == "sendMessage"
+    assert limiter.sent_count >= 1
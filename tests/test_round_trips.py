@@ -0,0 +1,81 @@
+"""Round trip budgets of the handlers; raise a budget only together with a reason.
+
+Each budget is checked against the in-memory Mongo and, when TEST_MONGO_URI is
+set, against the registry client of a real mongod.
+"""
+import os
+
+os.environ["MONGO_URI"] = "mongodb://localhost:27017"
+os.environ["SUBSCRIPTION_DB_NAME"] = "subscription_db"
+
+from datetime import datetime, timedelta
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from telegram_libs.middleware import Middleware
+from telegram_libs.mongo import MongoManager
+from telegram_libs.subscription import check_subscription_command, subscribe_command
+from telegram_libs.testing import round_trip_listener
+from memory_mongo import MemoryMongoClient
+from telegram_libs.utils import RateLimitManager
+
+
+@pytest.fixture(params=["memory", "mongod"])
+def mongo_manager(request):
+    if request.param == "memory":
+        client = MemoryMongoClient(event_listeners=[round_trip_listener])
+    else:
+        client = request.getfixturevalue("mongod_client")
+    manager = MongoManager(mongo_database_name="test_db", client=client)
+    manager.users_collection.insert_one({"user_id": 1, "language": "en"})
+    manager.subscription_collection.insert_one({
+        "user_id": 1,
+        "is_premium": True,
+        "premium_expiration": (datetime.now() + timedelta(days=10)).isoformat(),
+    })
+    return manager
+
+
+@pytest.fixture
+def update():
+    update = MagicMock()
+    update.effective_user.id = 1
+    update.message.reply_text = AsyncMock()
+    update.effective_message = update.message
+    return update
+
+
+@pytest.mark.asyncio
+async def test_status_budget(round_trips, mongo_manager, update):
+    with round_trips() as counter:
+        await check_subscription_command(update, MagicMock(), mongo_manager)
+
+    counter.assert_budget(reads=2, writes=0)
+
+
+@pytest.mark.asyncio
+async def test_status_budget_with_middleware(round_trips, mongo_manager, update):
+    context = MagicMock()
+    middleware = Middleware(mongo_manager, MagicMock())
+    with round_trips() as counter:
+        await middleware.open_update(update, context)
+        await check_subscription_command(update, context, mongo_manager)
+
+    counter.assert_budget(reads=2, writes=0)
+
+
+@pytest.mark.asyncio
+async def test_subscribe_budget(round_trips, mongo_manager, update):
+    context = MagicMock()
+    context.bot.name = "TestBot"
+    with round_trips() as counter:
+        await subscribe_command(update, context, mongo_manager, MagicMock())
+
+    counter.assert_budget(reads=1, writes=0)
+
+
+def test_rate_limit_budget_for_premium_user(round_trips, mongo_manager):
+    rate_limit_manager = RateLimitManager(mongo_manager)
+    with round_trips() as counter:
+        rate_limit_manager.check_and_increment(1)
+
+    counter.assert_budget(reads=1, writes=0)
@@ -0,0 +1,76 @@
+import os
+
+os.environ["MONGO_URI"] = "mongodb://localhost:27017"
+os.environ["SUBSCRIPTION_DB_NAME"] = "subscription_db"
+
+import pytest
+from unittest.mock import MagicMock, patch
+from telegram_libs.middleware import MiddlewareApplication
+from telegram_libs.mongo import get_mongo_client
+from telegram_libs.rate_limiter import FloodControlRateLimiter
+from telegram_libs.persistence import MongoPersistence
+from telegram_libs.runner import BotConfig, BotHost, SharedHTTPXRequest
+
+
+@pytest.fixture
+def host():
+    configs = [
+        BotConfig(token="111:AAA", bot_name="first", mongo_database_name="first_db", setup=MagicMock()),
+        BotConfig(token="222:BBB", bot_name="second", mongo_database_name="second_db", concurrent_updates=8),
+    ]
+    with patch("telegram_libs.runner.register_common_handlers") as mock_register:
+        host = BotHost(configs, bot_logger=MagicMock())
+        host.mock_register = mock_register
+        yield host
+
+
+def test_bots_share_http_pool(host):
+    clients = set()
+    for app in host.applications:
+        for request in (app.bot.request, app.bot._request[0]):
+            assert isinstance(request, SharedHTTPXRequest)
+            clients.add(id(request._client))
+    assert clients == {id(host.pool.client)}
+
+
+def test_applications_record_update_timings(host):
+    assert all(isinstance(app, MiddlewareApplication) for app in host.applications)
+
+
+def test_common_handlers_share_logger_and_mongo_client(host):
+    assert host.mock_register.call_count == 2
+    managers = [c.args[2] for c in host.mock_register.call_args_list]
+    assert all(c.kwargs["bot_logger"] is host.bot_logger for c in host.mock_register.call_args_list)
+    assert managers[0].client is managers[1].client is get_mongo_client()
+    assert managers[0].db.name == "first_db"
+
+
+def test_per_bot_configuration(host):
+    first, second = host.applications
+    assert first.update_processor.max_concurrent_updates == 1
+    assert second.update_processor.max_concurrent_updates == 8
+    assert host.mock_register.call_args_list[0].args[0] is first
+    first_config_setup = host.mock_register.call_args_list[0]
+    assert first_config_setup.args[1] == "first"
+
+
+@pytest.mark.asyncio
+async def test_shared_request_shutdown_keeps_pool_open(host):
+    request = host.applications[0].bot.request
+    await request.shutdown()
+    assert not host.pool.client.is_closed
+    await host.pool.aclose()
+    assert host.pool.client.is_closed
+
+
+def test_each_bot_has_own_rate_limiter(host):
+    limiters = [app.bot.rate_limiter for app in host.applications]
+    assert all(isinstance(limiter, FloodControlRateLimiter) for limiter in limiters)
+    assert limiters[0] is not limiters[1]
+
+
+def test_persistence_uses_bot_database(host):
+    first, second = host.applications
+    assert isinstance(first.persistence, MongoPersistence)
+    assert first.persistence.mongo_manager.db.name == "first_db"
+    assert first.persistence is not second.persistence
@@ -0,0 +1,108 @@
+import os
+
+os.environ["MONGO_URI"] = "mongodb://localhost:27017"
+os.environ["SUBSCRIPTION_DB_NAME"] = "subscription_db"
+
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+from pymongo.errors import OperationFailure
+from telegram_libs.slow_ops import (
+    SLOW_OPS_COLLECTION,
+    SlowOpListener,
+    get_command_shape,
+    redact,
+    summarize_plan,
+)
+
+
+def run_command(listener, request_id, command_name, command, duration_ms, database="db"):
+    listener.started(SimpleNamespace(
+        request_id=request_id, command_name=command_name, command=command, database_name=database
+    ))
+    listener.succeeded(SimpleNamespace(
+        request_id=request_id, command_name=command_name, duration_micros=duration_ms * 1000
+    ))
+
+
+def test_redact_keeps_shape():
+    assert redact({"user_id": 5, "premium_expiration": {"$gt": "2024"}, "_id": {"$in": [1, 2]}}) == {
+        "user_id": "?",
+        "premium_expiration": {"$gt": "?"},
+        "_id": {"$in": ["?"]},
+    }
+    assert get_command_shape("update", {"updates": [{"q": {"user_id": 1}, "u": {"$set": {"a": 1}}}]}) == {
+        "filter": [{"user_id": "?"}]
+    }
+
+
+def test_summarize_plan_finds_collection_scans():
+    explain = {
+        "queryPlanner": {
+            "winningPlan": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "user_id_1"}}
+        }
+    }
+    assert summarize_plan(explain)["stages"] == ["FETCH", "IXSCAN"]
+    assert summarize_plan(explain)["indexes"] == ["user_id_1"]
+    assert summarize_plan({"queryPlanner": {"winningPlan": {"stage": "COLLSCAN"}}})["stages"] == ["COLLSCAN"]
+
+
+@patch.object(SlowOpListener, "_ensure_worker")
+def test_only_slow_operations_sampled_once_per_shape(_):
+    listener = SlowOpListener(threshold_ms=100)
+
+    run_command(listener, 1, "find", {"find": "users", "filter": {"user_id": 1}}, duration_ms=5)
+    run_command(listener, 2, "find", {"find": "users", "filter": {"user_id": 2}}, duration_ms=150)
+    run_command(listener, 3, "find", {"find": "users", "filter": {"user_id": 3}}, duration_ms=150)
+    run_command(listener, 4, "insert", {"insert": "logs", "documents": []}, duration_ms=500)
+    run_command(listener, 5, "find", {"find": SLOW_OPS_COLLECTION, "filter": {}}, duration_ms=500)
+
+    assert listener.queue.qsize() == 1
+    sample, command = listener.queue.get_nowait()
+    assert sample["shape"] == {"filter": {"user_id": "?"}}
+    assert sample["duration_ms"] == 150
+    # The original command is kept for explain, not stored
+    assert command["filter"] == {"user_id": 2}
+    assert listener._in_flight == {}
+
+
+@patch.object(SlowOpListener, "_ensure_worker")
+def test_full_queue_drops_samples(_):
+    listener = SlowOpListener(threshold_ms=1, max_queued=1)
+    run_command(listener, 1, "find", {"find": "users", "filter": {"a": 1}}, duration_ms=5)
+    run_command(listener, 2, "find", {"find": "order", "filter": {"a": 1}}, duration_ms=5)
+    assert listener.dropped == 1
+
+
+def test_process_explains_and_stores_sample():
+    listener = SlowOpListener(threshold_ms=1)
+    client = MagicMock()
+    client.__getitem__.return_value.command.return_value = {
+        "queryPlanner": {"winningPlan": {"stage": "COLLSCAN"}}
+    }
+    sample = {"database": "db", "command": "find", "shape": {}}
+    command = {"find": "users", "filter": {"user_id": 1}, "lsid": {"id": 1}, "$db": "db"}
+
+    with patch.object(listener, "_get_client", return_value=client):
+        listener.process(sample, command)
+
+    client.__getitem__.return_value.command.assert_called_once_with(
+        {"explain": {"find": "users", "filter": {"user_id": 1}}, "verbosity": "queryPlanner"}
+    )
+    stored = client.__getitem__.return_value.__getitem__.return_value.insert_one.call_args.args[0]
+    assert stored["plan"]["stages"] == ["COLLSCAN"]
+    client.__getitem__.return_value.create_collection.assert_called_once_with(
+        SLOW_OPS_COLLECTION, capped=True, size=listener.capped_size
+    )
+
+
+def test_process_records_explain_errors():
+    listener = SlowOpListener(threshold_ms=1)
+    client = MagicMock()
+    client.__getitem__.return_value.command.side_effect = OperationFailure("not allowed")
+    sample = {"database": "db", "command": "find", "shape": {}}
+
+    with patch.object(listener, "_get_client", return_value=client):
+        listener.process(sample, {"find": "users"})
+
+    stored = client.__getitem__.return_value.__getitem__.return_value.insert_one.call_args.args[0]
+    assert stored["plan_error"] == "not allowed"
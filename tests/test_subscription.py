@@ -110,79 +110,239 @@ class TestSubscription:
         user_id = 123
         payment_data = {
             "date": "2024-01-01T00:00:00",
-            "expiration_date": "2024-12-31T00:00:00",
+            "duration_days": 30,
             "amount": 99.99,
             "currency": "USD"
         }
+        mock_subscription_collection.find_one_and_update.return_value = {"premium_expiration": "2024-01-31T00:00:00.000"}
 
         # Execute
-        mongo_manager.add_subscription_payment(user_id, payment_data)
+        result = mongo_manager.add_subscription_payment(user_id, payment_data)
 
-        # Assert
-        mock_subscription_collection.update_one.assert_called_once_with(
-            {"user_id": user_id},
-            {
-                "$push": {"payments": payment_data},
-                "$set": {
-                    "is_premium": True,
-                    "premium_expiration": payment_data["expiration_date"],
-                    "last_payment": payment_data["date"]
-                }
-            },
-            upsert=True
+        # Assert a single pipeline update extends from max(existing expiration, payment date)
+        assert result == "2024-01-31T00:00:00.000"
+        mock_subscription_collection.find_one_and_update.assert_called_once()
+        args, kwargs = mock_subscription_collection.find_one_and_update.call_args
+        assert args[0] == {"user_id": user_id}
+        stage = args[1][0]["$set"]
+        assert stage["is_premium"] is True
+        new_expiration = stage["premium_expiration"]["$dateToString"]["date"]["$dateAdd"]
+        assert new_expiration["amount"] == 30
+        assert new_expiration["startDate"]["$max"][1] == datetime(2024, 1, 1)
+        assert kwargs["upsert"] is True
+
+    @pytest.fixture(params=["memory", "mongod"])
+    def payment_manager(self, request):
+        """Manager on the in-memory Mongo and, with TEST_MONGO_URI, on a real mongod."""
+        if request.param == "memory":
+            from memory_mongo import MemoryMongoClient
+
+            client = MemoryMongoClient()
+        else:
+            client = request.getfixturevalue("mongod_client")
+        return MongoManager(mongo_database_name="test_db", client=client)
+
+    @pytest.mark.parametrize(
+        "legacy_expiration, expected",
+        [
+            ("2024-03-01T10:00:00.123456", "2024-03-31T10:00:00.123"),
+            ("2024-03-01T10:00:00", "2024-03-31T10:00:00.000"),
+            ("2024-03-01T10:00:00.123456+02:00", "2024-03-31T08:00:00.123"),
+            ("2024-03-01T10:00:00.123", "2024-03-31T10:00:00.123"),
+        ],
+    )
+    def test_add_subscription_payment_extends_legacy_expiration(self, payment_manager, legacy_expiration, expected):
+        mongo_manager = payment_manager
+        mongo_manager.subscription_collection.insert_one(
+            {"user_id": 123, "is_premium": True, "premium_expiration": legacy_expiration}
         )
+        payment_data = {"date": "2024-02-01T00:00:00", "duration_days": 30}
+
+        # The remaining days of the legacy expiration are kept
+        assert mongo_manager.add_subscription_payment(123, payment_data) == expected
+
+    def test_add_subscription_payment_rejects_unparsable_expiration(self, payment_manager):
+        from pymongo.errors import OperationFailure
+
+        mongo_manager = payment_manager
+        mongo_manager.subscription_collection.insert_one({"user_id": 123, "premium_expiration": "soon"})
+
+        with pytest.raises(OperationFailure):
+            mongo_manager.add_subscription_payment(123, {"date": "2024-02-01T00:00:00", "duration_days": 30})
+
+    def test_add_subscription_payment_stacks_renewals(self, payment_manager):
+        payment_data = {"date": "2024-02-01T00:00:00", "duration_days": 30}
+
+        assert payment_manager.add_subscription_payment(123, payment_data) == "2024-03-02T00:00:00.000"
+        assert payment_manager.add_subscription_payment(123, payment_data) == "2024-04-01T00:00:00.000"
+        subscription = payment_manager.subscription_collection.find_one({"user_id": 123})
+        assert [payment["expiration_date"] for payment in subscription["payments"]] == [
+            "2024-03-02T00:00:00.000",
+            "2024-04-01T00:00:00.000",
+        ]
+
+    def test_add_subscription_payment_skips_recorded_charge(self, payment_manager):
+        payment_data = {"date": "2024-02-01T00:00:00", "duration_days": 30, "telegram_payment_charge_id": "charge"}
+
+        assert payment_manager.add_subscription_payment(123, payment_data) == "2024-03-02T00:00:00.000"
+        assert payment_manager.add_subscription_payment(123, payment_data) == "2024-03-02T00:00:00.000"
+        assert len(payment_manager.subscription_collection.find_one({"user_id": 123})["payments"]) == 1
+
+    def test_record_subscription_payment_without_transactions(self, payment_manager, monkeypatch):
+        monkeypatch.setattr(payment_manager, "supports_transactions", lambda: False)
+        payment_manager.ensure_indexes()
+        order = {"telegram_payment_charge_id": "charge", "amount": 400}
+        payment_data = {"date": "2024-02-01T00:00:00", "duration_days": 30, "telegram_payment_charge_id": "charge"}
+
+        assert payment_manager.record_subscription_payment(123, order, payment_data) == "2024-03-02T00:00:00.000"
+        assert payment_manager.record_subscription_payment(123, order, payment_data) is None
+        assert payment_manager.payments_collection.count_documents({}) == 1
+        assert len(payment_manager.subscription_collection.find_one({"user_id": 123})["payments"]) == 1
 
-    def test_check_subscription_status_active(self, mock_mongo_manager_and_collections):
+    def test_record_subscription_payment_without_transactions_completes_replay(self, payment_manager, monkeypatch):
+        monkeypatch.setattr(payment_manager, "supports_transactions", lambda: False)
+        order = {"telegram_payment_charge_id": "charge", "amount": 400}
+        payment_data = {"date": "2024-02-01T00:00:00", "duration_days": 30, "telegram_payment_charge_id": "charge"}
+        # A previous attempt stored the order and failed before extending the subscription
+        payment_manager.payments_collection.insert_one({"user_id": 123, **order})
+
+        assert payment_manager.record_subscription_payment(123, order, payment_data) == "2024-03-02T00:00:00.000"
+        assert payment_manager.payments_collection.count_documents({}) == 1
+
+    @patch("telegram_libs.mongo.datetime")
+    def test_check_subscription_status_active(self, mock_datetime, mock_mongo_manager_and_collections):
         # Setup
         mongo_manager, mock_subscription_collection = mock_mongo_manager_and_collections
         user_id = 123
-        future_date = (datetime.now() + timedelta(days=30)).isoformat()
-        mock_subscription = {
-            "user_id": user_id,
-            "is_premium": True,
-            "premium_expiration": future_date
-        }
-        mock_subscription_collection.find_one.return_value = mock_subscription
+        mock_datetime.now.return_value = datetime(2024, 1, 1)
+        mock_subscription_collection.find_one.return_value = {"_id": "subscription_id"}
 
         # Execute
         result = mongo_manager.check_subscription_status(user_id)
 
         # Assert
         assert result is True
-        mock_subscription_collection.find_one.assert_called_with({"user_id": user_id})
+        mock_subscription_collection.find_one.assert_called_once_with(
+            {"user_id": user_id, "is_premium": True, "premium_expiration": {"$gt": "2024-01-01T00:00:00"}},
+            {"_id": 1},
+        )
 
-    def test_check_subscription_status_expired(self, mock_mongo_manager_and_collections):
+    def test_check_subscription_status_expired_or_not_premium(self, mock_mongo_manager_and_collections):
         # Setup
         mongo_manager, mock_subscription_collection = mock_mongo_manager_and_collections
         user_id = 123
-        past_date = (datetime.now() - timedelta(days=1)).isoformat()
-        mock_subscription = {
-            "user_id": user_id,
-            "is_premium": True,
-            "premium_expiration": past_date
-        }
-        mock_subscription_collection.find_one.return_value = mock_subscription
+        mock_subscription_collection.find_one.return_value = None
 
         # Execute
         result = mongo_manager.check_subscription_status(user_id)
 
         # Assert
         assert result is False
-        mock_subscription_collection.find_one.assert_called_with({"user_id": user_id})
 
-    def test_check_subscription_status_not_premium(self, mock_mongo_manager_and_collections):
-        # Setup
+    @patch("telegram_libs.mongo.datetime")
+    def test_expire_subscriptions(self, mock_datetime, mock_mongo_manager_and_collections):
         mongo_manager, mock_subscription_collection = mock_mongo_manager_and_collections
-        user_id = 123
-        mock_subscription = {
-            "user_id": user_id,
-            "is_premium": False
-        }
-        mock_subscription_collection.find_one.return_value = mock_subscription
+        mock_datetime.now.return_value = datetime(2024, 1, 1)
+        mock_subscription_collection.update_many.return_value.modified_count = 3
 
-        # Execute
-        result = mongo_manager.check_subscription_status(user_id)
+        assert mongo_manager.expire_subscriptions() == 3
+        mock_subscription_collection.update_many.assert_called_once_with(
+            {"is_premium": True, "premium_expiration": {"$lte": "2024-01-01T00:00:00"}},
+            {"$set": {"is_premium": False}},
+        )
 
-        # Assert
-        assert result is False
-        mock_subscription_collection.find_one.assert_called_with({"user_id": user_id}) 
\ No newline at end of file
+    @patch("telegram_libs.mongo.datetime")
+    def test_get_expiring_subscriptions(self, mock_datetime, mock_mongo_manager_and_collections):
+        mongo_manager, mock_subscription_collection = mock_mongo_manager_and_collections
+        mock_datetime.now.return_value = datetime(2024, 1, 1)
+        mock_subscription_collection.find.return_value = [{"user_id": 1}]
+
+        assert mongo_manager.get_expiring_subscriptions(3) == [{"user_id": 1}]
+        query = mock_subscription_collection.find.call_args.args[0]
+        assert query["is_premium"] is True
+        assert query["premium_expiration"] == {"$gt": "2024-01-01T00:00:00", "$lte": "2024-01-04T00:00:00"}
+        assert query["$expr"] == {"$ne": ["$reminded_for", "$premium_expiration"]}
+
+    def test_mark_reminded(self, mock_mongo_manager_and_collections):
+        mongo_manager, mock_subscription_collection = mock_mongo_manager_and_collections
+        mock_subscription_collection.update_many.return_value.modified_count = 2
+
+        assert mongo_manager.mark_reminded([1, 2]) == 2
+        mock_subscription_collection.update_many.assert_called_once_with(
+            {"user_id": {"$in": [1, 2]}, "is_premium": True},
+            [{"$set": {"reminded_for": "$premium_expiration"}}],
+        )
+        assert mongo_manager.mark_reminded([]) == 0
+
+
+@pytest.mark.asyncio
+async def test_expire_subscriptions_job():
+    from telegram_libs.subscription import expire_subscriptions_job
+
+    context = MagicMock()
+    context.job.data.expire_subscriptions.return_value = 2
+
+    await expire_subscriptions_job(context)
+
+    context.job.data.expire_subscriptions.assert_called_once_with()
+
+
+def test_register_subscription_sweeper():
+    from telegram_libs.handlers import register_subscription_sweeper
+    from telegram_libs.subscription import expire_subscriptions_job
+
+    app = MagicMock()
+    mongo_manager = MagicMock()
+
+    register_subscription_sweeper(app, mongo_manager, interval=60)
+
+    app.job_queue.run_repeating.assert_called_once_with(
+        expire_subscriptions_job, interval=60, first=0, data=mongo_manager, name="subscription_sweeper"
+    )
+
+
+@pytest.mark.asyncio
+async def test_expiry_reminder_job_renders_once_per_language():
+    from unittest.mock import AsyncMock
+    from telegram.error import BadRequest, Forbidden
+    from telegram_libs.subscription import expiry_reminder_job
+    from telegram_libs.rate_limiter import PRIORITY_BULK
+
+    mongo_manager = MagicMock()
+    mongo_manager.get_expiring_subscriptions.return_value = [{"user_id": i} for i in (1, 2, 3, 4)]
+    # User 4 never used this bot
+    mongo_manager.get_user_languages.return_value = {1: "en", 2: "ru", 3: "en"}
+    mongo_manager.mark_reminded.side_effect = len
+    context = MagicMock()
+    context.job.data = {"mongo_manager": mongo_manager, "days": 3, "batch_size": 2}
+    context.bot.send_message = AsyncMock(side_effect=[None, Forbidden("blocked"), BadRequest("error")])
+
+    with patch("telegram_libs.subscription.t", return_value="reminder") as mock_t:
+        await expiry_reminder_job(context)
+
+    assert sorted(c.args[1] for c in mock_t.call_args_list) == ["en", "ru"]
+    assert [c.kwargs["chat_id"] for c in context.bot.send_message.await_args_list] == [1, 2, 3]
+    assert context.bot.send_message.await_args.kwargs["rate_limit_args"] == {"priority": PRIORITY_BULK}
+    assert [c.args[0] for c in mongo_manager.mark_reminded.call_args_list] == [[1, 2], []]
+
+
+def test_register_expiry_reminders():
+    from telegram_libs.handlers import register_expiry_reminders
+    from telegram_libs.plans import default_plan_registry
+    from telegram_libs.subscription import expiry_reminder_job
+
+    app = MagicMock()
+    mongo_manager = MagicMock()
+
+    register_expiry_reminders(app, mongo_manager, days=2, interval=600)
+
+    app.job_queue.run_repeating.assert_called_once_with(
+        expiry_reminder_job,
+        interval=600,
+        first=0,
+        data={"mongo_manager": mongo_manager, "days": 2, "batch_size": 500, "plan_registry": default_plan_registry},
+        name="expiry_reminders",
+    )
+    app.bot.rate_limiter = None
+    with pytest.raises(RuntimeError):
+        register_expiry_reminders(app, mongo_manager)
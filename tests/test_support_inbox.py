@@ -0,0 +1,122 @@
+import os
+
+os.environ["MONGO_URI"] = "mongodb://localhost:27017"
+os.environ["SUBSCRIPTION_DB_NAME"] = "subscription_db"
+
+import pytest
+from telegram_libs.mongo import MongoManager
+from telegram_libs.support_inbox import SupportInbox, COUNTED_MARKER_ID
+from memory_mongo import MemoryMongoClient
+from telegram_libs.testing import RoundTripCounter, round_trip_listener
+
+
+@pytest.fixture
+def client():
+    return MemoryMongoClient(event_listeners=[round_trip_listener])
+
+
+@pytest.fixture
+def inbox(client):
+    inbox = SupportInbox(MongoManager(mongo_database_name="test_db", client=client))
+    inbox.ensure_indexes()
+    return inbox
+
+
+def _ticket(bot_name: str, timestamp: str, resolved: bool = False) -> dict:
+    return {"bot_name": bot_name, "message": "help", "timestamp": timestamp, "resolved": resolved}
+
+
+def test_add_ticket_counts_unresolved(inbox):
+    inbox.add_ticket(_ticket("bot", "t1"))
+    inbox.add_ticket(_ticket("bot", "t2"))
+    inbox.add_ticket(_ticket("bot", "t3", resolved=True))
+
+    assert inbox.tickets_collection.count_documents({}) == 3
+    assert inbox.get_unresolved_count("bot") == 2
+
+
+def test_add_ticket_does_not_create_indexes(inbox):
+    with RoundTripCounter() as counter:
+        inbox.add_ticket(_ticket("bot", "t1"))
+
+    assert [name for _, _, name, _ in counter.operations] == ["insert", "update"]
+
+
+def test_failed_count_is_repaired_by_ensure_indexes(inbox, monkeypatch):
+    from pymongo.errors import AutoReconnect
+
+    update_one = inbox.counters_collection.update_one
+
+    def fail(query, update, **kwargs):
+        if "$inc" in update:
+            raise AutoReconnect("connection lost")
+        return update_one(query, update, **kwargs)
+
+    monkeypatch.setattr(inbox.counters_collection, "update_one", fail)
+    inbox.add_ticket(_ticket("bot", "t1"))
+    monkeypatch.undo()
+
+    assert inbox.tickets_collection.count_documents({}) == 1
+    assert inbox.get_unresolved_count("bot") == 0
+    inbox.ensure_indexes()
+    assert inbox.get_unresolved_count("bot") == 1
+
+
+def test_ensure_indexes_counts_existing_tickets_once(client):
+    inbox = SupportInbox(MongoManager(mongo_database_name="test_db", client=client))
+    inbox.tickets_collection.insert_many([_ticket("a", "t1"), _ticket("a", "t2"), _ticket("b", "t3", resolved=True)])
+
+    inbox.ensure_indexes()
+    assert inbox.get_unresolved_counts() == {"a": 2}
+    assert inbox.counters_collection.find_one({"_id": COUNTED_MARKER_ID}) is not None
+
+    inbox.add_ticket(_ticket("a", "t4"))
+    inbox.ensure_indexes()
+    assert inbox.get_unresolved_counts() == {"a": 3}
+
+
+def test_list_tickets_keyset_pagination(inbox):
+    for timestamp in ("t1", "t2", "t2"):
+        inbox.add_ticket(_ticket("bot", timestamp))
+    inbox.add_ticket(_ticket("other", "t1"))
+
+    first, next_after = inbox.list_tickets("bot", limit=2)
+    assert [ticket["timestamp"] for ticket in first] == ["t1", "t2"]
+    assert next_after == ("t2", first[-1]["_id"])
+
+    second, next_after = inbox.list_tickets("bot", limit=2, after=next_after)
+    assert [ticket["timestamp"] for ticket in second] == ["t2"]
+    assert second[0]["_id"] != first[-1]["_id"]
+    assert next_after is None
+
+
+def test_resolve_decrements_counters_per_bot(inbox):
+    a1 = inbox.add_ticket(_ticket("a", "t1"))
+    a2 = inbox.add_ticket(_ticket("a", "t2"))
+    b1 = inbox.add_ticket(_ticket("b", "t3"))
+
+    assert inbox.resolve([a1, a2]) == 2
+    assert inbox.resolve([a1, b1]) == 1
+
+    assert inbox.get_unresolved_counts() == {}
+    assert inbox.tickets_collection.find_one({"_id": a1})["resolved"] is True
+
+
+def test_unresolved_counts_read_counters(inbox):
+    inbox.add_ticket(_ticket("a", "t1"))
+
+    with RoundTripCounter() as counter:
+        assert inbox.get_unresolved_counts() == {"a": 1}
+        assert inbox.get_unresolved_count("b") == 0
+    assert [collection for _, collection, _, _ in counter.operations] == ["support.support_counters"] * 2
+
+
+def test_recount(inbox):
+    inbox.add_ticket(_ticket("a", "t1"))
+    inbox.add_ticket(_ticket("b", "t2"))
+    inbox.tickets_collection.update_many({"bot_name": "b"}, {"$set": {"resolved": True}})
+    inbox.tickets_collection.insert_one(_ticket("a", "t3"))
+
+    assert inbox.recount() == {"a": 2}
+    assert inbox.get_unresolved_counts() == {"a": 2}
+    assert inbox.get_unresolved_count("b") == 0
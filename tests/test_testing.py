@@ -0,0 +1,78 @@
+import pytest
+from telegram import Bot
+from telegram_libs.testing import FAKE_BOT_USER, FakeTelegramRequest
+
+
+@pytest.mark.asyncio
+async def test_fake_request_answers_and_records_calls():
+    request = FakeTelegramRequest()
+    async with Bot("1:fake", request=request) as bot:
+        message = await bot.send_message(chat_id=42, text="hello")
+
+    assert bot.username == FAKE_BOT_USER["username"]
+    assert message.chat.id == 42
+    assert message.text == "hello"
+    assert request.calls[-1] == ("sendMessage", {"chat_id": 42, "text": "hello"})
+
+
+def test_round_trip_counter_counts_commands():
+    from memory_mongo import MemoryMongoClient
+    from telegram_libs.testing import RoundTripCounter, round_trip_listener
+
+    users = MemoryMongoClient(event_listeners=[round_trip_listener])["bot"]["users"]
+    users.insert_one({"user_id": 1})
+    with RoundTripCounter() as counter:
+        users.find_one({"user_id": 1})
+        users.update_one({"user_id": 1}, {"$set": {"language": "en"}})
+        users.name
+
+    assert (counter.reads, counter.writes) == (1, 1)
+    assert [name for _, _, name, _ in counter.operations] == ["find", "update"]
+    counter.assert_budget(reads=1, writes=1)
+    with pytest.raises(AssertionError, match="1 writes > 0"):
+        counter.assert_budget(writes=0)
+
+
+def test_round_trip_counter_counts_get_mores():
+    from memory_mongo import MemoryMongoClient
+    from telegram_libs.testing import RoundTripCounter, round_trip_listener
+
+    users = MemoryMongoClient(event_listeners=[round_trip_listener])["bot"]["users"]
+    users.insert_many([{"user_id": user_id} for user_id in range(250)])
+    with RoundTripCounter() as counter:
+        assert len(list(users.find({}))) == 250
+
+    # A first batch of 101 documents and two getMores
+    assert [name for _, _, name, _ in counter.operations] == ["find", "getMore", "getMore"]
+    assert counter.reads == 3
+
+
+def test_round_trip_counter_counts_clients_from_the_registry(monkeypatch):
+    from memory_mongo import MemoryMongoClient
+    from telegram_libs import mongo
+    from telegram_libs.logger import BotLogger
+    from telegram_libs.testing import RoundTripCounter
+
+    # Stands in for pymongo.MongoClient, keeping the listeners get_mongo_client passes
+    monkeypatch.setattr(mongo, "MongoClient", lambda uri, event_listeners, **kwargs: MemoryMongoClient(event_listeners))
+    monkeypatch.setattr(mongo, "_mongo_clients", {})
+    # BotLogger reaches its collection through client[LOGS_DB_NAME]
+    bot_logger = BotLogger(batch_size=1)
+    with RoundTripCounter() as counter:
+        bot_logger.log_action(1, "subscribe_command", "TestBot")
+
+    assert [(kind, name) for kind, _, name, _ in counter.operations] == [("write", "insert")]
+
+
+@pytest.mark.asyncio
+async def test_round_trip_counter_counts_bot_api_calls():
+    from telegram_libs.testing import RoundTripCounter
+
+    request = FakeTelegramRequest()
+    async with Bot("1:fake", request=request) as bot:
+        with RoundTripCounter(requests=(request,)) as counter:
+            await bot.send_message(chat_id=1, text="hi")
+
+    assert [endpoint for endpoint, _ in counter.bot_api_calls] == ["sendMessage"]
+    with pytest.raises(AssertionError):
+        counter.assert_budget(bot_api_calls=0)
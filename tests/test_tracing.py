@@ -0,0 +1,175 @@
+import json
+from types import SimpleNamespace
+import pytest
+from telegram import Bot
+from telegram_libs.testing import FakeTelegramRequest
+from telegram_libs.tracing import (
+    JsonlSpanSink,
+    MongoTraceListener,
+    TracedApplication,
+    TracedRequestMixin,
+    install_tracing,
+    summarize_traces,
+    trace_handler,
+    tracer,
+)
+from telegram_libs.translation import t
+
+
+class TracedFakeRequest(TracedRequestMixin, FakeTelegramRequest):
+    pass
+
+
+@pytest.fixture
+def trace_file(tmp_path, monkeypatch):
+    path = tmp_path / "traces.jsonl"
+    monkeypatch.setattr(tracer, "sink", JsonlSpanSink(str(path)))
+    return path
+
+
+def read_spans(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_disabled_tracing_is_passthrough():
+    async def handler(update, context):
+        pass
+
+    assert not tracer.enabled
+    assert trace_handler(handler, "handler") is handler
+    with tracer.span("noop") as span:
+        assert span is None
+
+
+@pytest.mark.asyncio
+async def test_handler_span_nests_children(trace_file):
+    listener = MongoTraceListener()
+
+    async def handler(update, context):
+        t("subscription.choose_plan", "en", common=True)
+        listener.started(SimpleNamespace(
+            request_id=1, command_name="find", command={"find": "users"}, database_name="db"
+        ))
+        listener.succeeded(SimpleNamespace(request_id=1))
+        with tracer.span("log_action", action_type="subscribe_command"):
+            pass
+
+    await trace_handler(handler, "subscribe_command")(SimpleNamespace(update_id=7), None)
+
+    spans = {span["name"]: span for span in read_spans(trace_file)}
+    root = spans["subscribe_command"]
+    assert root["parentSpanId"] is None
+    assert root["attributes"] == {"update_id": 7}
+    for name in ("t", "mongo find", "log_action"):
+        assert spans[name]["parentSpanId"] == root["spanId"]
+        assert spans[name]["traceId"] == root["traceId"]
+    assert spans["mongo find"]["attributes"]["db.collection"] == "users"
+
+
+@pytest.mark.asyncio
+async def test_failed_handler_span_has_error(trace_file):
+    async def handler(update, context):
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        await trace_handler(handler, "failing")(SimpleNamespace(update_id=1), None)
+
+    [span] = read_spans(trace_file)
+    assert span["status"] == "ERROR"
+
+
+@pytest.mark.asyncio
+async def test_bot_api_calls_traced(trace_file):
+    async with Bot("1:fake", request=TracedFakeRequest()) as bot:
+        with tracer.span("update"):
+            await bot.send_message(chat_id=1, text="hi")
+
+    names = [span["name"] for span in read_spans(trace_file)]
+    assert "bot_api sendMessage" in names
+    spans = {span["name"]: span for span in read_spans(trace_file)}
+    assert spans["bot_api sendMessage"]["parentSpanId"] == spans["update"]["spanId"]
+    assert spans["bot_api sendMessage"]["attributes"]["http.status_code"] == 200
+
+
+@pytest.mark.asyncio
+async def test_bot_api_calls_outside_updates_not_traced(trace_file):
+    async with Bot("1:fake", request=TracedFakeRequest()) as bot:
+        await bot.send_message(chat_id=1, text="hi")
+
+    assert not trace_file.exists()
+
+
+def test_install_tracing_without_trace_file_keeps_builder():
+    from telegram.ext import Application
+
+    app = install_tracing(Application.builder()).token("1:fake").build()
+
+    assert type(app) is Application
+
+
+@pytest.mark.asyncio
+async def test_update_span_covers_middleware(trace_file):
+    from telegram import Update
+    from telegram.ext import Application, CommandHandler, TypeHandler
+
+    async def middleware(update, context):
+        with tracer.span("mongo find"):
+            pass
+        await context.bot.send_message(chat_id=1, text="rate limited?")
+
+    async def handler(update, context):
+        pass
+
+    app = (
+        install_tracing(Application.builder())
+        .token("1:fake")
+        .request(TracedFakeRequest())
+        .get_updates_request(FakeTelegramRequest())
+        .build()
+    )
+    app.add_handler(TypeHandler(Update, middleware), group=-100)
+    app.add_handler(CommandHandler("status", trace_handler(handler, "check_subscription_command")))
+    data = {
+        "update_id": 3,
+        "message": {
+            "message_id": 1,
+            "date": 0,
+            "chat": {"id": 1, "type": "private"},
+            "from": {"id": 1, "is_bot": False, "first_name": "User"},
+            "text": "/status",
+            "entities": [{"type": "bot_command", "offset": 0, "length": 7}],
+        },
+    }
+    async with app:
+        await app.process_update(Update.de_json(data, app.bot))
+
+    assert isinstance(app, TracedApplication)
+    spans = {span["name"]: span for span in read_spans(trace_file)}
+    root = spans["update"]
+    assert root["attributes"] == {"update_id": 3, "handler": "check_subscription_command"}
+    for name in ("mongo find", "bot_api sendMessage", "check_subscription_command"):
+        assert spans[name]["parentSpanId"] == root["spanId"]
+    assert summarize_traces(str(trace_file))["check_subscription_command"]["count"] == 1
+
+
+def test_mongo_commands_outside_updates_not_traced(trace_file):
+    listener = MongoTraceListener()
+    listener.started(SimpleNamespace(request_id=1, command_name="insert", command={"insert": "logs"}, database_name="db"))
+    listener.succeeded(SimpleNamespace(request_id=1))
+    assert not trace_file.exists()
+
+
+@pytest.mark.asyncio
+async def test_summarize_traces(trace_file):
+    async def handler(update, context):
+        for _ in range(3):
+            with tracer.span("mongo find"):
+                pass
+
+    for update_id in range(4):
+        await trace_handler(handler, "check_subscription_command")(SimpleNamespace(update_id=update_id), None)
+
+    summary = summarize_traces(str(trace_file))["check_subscription_command"]
+    assert summary["count"] == 4
+    assert summary["children"] == {"mongo find": 3}
+    assert summary["p99_ms"] >= summary["p50_ms"]
@@ -98,11 +98,77 @@ def test_common_translation(monkeypatch):
 
     # Test English
     assert translation.t('subscription.choose_plan', 'en', common=True) == 'Choose a subscription plan:'
-    assert translation.t('subscription.plans.1month', 'en', common=True) == '1 Month - 400 Stars'
+    assert translation.t('subscription.plans.sub_1month', 'en', common=True) == '1 Month'
     # Test Russian
     assert translation.t('subscription.choose_plan', 'ru', common=True) == 'Выберите план подписки:'
-    assert translation.t('subscription.plans.3months', 'ru', common=True) == '3 месяца - 1100 Stars'
+    assert translation.t('subscription.plans.sub_3months', 'ru', common=True) == '3 месяца'
     # Test fallback to English
     assert translation.t('subscription.choose_plan', 'fr', common=True) == 'Choose a subscription plan:'
     # Test missing key fallback
-    assert translation.t('subscription.nonexistent', 'ru', common=True) == 'subscription.nonexistent' 
\ No newline at end of file
+    assert translation.t('subscription.nonexistent', 'ru', common=True) == 'subscription.nonexistent' 
+
+def test_compile_translations_roundtrip(temp_locales_dir, tmp_path):
+    """Compiled artifact decodes to the same catalogs as the JSON files"""
+    cache_dir = tmp_path / "cache"
+    path = translation.compile_translations(str(temp_locales_dir), str(cache_dir))
+
+    assert os.path.exists(path)
+    assert translation.catalog_hash(str(temp_locales_dir)) in path
+    assert translation._read_compiled(path) == translation._load_translations_from_dir(str(temp_locales_dir))
+
+
+def test_load_translations_uses_compiled_artifact(temp_locales_dir, tmp_path):
+    """Loading with a cache dir builds the artifact once and reads it afterwards"""
+    cache_dir = str(tmp_path / "cache")
+    first = translation._load_translations_from_dir(str(temp_locales_dir), cache_dir)
+    assert len(os.listdir(cache_dir)) == 1
+
+    second = translation._load_translations_from_dir(str(temp_locales_dir), cache_dir)
+    assert second == first
+
+
+def test_compiled_artifact_invalidated_on_change(temp_locales_dir, tmp_path):
+    """Editing a catalog changes the content hash and the loaded values"""
+    cache_dir = str(tmp_path / "cache")
+    translation._load_translations_from_dir(str(temp_locales_dir), cache_dir)
+
+    with open(temp_locales_dir / "en.json", "w", encoding="utf-8") as f:
+        json.dump({"welcome": "Hi"}, f)
+
+    translations = translation._load_translations_from_dir(str(temp_locales_dir), cache_dir)
+    assert translations["en"]["welcome"] == "Hi"
+    assert len(os.listdir(cache_dir)) == 2
+
+
+def test_corrupt_compiled_artifact_falls_back_to_json(temp_locales_dir, tmp_path):
+    cache_dir = tmp_path / "cache"
+    path = translation.compile_translations(str(temp_locales_dir), str(cache_dir))
+    with open(path, "wb") as f:
+        f.write(b"garbage")
+
+    translations = translation._load_translations_from_dir(str(temp_locales_dir), str(cache_dir))
+    assert translations["en"]["welcome"] == "Welcome"
+
+
+def test_catalog_hash_depends_on_interpreter(temp_locales_dir, monkeypatch):
+    """Artifacts written by another Python or marshal version are not reused"""
+    current = translation.catalog_hash(str(temp_locales_dir))
+
+    monkeypatch.setattr(translation.sys, "version", "0.0.0")
+    assert translation.catalog_hash(str(temp_locales_dir)) != current
+
+    monkeypatch.undo()
+    monkeypatch.setattr(translation.marshal, "version", translation.marshal.version + 1)
+    assert translation.catalog_hash(str(temp_locales_dir)) != current
+
+
+def test_failed_write_leaves_no_temp_file(tmp_path, monkeypatch):
+    def fail(*args):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(translation.os, "replace", fail)
+    path = str(tmp_path / "cache" / "translations-x.bin")
+
+    with pytest.raises(OSError):
+        translation._write_compiled(path, {"en": {"welcome": "Welcome"}})
+    assert os.listdir(tmp_path / "cache") == []
@@ -0,0 +1,168 @@
+import asyncio
+import pytest
+from unittest.mock import MagicMock
+from telegram import Update
+from telegram_libs.update_processor import PerUserUpdateProcessor
+
+
+def make_update(user_id):
+    update = MagicMock(spec=Update)
+    update.effective_user.id = user_id
+    return update
+
+
+async def record(events, name, delay=0.01):
+    events.append(f"{name}:start")
+    await asyncio.sleep(delay)
+    events.append(f"{name}:end")
+
+
+@pytest.mark.asyncio
+async def test_same_user_updates_are_serialized():
+    processor = PerUserUpdateProcessor(10)
+    events = []
+
+    await asyncio.gather(
+        processor.process_update(make_update(1), record(events, "a")),
+        processor.process_update(make_update(1), record(events, "b")),
+    )
+
+    assert events == ["a:start", "a:end", "b:start", "b:end"]
+    assert processor.metrics["lock_waits"] == 1
+    assert processor.metrics["lock_wait_max"] > 0
+    assert processor.metrics["locked_shards"] == 0
+
+
+@pytest.mark.asyncio
+async def test_different_users_run_concurrently():
+    processor = PerUserUpdateProcessor(10)
+    events = []
+
+    await asyncio.gather(
+        processor.process_update(make_update(1), record(events, "a")),
+        processor.process_update(make_update(2), record(events, "b")),
+    )
+
+    assert events[:2] == ["a:start", "b:start"]
+    assert processor.metrics["lock_waits"] == 0
+
+
+@pytest.mark.asyncio
+async def test_flooding_user_does_not_block_other_users():
+    processor = PerUserUpdateProcessor(2)
+    events = []
+
+    flood = [
+        asyncio.create_task(processor.process_update(make_update(1), record(events, f"flood{i}", 0.1)))
+        for i in range(5)
+    ]
+    await asyncio.sleep(0)
+    await asyncio.wait_for(processor.process_update(make_update(2), record(events, "other")), 1)
+
+    assert "flood1:start" not in events
+    assert processor.current_concurrent_updates == 1
+    await asyncio.gather(*flood)
+    assert processor.metrics["locked_shards"] == 0
+
+
+@pytest.mark.asyncio
+async def test_users_sharing_a_shard_are_serialized():
+    processor = PerUserUpdateProcessor(10, shards=4)
+    events = []
+
+    await asyncio.gather(
+        processor.process_update(make_update(1), record(events, "a")),
+        processor.process_update(make_update(5), record(events, "b")),
+        processor.process_update(make_update(2), record(events, "c")),
+    )
+
+    assert events.index("a:end") < events.index("b:start")
+    assert events.index("c:start") < events.index("a:end")
+    assert len(processor._locks) == 4
+    assert processor.metrics["locked_shards"] == 0
+
+
+@pytest.mark.asyncio
+async def test_lock_released_on_error():
+    processor = PerUserUpdateProcessor(10)
+
+    async def fail():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        await processor.process_update(make_update(1), fail())
+
+    assert processor.metrics["locked_shards"] == 0
+    await asyncio.wait_for(processor.process_update(make_update(1), asyncio.sleep(0)), 1)
+
+
+@pytest.mark.asyncio
+async def test_updates_without_user_are_not_locked():
+    processor = PerUserUpdateProcessor(10)
+    events = []
+
+    await processor.process_update(object(), record(events, "a"))
+
+    assert events == ["a:start", "a:end"]
+
+
+@pytest.mark.asyncio
+async def test_premium_status_cache_never_blocks():
+    from telegram_libs.update_processor import PremiumStatusCache
+
+    mongo_manager = MagicMock()
+    mongo_manager.check_subscription_status.return_value = True
+    cache = PremiumStatusCache(mongo_manager)
+
+    assert cache.is_premium(1) is False
+    await asyncio.gather(*cache._refreshing.values())
+    assert cache.is_premium(1) is True
+    mongo_manager.check_subscription_status.assert_called_once_with(1)
+
+
+@pytest.mark.asyncio
+async def test_premium_updates_scheduled_first():
+    from telegram_libs.update_processor import PriorityUpdateProcessor
+
+    status_cache = MagicMock()
+    status_cache.is_premium.side_effect = lambda user_id: user_id >= 100
+    processor = PriorityUpdateProcessor(status_cache, max_running=1, weights={"premium": 100, "free": 1})
+    events = []
+    blocker = asyncio.Event()
+
+    async def block():
+        await blocker.wait()
+
+    first = asyncio.create_task(processor.process_update(make_update(1), block()))
+    await asyncio.sleep(0)
+    tasks = [
+        asyncio.create_task(processor.process_update(make_update(user_id), record(events, str(user_id), 0)))
+        for user_id in (2, 3, 100, 101)
+    ]
+    await asyncio.sleep(0)
+    assert processor.metrics["free"]["queued"] == 2
+    assert processor.metrics["premium"]["queued"] == 2
+
+    blocker.set()
+    await asyncio.gather(first, *tasks)
+
+    started = [event.split(":")[0] for event in events if event.endswith(":start")]
+    assert started == ["100", "101", "2", "3"]
+    assert processor.metrics["premium"]["processed"] == 2
+
+
+@pytest.mark.asyncio
+async def test_class_limit_caps_free_updates():
+    from telegram_libs.update_processor import PriorityUpdateProcessor
+
+    status_cache = MagicMock()
+    status_cache.is_premium.return_value = False
+    processor = PriorityUpdateProcessor(status_cache, max_running=4, class_limits={"premium": 4, "free": 1})
+    events = []
+
+    await asyncio.gather(
+        processor.process_update(make_update(1), record(events, "a")),
+        processor.process_update(make_update(2), record(events, "b")),
+    )
+
+    assert events == ["a:start", "a:end", "b:start", "b:end"]
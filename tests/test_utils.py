@@ -23,6 +23,7 @@ def mock_update():
     update = MagicMock(spec=Update)
     update.message = MagicMock(spec=Message)
     update.message.reply_text = AsyncMock()
+    update.effective_message = update.message
     update.effective_user.id = 123
     update.effective_user.language_code = 'en'
     return update
@@ -43,13 +44,13 @@ async def test_get_subscription_keyboard_layout(mock_update):
     assert len(keyboard.inline_keyboard[1]) == 1  # Second row has 1 button
     
     # Check button texts and callback data
-    assert keyboard.inline_keyboard[0][0].text == t("subscription.plans.1month", "en", common=True)
+    assert keyboard.inline_keyboard[0][0].text == "1 Month - 400 Stars"
     assert keyboard.inline_keyboard[0][0].callback_data == "sub_1month"
     
-    assert keyboard.inline_keyboard[0][1].text == t("subscription.plans.3months", "en", common=True)
+    assert keyboard.inline_keyboard[0][1].text == "3 Months - 1100 Stars"
     assert keyboard.inline_keyboard[0][1].callback_data == "sub_3months"
     
-    assert keyboard.inline_keyboard[1][0].text == t("subscription.plans.1year", "en", common=True)
+    assert keyboard.inline_keyboard[1][0].text == "1 Year - 3600 Stars"
     assert keyboard.inline_keyboard[1][0].callback_data == "sub_1year"
 
 @pytest.mark.asyncio
@@ -68,10 +69,65 @@ async def test_get_subscription_keyboard_different_language(mock_update):
     assert len(keyboard.inline_keyboard[1]) == 1
     
     # Check callback data remains the same regardless of language
+    assert keyboard.inline_keyboard[0][0].text == "1 месяц - 400 Stars"
     assert keyboard.inline_keyboard[0][0].callback_data == "sub_1month"
     assert keyboard.inline_keyboard[0][1].callback_data == "sub_3months"
     assert keyboard.inline_keyboard[1][0].callback_data == "sub_1year"
 
+@pytest.mark.asyncio
+async def test_get_subscription_keyboard_is_cached_per_language(mock_update):
+    first = await get_subscription_keyboard(mock_update, "en")
+    second = await get_subscription_keyboard(mock_update, "en")
+    other = await get_subscription_keyboard(mock_update, "ru")
+
+    assert first is second
+    assert other is not first
+
+
+def test_subscription_markup_follows_plan_registry():
+    from telegram_libs.plans import Plan, PlanRegistry
+    from telegram_libs.utils import get_subscription_markup
+
+    collection = MagicMock()
+    collection.find.return_value.sort.return_value = [
+        {"callback_data": "sub_1month", "payload": "1month_sub", "title": "1 Month Subscription",
+         "description": "Premium", "price": 500, "duration": 30},
+        {"callback_data": "sub_6months", "payload": "6months_sub", "title": "Half a Year",
+         "description": "Premium", "price": 2000, "duration": 180},
+    ]
+    registry = PlanRegistry(plans=(Plan("sub_1year", "1year_sub", "1 Year", "Premium", 3600, 365),), collection=collection)
+    before = get_subscription_markup("en", registry)
+    assert [button.callback_data for row in before.inline_keyboard for button in row] == ["sub_1year"]
+
+    registry.refresh()
+
+    after = get_subscription_markup("en", registry)
+    assert [[button.text for button in row] for row in after.inline_keyboard] == [
+        ["1 Month - 500 Stars", "Half a Year - 2000 Stars"]
+    ]
+    # Buttons of the removed plan still reach subscription_callback, which rejects them
+    assert registry.is_plan_callback("sub_1year")
+    assert registry.is_plan_callback("sub_6months")
+    assert not registry.is_plan_callback("more")
+
+
+def test_subscription_markup_cache_cleared_on_reload(monkeypatch):
+    from telegram_libs import translation
+    from telegram_libs.utils import get_subscription_markup
+
+    # Restores the catalogs reload_translations replaces once the test ends
+    monkeypatch.setattr(translation, "TRANSLATIONS", translation.TRANSLATIONS)
+    monkeypatch.setattr(translation, "COMMON_TRANSLATIONS", translation.COMMON_TRANSLATIONS)
+    before = get_subscription_markup("en")
+    with patch.object(translation, "load_translations", return_value={}), \
+         patch.object(translation, "load_common_translations", return_value=translation.COMMON_TRANSLATIONS):
+        translation.reload_translations()
+
+    after = get_subscription_markup("en")
+    assert after is not before
+    assert after == before
+    assert translation.TRANSLATIONS == {}
+
 @pytest.mark.asyncio
 async def test_more_bots_list_command(mock_update):
     from telegram_libs.utils import more_bots_list_command
@@ -195,7 +251,10 @@ def test_register_common_handlers(mock_application):
         mock_bot_logger_instance = MockBotLogger.return_value
         register_common_handlers(mock_application, "TestBot", mock_mongo_manager)
         
-        calls = mock_application.add_handler.call_args_list
+        calls = [
+            c for c in mock_application.add_handler.call_args_list
+            if isinstance(c.args[0], CommandHandler)
+        ]
         assert len(calls) == 1
         assert isinstance(calls[0].args[0], CommandHandler)
         assert "more" in calls[0].args[0].commands
@@ -214,7 +273,7 @@ def test_register_common_handlers(mock_application):
         assert call_args[0].keywords == {'bot_logger': mock_bot_logger_instance, 'bot_name': "TestBot"}
 
         mock_register_support_handlers.assert_called_once_with(mock_application, "TestBot", mock_bot_logger_instance)
-        mock_register_subscription_handlers.assert_called_once_with(mock_application, mock_mongo_manager, mock_bot_logger_instance)
+        mock_register_subscription_handlers.assert_called_once_with(mock_application, mock_mongo_manager, mock_bot_logger_instance, None, None)
 
 @pytest.mark.asyncio
 async def test_support_filter_true(mock_update):
@@ -464,5 +523,5 @@ class TestRateLimitManager:
                 call(t("subscription.choose_plan", lang_code, common=True), reply_markup=ANY)
             ]
             mock_update.message.reply_text.assert_has_calls(expected_calls)
-            mock_get_subscription_keyboard.assert_called_once_with(mock_update, lang_code)
-            assert result is False
\ No newline at end of file
+            mock_get_subscription_keyboard.assert_called_once_with(mock_update, lang_code, rate_limit_manager.plan_registry)
+            assert result is False
@@ -0,0 +1,123 @@
+import os
+
+os.environ["MONGO_URI"] = "mongodb://localhost:27017"
+os.environ["SUBSCRIPTION_DB_NAME"] = "subscription_db"
+
+import multiprocessing
+import queue
+import pytest
+from telegram import Update
+from telegram.ext import Application, MessageHandler, filters
+from telegram_libs.testing import FakeTelegramRequest
+from telegram_libs.webhook import WebhookServer, get_worker_index, process_worker_updates
+
+
+def make_update_data(update_id, user_id, text="hi"):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "User"},
+            "text": text,
+        },
+    }
+
+
+def build_app(handle):
+    app = Application.builder().token("1:fake").request(FakeTelegramRequest()).build()
+    app.add_handler(MessageHandler(filters.TEXT, handle))
+    return app
+
+
+def test_worker_index_is_stable_per_user():
+    first = Update.de_json(make_update_data(1, 42), None)
+    second = Update.de_json(make_update_data(2, 42), None)
+    other = Update.de_json(make_update_data(3, 43), None)
+
+    assert get_worker_index(first, 4) == get_worker_index(second, 4) == 42 % 4
+    assert get_worker_index(other, 4) == 43 % 4
+
+
+@pytest.mark.asyncio
+async def test_worker_processes_updates_in_order():
+    received = []
+
+    async def handle(update, context):
+        received.append(update.message.text)
+
+    updates = queue.Queue()
+    for i, text in enumerate(["a", "b", "c"], start=1):
+        updates.put(make_update_data(i, 42, text))
+    updates.put(None)
+
+    await process_worker_updates(build_app(handle), updates)
+
+    assert received == ["a", "b", "c"]
+
+
+@pytest.mark.asyncio
+async def test_worker_survives_crashing_update(caplog):
+    received = []
+
+    async def handle(update, context):
+        received.append(update.message.text)
+
+    updates = queue.Queue()
+    updates.put(make_update_data(1, 42, "a"))
+    # Fails to decode outside the application's error handling
+    updates.put({"update_id": 2, "message": {"message_id": 2}})
+    updates.put(make_update_data(3, 42, "c"))
+    updates.put(None)
+
+    await process_worker_updates(build_app(handle), updates)
+
+    assert received == ["a", "c"]
+    assert "Worker dropped an update" in caplog.text
+
+
+def test_updates_dispatched_to_forked_workers():
+    results = multiprocessing.get_context("fork").Queue()
+
+    async def handle(update, context):
+        results.put((os.getpid(), update.effective_user.id, update.message.text))
+
+    server = WebhookServer("1:fake", lambda: build_app(handle), workers=2)
+    server.start_workers()
+    try:
+        for i in range(6):
+            server.dispatch(Update.de_json(make_update_data(i, 10 + i % 2, str(i)), None))
+    finally:
+        server.stop_workers(timeout=10)
+
+    received = [results.get(timeout=5) for _ in range(6)]
+    pids = {user_id: {pid for pid, uid, _ in received if uid == user_id} for user_id in (10, 11)}
+    assert all(len(worker_pids) == 1 for worker_pids in pids.values())
+    assert pids[10] != pids[11]
+    assert [text for _, uid, text in received if uid == 10] == ["0", "2", "4"]
+    assert all(process.exitcode == 0 for process in server.processes)
+
+
+def test_dead_worker_is_restarted(caplog):
+    results = multiprocessing.get_context("fork").Queue()
+
+    async def handle(update, context):
+        results.put((os.getpid(), update.message.text))
+
+    server = WebhookServer("1:fake", lambda: build_app(handle), workers=2)
+    server.start_workers()
+    try:
+        dead = server.processes[1]
+        dead.kill()
+        dead.join(5)
+
+        server.dispatch(Update.de_json(make_update_data(1, 11, "after crash"), None))
+        pid, text = results.get(timeout=5)
+    finally:
+        server.stop_workers(timeout=10)
+
+    assert text == "after crash"
+    assert pid == server.processes[1].pid != dead.pid
+    assert f"Worker 1 (pid {dead.pid}) exited with code {dead.exitcode}, restarting it" in caplog.text
+    assert all(process.exitcode == 0 for process in server.processes)